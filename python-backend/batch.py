@@ -0,0 +1,216 @@
+import json
+import os
+import shutil
+import threading
+import time
+import traceback
+import zipfile
+from concurrent.futures import CancelledError, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import compress
+import converters
+import pdf_ops
+from engines import get_engine
+from zipstream import ZipSink, write_file_entry
+
+BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', os.cpu_count() or 2))
+BATCH_MAX_FILES = int(os.getenv('BATCH_MAX_FILES', 500))
+
+
+def _op_compress(src, dst, params):
+    # Batch files already fill the pool; a nested offload pool would oversubscribe it
+    compress.compress_pdf(src, dst, params.get('profile') or 'lossless', parallel=False)
+
+
+def _op_watermark(src, dst, params):
+    pdf_ops.watermark_pdf_file(
+        src, dst, params.get('text') or 'CONFIDENTIAL',
+        opacity=params.get('opacity', 1.0),
+        angle=params.get('angle', 45),
+        font_size=params.get('font_size', 48)
+    )
+
+
+def _op_rotate(src, dst, params):
+    rotation = pdf_ops.parse_rotation(params.get('rotation'))
+    get_engine('rotate', params.get('engine')).rotate(src, dst, rotation, params.get('pages', ''))
+
+
+def _op_unlock(src, dst, params):
+    get_engine('unlock', params.get('engine')).unlock(src, dst, params.get('password', ''))
+
+
+def _op_extract_text(src, dst, params):
+    text, _ = get_engine('extract_text', params.get('engine')).extract_text(src)
+    with open(dst, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+def _op_info(src, dst, params):
+    with open(dst, 'w', encoding='utf-8') as f:
+        json.dump(get_engine('info', params.get('engine')).info(src), f)
+
+
+def _op_to_word(src, dst, params):
+    # Batch files already fill the pool; chunking each one as well would oversubscribe it
+    converters.convert_pdf_to_word(src, dst, parallel=False)
+
+
+def _op_to_excel(src, dst, params):
+    # Batch files already fill the pool; a nested offload pool would oversubscribe it
+    converters.convert_pdf_to_excel(src, dst, pages=params.get('pages', ''), parallel=False)
+
+
+# operation name -> (function, output extension, needs PyMuPDF)
+BATCH_OPERATIONS = {
+    'compress': (_op_compress, '.pdf', True),
+    'watermark': (_op_watermark, '.pdf', True),
+    'rotate': (_op_rotate, '.pdf', False),
+    'unlock': (_op_unlock, '.pdf', False),
+    'extract-text': (_op_extract_text, '.txt', False),
+    'info': (_op_info, '.json', False),
+    'to-word': (_op_to_word, '.docx', False),
+    'to-excel': (_op_to_excel, '.xlsx', True),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=BATCH_WORKERS)
+        return _executor
+
+
+def _forget_executor():
+    # A forked child inherits the executor object but not its manager thread
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_executor)
+
+
+def _reset_executor(broken):
+    """Drop a broken executor so the next submit starts a fresh one.
+
+    Every future of a crashed pool reports BrokenProcessPool, so this runs
+    once per future; only the first call may act, or a later one would shut
+    down the pool a concurrent batch has already replaced it with.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is not broken:
+            return
+        _executor.shutdown(wait=False)
+        _executor = None
+
+
+def _submit(executor, *args):
+    """(executor, future) for run_batch_item(*args), on a fresh executor if this one is broken"""
+    try:
+        return executor, executor.submit(run_batch_item, *args)
+    except RuntimeError:
+        # BrokenProcessPool, or shut down by a concurrent batch's reset; retry once
+        _reset_executor(executor)
+        executor = _get_executor()
+        return executor, executor.submit(run_batch_item, *args)
+
+
+def output_name(index, filename, operation):
+    stem = os.path.splitext(os.path.basename(filename))[0] or 'document'
+    return f"{index:04d}_{stem}{BATCH_OPERATIONS[operation][1]}"
+
+
+def run_batch_item(operation, index, filename, input_path, output_path, params):
+    """Run one operation on one file; never raises so one bad file can't sink the batch"""
+    entry = {
+        "index": index,
+        "filename": filename,
+        "status": "ok",
+        "output": os.path.basename(output_path),
+        "error": None,
+    }
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        BATCH_OPERATIONS[operation][0](input_path, output_path, params)
+        entry["size"] = os.path.getsize(output_path)
+    except Exception as e:
+        traceback.print_exc()
+        entry.update(status="error", output=None, error=f"{type(e).__name__}: {e}")
+        try:
+            os.unlink(output_path)
+        except OSError:
+            pass
+    entry["seconds"] = round(time.perf_counter() - wall_start, 4)
+    entry["cpu_seconds"] = round(time.process_time() - cpu_start, 4)
+    return entry
+
+
+def _failed_entry(index, filename, error):
+    return {
+        "index": index,
+        "filename": filename,
+        "status": "error",
+        "output": None,
+        "error": error,
+    }
+
+
+def stream_batch(operation, items, params, spool_dir):
+    """Process (filename, input_path) items in the pool and stream a ZIP of results.
+
+    items with input_path None were rejected up front and are only reported
+    in the manifest. Results are written as they finish; manifest.json,
+    ordered by input position, is the last entry.
+    """
+    manifest = []
+    futures = {}
+    executor = _get_executor()
+    for index, (filename, input_path) in enumerate(items, 1):
+        if input_path is None:
+            manifest.append(_failed_entry(index, filename, "Invalid file"))
+            continue
+        output_path = os.path.join(spool_dir, output_name(index, filename, operation))
+        executor, future = _submit(executor, operation, index, filename, input_path, output_path, params)
+        futures[future] = (index, filename, executor)
+
+    sink = ZipSink()
+    started = time.perf_counter()
+    try:
+        with zipfile.ZipFile(sink, 'w') as zf:
+            for future in as_completed(futures):
+                index, filename, executor = futures[future]
+                try:
+                    entry = future.result()
+                except BrokenProcessPool as e:
+                    entry = _failed_entry(index, filename, f"Worker crashed: {e}")
+                    _reset_executor(executor)
+                except CancelledError:
+                    entry = _failed_entry(index, filename, "Cancelled")
+                manifest.append(entry)
+                if entry["status"] == "ok":
+                    yield from write_file_entry(zf, sink, entry["output"], os.path.join(spool_dir, entry["output"]))
+
+            manifest.sort(key=lambda e: e["index"])
+            summary = {
+                "operation": operation,
+                "total": len(manifest),
+                "succeeded": sum(1 for e in manifest if e["status"] == "ok"),
+                "failed": sum(1 for e in manifest if e["status"] != "ok"),
+                "seconds": round(time.perf_counter() - started, 4),
+                "files": manifest,
+            }
+            zf.writestr('manifest.json', json.dumps(summary, indent=2), compress_type=zipfile.ZIP_DEFLATED)
+        yield sink.drain()
+        print(f"Batch {operation}: {summary['succeeded']}/{summary['total']} succeeded", flush=True)
+    finally:
+        for future in futures:
+            future.cancel()
+        shutil.rmtree(spool_dir, ignore_errors=True)
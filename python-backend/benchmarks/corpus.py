@@ -0,0 +1,200 @@
+"""Deterministic synthetic PDF corpus for the benchmark suite.
+
+Every input class is built with PyMuPDF from a fixed random seed, so two
+machines generating the corpus get the same documents (the encrypted file
+differs byte-wise only because AES uses random IVs). Run directly to
+(re)build it:
+
+    python -m benchmarks.corpus [directory] [--large-pages N]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+
+import fitz  # PyMuPDF
+
+# Bump when the generators change so stale corpora are rebuilt
+CORPUS_VERSION = 1
+SEED = 20240611
+ENCRYPTED_PASSWORD = 'bench'
+DEFAULT_LARGE_PAGES = 1200
+DEFAULT_CORPUS_DIR = os.path.join(tempfile.gettempdir(), 'pdf-bench-corpus')
+
+# Fixed dates keep metadata identical between runs
+_METADATA = {
+    'title': 'Benchmark corpus',
+    'author': 'pdf-bench',
+    'subject': 'Synthetic benchmark input',
+    'creator': 'benchmarks.corpus',
+    'producer': 'PyMuPDF',
+    'creationDate': "D:20240101000000Z",
+    'modDate': "D:20240101000000Z",
+}
+
+_WORDS = (
+    "income tax return assessment year section deduction rebate audit ledger "
+    "balance sheet invoice payment receipt schedule depreciation capital gains "
+    "interest dividend turnover expense provision liability asset notice "
+    "refund penalty appeal order filing compliance statement account total"
+).split()
+
+
+def _paragraph(rng, words):
+    text = ' '.join(rng.choice(_WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + '.'
+
+
+def _fill_text_page(page, rng):
+    """Heading and body paragraphs filling most of an A4 page"""
+    page.insert_text((72, 72), _paragraph(rng, 5).title(), fontsize=16)
+    body = '\n\n'.join(_paragraph(rng, rng.randint(40, 70)) for _ in range(6))
+    page.insert_textbox(fitz.Rect(72, 100, page.rect.width - 72, page.rect.height - 72), body, fontsize=10)
+
+
+def _draw_table(page, rng, top, rows, cols):
+    """Ruled grid of numbers with a header row; returns the bottom y coordinate"""
+    left, width = 60, page.rect.width - 120
+    col_w, row_h = width / cols, 18
+    shape = page.new_shape()
+    for r in range(rows + 1):
+        y = top + r * row_h
+        shape.draw_line((left, y), (left + width, y))
+    for c in range(cols + 1):
+        x = left + c * col_w
+        shape.draw_line((x, top), (x, top + rows * row_h))
+    shape.finish(color=(0, 0, 0), width=0.5)
+    shape.commit()
+    for r in range(rows):
+        for c in range(cols):
+            if r == 0:
+                cell = f"Column {c + 1}"
+            elif c == 0:
+                cell = rng.choice(_WORDS).title()
+            else:
+                cell = f"{rng.randint(0, 999999):,}"
+            page.insert_text((left + c * col_w + 4, top + r * row_h + 13), cell, fontsize=8)
+    return top + rows * row_h
+
+
+def build_text(path, pages=40, seed=SEED):
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for _ in range(pages):
+        _fill_text_page(doc.new_page(), rng)
+    _save(doc, path)
+
+
+def build_tables(path, pages=30, seed=SEED):
+    """Two or three ruled tables per page, the input to-excel is built for"""
+    rng = random.Random(seed + 1)
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        top = 60
+        for _ in range(rng.randint(2, 3)):
+            rows, cols = rng.randint(6, 12), rng.randint(4, 7)
+            top = _draw_table(page, rng, top, rows, cols) + 30
+    _save(doc, path)
+
+
+def build_scanned(path, pages=10, seed=SEED, dpi=150):
+    """Pages that are only a grayscale JPEG of rendered text, like a scanner produces"""
+    rng = random.Random(seed + 2)
+    source = fitz.open()
+    doc = fitz.open()
+    for _ in range(pages):
+        src_page = source.new_page()
+        _fill_text_page(src_page, rng)
+        pix = src_page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+        page = doc.new_page(width=src_page.rect.width, height=src_page.rect.height)
+        page.insert_image(page.rect, stream=pix.tobytes('jpeg'))
+    source.close()
+    _save(doc, path)
+
+
+def build_encrypted(path, pages=20, seed=SEED):
+    """Text pages behind an AES-256 user password (ENCRYPTED_PASSWORD)"""
+    rng = random.Random(seed + 3)
+    doc = fitz.open()
+    for _ in range(pages):
+        _fill_text_page(doc.new_page(), rng)
+    _save(
+        doc, path,
+        encryption=fitz.PDF_ENCRYPT_AES_256,
+        user_pw=ENCRYPTED_PASSWORD,
+        owner_pw=ENCRYPTED_PASSWORD + '-owner',
+    )
+
+
+def build_large(path, pages=DEFAULT_LARGE_PAGES, seed=SEED):
+    """Long text document mixing in a table every tenth page"""
+    rng = random.Random(seed + 4)
+    doc = fitz.open()
+    for page_num in range(pages):
+        page = doc.new_page()
+        if page_num % 10 == 9:
+            _draw_table(page, rng, 60, 10, 5)
+        else:
+            _fill_text_page(page, rng)
+    _save(doc, path)
+
+
+def _save(doc, path, **kwargs):
+    doc.set_metadata(_METADATA)
+    doc.save(path, garbage=3, deflate=True, no_new_id=True, **kwargs)
+    doc.close()
+
+
+# input class -> builder; the file is <class>.pdf in the corpus directory
+BUILDERS = {
+    'text': build_text,
+    'tables': build_tables,
+    'scanned': build_scanned,
+    'encrypted': build_encrypted,
+    'large': build_large,
+}
+
+
+def ensure_corpus(directory=DEFAULT_CORPUS_DIR, large_pages=DEFAULT_LARGE_PAGES):
+    """Build the corpus unless an up-to-date one already exists; returns {class: path}"""
+    os.makedirs(directory, exist_ok=True)
+    manifest_path = os.path.join(directory, 'corpus.json')
+    wanted = {"version": CORPUS_VERSION, "seed": SEED, "large_pages": large_pages}
+    paths = {name: os.path.join(directory, f'{name}.pdf') for name in BUILDERS}
+
+    try:
+        with open(manifest_path) as f:
+            current = json.load(f)
+    except (OSError, ValueError):
+        current = None
+    if current and current.get('params') == wanted and all(os.path.exists(p) for p in paths.values()):
+        return paths
+
+    for name, builder in BUILDERS.items():
+        print(f"Building {name} corpus file...", flush=True)
+        if name == 'large':
+            builder(paths[name], pages=large_pages)
+        else:
+            builder(paths[name])
+
+    with open(manifest_path, 'w') as f:
+        json.dump({
+            "params": wanted,
+            "files": {name: os.path.getsize(path) for name, path in paths.items()},
+        }, f, indent=2)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the synthetic benchmark corpus")
+    parser.add_argument('directory', nargs='?', default=DEFAULT_CORPUS_DIR)
+    parser.add_argument('--large-pages', type=int, default=DEFAULT_LARGE_PAGES)
+    args = parser.parse_args()
+    for name, path in ensure_corpus(args.directory, args.large_pages).items():
+        print(f"{name}: {path} ({os.path.getsize(path)} bytes)", flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Local stand-in for the Gemini generateContent REST API.
+
+Run it and point the backend at it to exercise the whole OCR path, with
+concurrency, rate limiting and retries, without network access:
+
+    python -m benchmarks.fake_gemini --port 8765 --latency 0.5 --fail-every 5
+    OCR_API_BASE=http://127.0.0.1:8765 GEMINI_API_KEY=fake python main.py
+
+Every image gets back a line naming its size and hash. --fail-every N
+answers every Nth request with 429 and a Retry-After header.
+"""
+import argparse
+import base64
+import hashlib
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_handler(latency, fail_every, retry_after):
+    counter = itertools.count(1)
+    lock = threading.Lock()
+
+    class FakeGeminiHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _reply(self, status, payload, headers=None):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            if not self.path.endswith(':generateContent'):
+                return self._reply(404, {"error": {"code": 404, "message": f"Unknown path {self.path}"}})
+            if not self.headers.get('x-goog-api-key'):
+                return self._reply(400, {"error": {"code": 400, "message": "API key not valid"}})
+
+            with lock:
+                number = next(counter)
+            if fail_every and number % fail_every == 0:
+                return self._reply(
+                    429, {"error": {"code": 429, "message": "Resource has been exhausted"}},
+                    {'Retry-After': str(retry_after)}
+                )
+
+            time.sleep(latency)
+            lines = []
+            for part in request['contents'][0]['parts']:
+                if 'inline_data' in part:
+                    data = base64.b64decode(part['inline_data']['data'])
+                    lines.append(f"fake OCR of {len(data)} bytes {hashlib.sha256(data).hexdigest()[:12]}")
+            self._reply(200, {"candidates": [{"content": {"parts": [{"text": '\n'.join(lines)}]}}]})
+
+        def log_message(self, format, *args):
+            pass
+
+    return FakeGeminiHandler
+
+
+def serve(port=8765, latency=0.0, fail_every=0, retry_after=0.1):
+    """Start the fake server in a background thread and return it"""
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(latency, fail_every, retry_after))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds to wait before each answer")
+    parser.add_argument('--fail-every', type=int, default=0, help="answer every Nth request with 429")
+    parser.add_argument('--retry-after', type=float, default=0.1, help="Retry-After sent with 429s")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(
+        ('127.0.0.1', args.port), make_handler(args.latency, args.fail_every, args.retry_after)
+    )
+    print(f"Fake Gemini listening on http://127.0.0.1:{args.port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
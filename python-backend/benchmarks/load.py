@@ -0,0 +1,217 @@
+"""Latency of light endpoints while heavy conversions arrive in bursts.
+
+Starts gunicorn twice on the same port: once the way the Dockerfile used to
+run it (sync workers, heavy work in the request thread, no limits) and once
+with gunicorn.conf.py and the offload pool. In each run a set of clients
+keeps posting /api/pdf/to-word while others time /api/health and
+/api/pdf/info. Light latency percentiles and heavy status counts are printed
+per run and can be written as JSON.
+
+    python -m benchmarks.load --duration 30 --heavy-clients 8 --output load.json
+"""
+import argparse
+import http.client
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+from benchmarks.corpus import DEFAULT_CORPUS_DIR, DEFAULT_LARGE_PAGES, ensure_corpus
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# mode -> (extra gunicorn arguments, extra environment)
+MODES = {
+    'baseline': (['--worker-class', 'sync', '--threads', '1'], {'OFFLOAD_ENABLED': '0', 'GUNICORN_PRELOAD': '0', 'WORD_WORKERS': '0'}),
+    'offload': ([], {'OFFLOAD_ENABLED': '1'}),
+}
+
+
+def _multipart(fields, files):
+    """(body, content type) for a multipart/form-data request"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        )
+    for name, (filename, data) in files.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f'Content-Type: application/pdf\r\n\r\n'.encode() + data + b'\r\n'
+        )
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def _request(port, method, path, body=None, content_type=None, timeout=300):
+    """(status, seconds) of one request on a fresh connection"""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+    headers = {'Content-Type': content_type} if content_type else {}
+    started = time.perf_counter()
+    try:
+        conn.request(method, path, body=body, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        return response.status, time.perf_counter() - started
+    except (OSError, http.client.HTTPException):
+        return None, time.perf_counter() - started
+    finally:
+        conn.close()
+
+
+def _wait_ready(port, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with {process.returncode}")
+        if _request(port, 'GET', '/api/health', timeout=2)[0] == 200:
+            return
+        time.sleep(0.2)
+    raise RuntimeError("gunicorn did not become ready")
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_mode(mode, port, workers, duration, heavy_clients, light_clients, heavy_pdf, light_pdf):
+    args, env = MODES[mode]
+    env = {**os.environ, **env, 'RESULT_CACHE_ENABLED': '0', 'GUNICORN_WORKERS': str(workers)}
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}', '--workers', str(workers),
+         *args, 'main:app'],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        _wait_ready(port, process)
+        heavy_body = _multipart({}, {'file': ('heavy.pdf', heavy_pdf)})
+        light_body = _multipart({}, {'file': ('light.pdf', light_pdf)})
+
+        stop = threading.Event()
+        light = {'/api/health': [], '/api/pdf/info': []}
+        light_errors = []
+        heavy = []
+
+        def heavy_client():
+            while not stop.is_set():
+                status, seconds = _request(port, 'POST', '/api/pdf/to-word', *heavy_body)
+                heavy.append((status, seconds))
+                if status == 429:
+                    # Back off briefly like a client honouring Retry-After would
+                    time.sleep(0.5)
+
+        def light_client():
+            while not stop.is_set():
+                for path in light:
+                    if path == '/api/health':
+                        status, seconds = _request(port, 'GET', path, timeout=120)
+                    else:
+                        status, seconds = _request(port, 'POST', path, *light_body, timeout=120)
+                    if status == 200:
+                        light[path].append(seconds)
+                    else:
+                        light_errors.append(status)
+                time.sleep(0.05)
+
+        threads = [threading.Thread(target=heavy_client) for _ in range(heavy_clients)]
+        threads += [threading.Thread(target=light_client) for _ in range(light_clients)]
+        for thread in threads:
+            thread.start()
+        time.sleep(duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+    statuses = {}
+    for status, _ in heavy:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    completed = [seconds for status, seconds in heavy if status == 200]
+    return {
+        "light": {
+            path: {
+                "requests": len(times),
+                "p50": _round(_percentile(times, 0.5)),
+                "p95": _round(_percentile(times, 0.95)),
+                "p99": _round(_percentile(times, 0.99)),
+                "max": _round(max(times) if times else None),
+            }
+            for path, times in light.items()
+        },
+        "light_errors": len(light_errors),
+        "heavy": {
+            "statuses": statuses,
+            "completed_median": _round(statistics.median(completed) if completed else None),
+        },
+    }
+
+
+def _round(value):
+    return round(value, 4) if value is not None else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Light endpoint latency during bursts of heavy conversions")
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS_DIR, help="Corpus directory (built if missing)")
+    parser.add_argument('--modes', default=','.join(MODES), help="Comma-separated modes to run")
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--workers', type=int, default=2, help="gunicorn workers in every mode")
+    parser.add_argument('--duration', type=float, default=30, help="Seconds of load per mode")
+    parser.add_argument('--heavy-clients', type=int, default=8)
+    parser.add_argument('--light-clients', type=int, default=2)
+    parser.add_argument('--heavy-class', default='text', help="Corpus file converted to Word")
+    parser.add_argument('--output', help="Write results JSON here")
+    args = parser.parse_args()
+
+    modes = [m.strip() for m in args.modes.split(',') if m.strip()]
+    unknown = [m for m in modes if m not in MODES]
+    if unknown:
+        parser.error(f"Unknown mode: {', '.join(unknown)}")
+
+    corpus = ensure_corpus(args.corpus, DEFAULT_LARGE_PAGES)
+    with open(corpus[args.heavy_class], 'rb') as f:
+        heavy_pdf = f.read()
+    with open(corpus['text'], 'rb') as f:
+        light_pdf = f.read()
+
+    results = {}
+    for mode in modes:
+        print(f"{mode}: {args.duration:g}s with {args.heavy_clients} heavy and {args.light_clients} light clients...",
+              flush=True)
+        result = run_mode(
+            mode, args.port, args.workers, args.duration, args.heavy_clients, args.light_clients,
+            heavy_pdf, light_pdf
+        )
+        results[mode] = result
+        for path, latency in result['light'].items():
+            print(f"  {path}: {latency['requests']} requests, p50 {latency['p50']}s "
+                  f"p99 {latency['p99']}s max {latency['max']}s", flush=True)
+        print(f"  to-word statuses {result['heavy']['statuses']}, "
+              f"median completed {result['heavy']['completed_median']}s", flush=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                "created": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                "cpu_count": os.cpu_count(),
+                "workers": args.workers,
+                "duration": args.duration,
+                "heavy_clients": args.heavy_clients,
+                "light_clients": args.light_clients,
+                "results": results,
+            }, f, indent=2)
+        print(f"Results written to {args.output}", flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""Peak RSS of the server while merging about 1 GB of uploads.
+
+Builds an incompressible image-heavy PDF, starts gunicorn with one worker
+and streams enough copies of it to /api/pdf/merge to reach --total-mb,
+without holding the request body in memory on the client side. The merged
+file is read and discarded. The worker's peak RSS (VmHWM) must stay under
+--max-rss-mb, or the script exits 1, so memory staying bounded regardless
+of input size is checked rather than assumed.
+
+    python -m benchmarks.merge_memory --total-mb 1024 --max-rss-mb 256
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+from benchmarks.corpus import SEED
+from benchmarks.load import _wait_ready
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+READ_CHUNK = 1024 * 1024
+
+
+def build_input(path, pages, side=1024, seed=SEED):
+    """A PDF of `pages` random-noise RGB images, so its size is about pages * side² * 3 bytes"""
+    import fitz
+
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for _ in range(pages):
+        pix = fitz.Pixmap(fitz.csRGB, side, side, rng.randbytes(side * side * 3), False)
+        page = doc.new_page(width=612, height=612)
+        page.insert_image(page.rect, pixmap=pix)
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def _multipart_stream(path, copies):
+    """(chunk iterator, content length, content type) for `copies` uploads of one file as `files`"""
+    boundary = uuid.uuid4().hex
+    head = (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="files"; filename="part.pdf"\r\n'
+        f'Content-Type: application/pdf\r\n\r\n'
+    ).encode()
+    tail = f'--{boundary}--\r\n'.encode()
+    size = os.path.getsize(path)
+    length = copies * (len(head) + size + 2) + len(tail)
+
+    def chunks():
+        for _ in range(copies):
+            yield head
+            with open(path, 'rb') as f:
+                while True:
+                    data = f.read(READ_CHUNK)
+                    if not data:
+                        break
+                    yield data
+            yield b'\r\n'
+        yield tail
+
+    return chunks(), length, f'multipart/form-data; boundary={boundary}'
+
+
+def _worker_pid(master_pid):
+    with open(f'/proc/{master_pid}/task/{master_pid}/children') as f:
+        children = f.read().split()
+    if not children:
+        raise RuntimeError("gunicorn has no worker")
+    return int(children[0])
+
+
+def _memory_mb(pid, field):
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith(f'{field}:'):
+                return round(int(line.split()[1]) / 1024, 1)
+    return None
+
+
+def run(input_path, copies, port):
+    input_bytes = os.path.getsize(input_path) * copies
+    env = {
+        **os.environ,
+        'RESULT_CACHE_ENABLED': '0',
+        'GUNICORN_WORKERS': '1',
+        # The merge endpoint's default limit is 500 MB
+        'UPLOAD_MAX_BYTES_MERGE_PDFS': str(input_bytes * 2),
+    }
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}', '--workers', '1', '--timeout', '0',
+         'main:app'],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        _wait_ready(port, process)
+        worker = _worker_pid(process.pid)
+        idle_mb = _memory_mb(worker, 'VmRSS')
+
+        body, length, content_type = _multipart_stream(input_path, copies)
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=3600)
+        started = time.perf_counter()
+        conn.request('POST', '/api/pdf/merge', body=body,
+                     headers={'Content-Type': content_type, 'Content-Length': str(length)})
+        response = conn.getresponse()
+        output_bytes = 0
+        while True:
+            data = response.read(READ_CHUNK)
+            if not data:
+                break
+            output_bytes += len(data)
+        seconds = time.perf_counter() - started
+        conn.close()
+        peak_mb = _memory_mb(worker, 'VmHWM')
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+    return {
+        "status": response.status,
+        "files": copies,
+        "input_mb": round(input_bytes / (1024 * 1024), 1),
+        "output_mb": round(output_bytes / (1024 * 1024), 1),
+        "seconds": round(seconds, 2),
+        "worker_idle_rss_mb": idle_mb,
+        "worker_peak_rss_mb": peak_mb,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak server RSS while merging about 1 GB of uploads")
+    parser.add_argument('--total-mb', type=int, default=1024, help="Total upload size")
+    parser.add_argument('--file-mb', type=int, default=48, help="Approximate size of each uploaded file")
+    parser.add_argument('--max-rss-mb', type=float, default=256, help="Fail if the worker's peak RSS exceeds this")
+    parser.add_argument('--port', type=int, default=5057)
+    parser.add_argument('--output', help="Write results JSON here")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='bench-merge-') as work_dir:
+        # Each noise page is 3 MB
+        input_path = build_input(os.path.join(work_dir, 'part.pdf'), max(1, args.file_mb // 3))
+        copies = max(2, -(-args.total_mb * 1024 * 1024 // os.path.getsize(input_path)))
+        print(f"Merging {copies} files of {os.path.getsize(input_path) / (1024 * 1024):.1f} MB...", flush=True)
+        result = run(input_path, copies, args.port)
+
+    result["max_rss_mb"] = args.max_rss_mb
+    print(f"{result['status']} in {result['seconds']}s: {result['input_mb']} MB in, {result['output_mb']} MB out, "
+          f"worker RSS {result['worker_idle_rss_mb']} MB idle, {result['worker_peak_rss_mb']} MB peak", flush=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"Results written to {args.output}", flush=True)
+
+    if result["status"] != 200:
+        print("FAILED: merge did not succeed", flush=True)
+        sys.exit(1)
+    if result["worker_peak_rss_mb"] is None or result["worker_peak_rss_mb"] > args.max_rss_mb:
+        print(f"FAILED: peak RSS above {args.max_rss_mb} MB", flush=True)
+        sys.exit(1)
+    print("Peak RSS stayed bounded", flush=True)
+
+
+if __name__ == '__main__':
+    main()
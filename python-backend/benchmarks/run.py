@@ -0,0 +1,227 @@
+"""Benchmark every endpoint against the synthetic corpus.
+
+Each (endpoint, input class) case runs in a fresh spawned process that
+imports the app and drives it through the Flask test client, so peak RSS
+is per case and not polluted by earlier cases. Results are written as JSON;
+pass --compare with an earlier results file to flag regressions.
+
+    python -m benchmarks.run --output bench.json
+    python -m benchmarks.run --compare baseline.json --output bench.json
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.corpus import DEFAULT_CORPUS_DIR, DEFAULT_LARGE_PAGES, ENCRYPTED_PASSWORD, ensure_corpus
+
+RESULTS_VERSION = 1
+
+# endpoint name -> (url, number of copies of the input to upload, form fields)
+ENDPOINTS = {
+    'merge': ('/api/pdf/merge', 2, {}),
+    'split': ('/api/pdf/split', 1, {'every': '1'}),
+    'unlock': ('/api/pdf/unlock', 1, {'password': ENCRYPTED_PASSWORD}),
+    'to-excel': ('/api/pdf/to-excel', 1, {}),
+    'to-word': ('/api/pdf/to-word', 1, {}),
+    'compress': ('/api/pdf/compress', 1, {}),
+    'extract-text': ('/api/pdf/extract-text', 1, {}),
+    'info': ('/api/pdf/info', 1, {}),
+    'add-watermark': ('/api/pdf/add-watermark', 1, {'text': 'CONFIDENTIAL'}),
+    'rotate': ('/api/pdf/rotate', 1, {'rotation': '90'}),
+    'rotate-page': ('/api/pdf/rotate', 1, {'pages': '1:180'}),
+    'metadata': ('/api/pdf/metadata', 1, {'title': 'Benchmark'}),
+    'extract-images': ('/api/pdf/extract-images', 1, {}),
+    'batch': ('/api/pdf/batch', 4, {'operation': 'compress'}),
+}
+
+# /api/ocr/gemini is left out: it calls a remote API and would measure the network
+
+
+def _cpu_seconds(who):
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _max_rss_mb(who):
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return round(resource.getrusage(who).ru_maxrss * scale / (1024 * 1024), 1)
+
+
+def _shutdown_pools():
+    """Stop the backend's process pools so their CPU and RSS show up in RUSAGE_CHILDREN"""
+    for module in list(sys.modules.values()):
+        for value in list(getattr(module, '__dict__', {}).values()):
+            if isinstance(value, ProcessPoolExecutor):
+                value.shutdown(wait=True)
+
+
+def _run_case(endpoint, input_path, repeat):
+    """Child process: time `repeat` requests of one case and return its measurements"""
+    # Measure the work, not the result cache or leftovers from other runs
+    os.environ['RESULT_CACHE_ENABLED'] = '0'
+    os.environ.setdefault('JOBS_DIR', tempfile.mkdtemp(prefix='bench-jobs-'))
+
+    import main
+    client = main.app.test_client()
+
+    url, copies, fields = ENDPOINTS[endpoint]
+    field = 'files' if copies > 1 else 'file'
+    with open(input_path, 'rb') as f:
+        payload = f.read()
+    filename = os.path.basename(input_path)
+
+    walls = []
+    status = output_bytes = None
+    cpu_start = _cpu_seconds(resource.RUSAGE_SELF) + _cpu_seconds(resource.RUSAGE_CHILDREN)
+    for _ in range(repeat):
+        data = dict(fields)
+        data[field] = [(io.BytesIO(payload), filename) for _ in range(copies)]
+        started = time.perf_counter()
+        response = client.post(url, data=data, content_type='multipart/form-data')
+        # Streamed bodies do their work while being read, so read inside the timing
+        output_bytes = len(response.get_data())
+        response.close()
+        walls.append(time.perf_counter() - started)
+        status = response.status_code
+
+    _shutdown_pools()
+    cpu = _cpu_seconds(resource.RUSAGE_SELF) + _cpu_seconds(resource.RUSAGE_CHILDREN) - cpu_start
+    return {
+        "status": status,
+        "wall_seconds": round(statistics.median(walls), 4),
+        "wall_seconds_all": [round(w, 4) for w in walls],
+        "cpu_seconds": round(cpu / repeat, 4),
+        "peak_rss_mb": _max_rss_mb(resource.RUSAGE_SELF),
+        "children_peak_rss_mb": _max_rss_mb(resource.RUSAGE_CHILDREN),
+        "input_bytes": len(payload) * copies,
+        "output_bytes": output_bytes,
+    }
+
+
+def run_case(endpoint, input_path, repeat):
+    """Run one case in a fresh spawned process"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        try:
+            return executor.submit(_run_case, endpoint, input_path, repeat).result()
+        except Exception as e:
+            traceback.print_exc()
+            return {"status": None, "error": f"{type(e).__name__}: {e}"}
+
+
+def run_suite(corpus, endpoints, classes, repeat):
+    results = {}
+    for endpoint in endpoints:
+        for input_class in classes:
+            key = f"{endpoint}/{input_class}"
+            print(f"{key}...", end=' ', flush=True)
+            result = run_case(endpoint, corpus[input_class], repeat)
+            results[key] = result
+            if result.get('error'):
+                print(f"error: {result['error']}", flush=True)
+            else:
+                print(
+                    f"{result['status']} {result['wall_seconds']:.3f}s wall "
+                    f"{result['cpu_seconds']:.3f}s cpu {result['peak_rss_mb']}MB rss "
+                    f"{result['output_bytes']} bytes",
+                    flush=True
+                )
+    return results
+
+
+def environment():
+    try:
+        import fitz
+        pymupdf_version = fitz.VersionBind
+    except ImportError:
+        pymupdf_version = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "pymupdf": pymupdf_version,
+    }
+
+
+def compare(baseline, current, threshold, min_seconds):
+    """Cases whose wall time, CPU time or peak RSS grew by more than threshold.
+
+    Time regressions smaller than min_seconds in absolute terms are ignored,
+    so sub-millisecond endpoints don't flag on noise.
+    """
+    regressions = []
+    for key, new in current["results"].items():
+        old = baseline["results"].get(key)
+        if not old or old.get('error'):
+            continue
+        if new.get('error'):
+            regressions.append((key, 'error', None, new['error']))
+            continue
+        if old["status"] != new["status"]:
+            regressions.append((key, 'status', old["status"], new["status"]))
+        for metric, floor in (('wall_seconds', min_seconds), ('cpu_seconds', min_seconds), ('peak_rss_mb', 0)):
+            before, after = old[metric], new[metric]
+            if after > before * (1 + threshold) and after - before > floor:
+                regressions.append((key, metric, before, after))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the PDF API endpoints")
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS_DIR, help="Corpus directory (built if missing)")
+    parser.add_argument('--large-pages', type=int, default=DEFAULT_LARGE_PAGES)
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS), help="Comma-separated endpoint names")
+    parser.add_argument('--classes', default='', help="Comma-separated input classes (default: all)")
+    parser.add_argument('--repeat', type=int, default=3, help="Requests per case; wall time is the median")
+    parser.add_argument('--output', help="Write results JSON here")
+    parser.add_argument('--compare', help="Baseline results JSON to check for regressions")
+    parser.add_argument('--threshold', type=float, default=0.2, help="Allowed relative slowdown (0.2 = 20%%)")
+    parser.add_argument('--min-seconds', type=float, default=0.05, help="Ignore time regressions below this")
+    args = parser.parse_args()
+
+    corpus = ensure_corpus(args.corpus, args.large_pages)
+    endpoints = [e.strip() for e in args.endpoints.split(',') if e.strip()]
+    classes = [c.strip() for c in args.classes.split(',') if c.strip()] or list(corpus)
+    unknown = [e for e in endpoints if e not in ENDPOINTS] + [c for c in classes if c not in corpus]
+    if unknown:
+        parser.error(f"Unknown endpoint or input class: {', '.join(unknown)}")
+
+    current = {
+        "version": RESULTS_VERSION,
+        "created": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        "environment": environment(),
+        "repeat": args.repeat,
+        "large_pages": args.large_pages,
+        "results": run_suite(corpus, endpoints, classes, args.repeat),
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2)
+        print(f"Results written to {args.output}", flush=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('environment') != current['environment']:
+            print("Warning: baseline was recorded in a different environment", flush=True)
+        regressions = compare(baseline, current, args.threshold, args.min_seconds)
+        for key, metric, before, after in regressions:
+            print(f"REGRESSION {key} {metric}: {before} -> {after}", flush=True)
+        if regressions:
+            sys.exit(1)
+        print("No regressions against baseline", flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""Cold start cost: import time per module and time to the first responses.
+
+Three measurements, each in fresh processes:
+
+* import: `python -X importtime` of the app and of the dependencies it
+  loads lazily, reporting the cumulative time of every top-level import
+* in-process: import main, then the first /api/health and the first
+  /api/pdf/info through the Flask test client, with and without the
+  lazy modules preloaded first (as the gunicorn master does)
+* gunicorn: from spawning gunicorn to the first /api/health and
+  /api/pdf/info answers over HTTP
+
+    python -m benchmarks.startup --output startup.json
+"""
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+
+# benchmarks.corpus and benchmarks.load import PyMuPDF, so they are imported
+# inside the functions that need them; a --child must start without it
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Loaded on first use by the app
+LAZY_MODULES = ('fitz', 'PyPDF2', 'pdf2docx', 'numpy', 'openpyxl')
+# What gunicorn.conf.py preloads in the master by default
+PRELOADED_MODULES = ('fitz', 'PyPDF2')
+
+
+def import_times():
+    """{top-level module: cumulative import seconds} for main and each lazy dependency"""
+    statement = '; '.join(f'import {name}' for name in ('main', *LAZY_MODULES))
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', statement],
+        cwd=BACKEND_DIR, capture_output=True, text=True
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Nested imports are indented under the module that triggered them
+        if name.startswith('  ', 1):
+            continue
+        times[name.strip()] = round(int(cumulative) / 1e6, 4)
+    return dict(sorted(times.items(), key=lambda item: item[1], reverse=True))
+
+
+def _first_requests(pdf_path, preload):
+    """Child process: seconds to import main and answer the first light and PDF requests"""
+    started = time.perf_counter()
+    import main
+    imported = time.perf_counter()
+    preloaded = imported
+    if preload:
+        from lazy_imports import preload as preload_modules
+        preload_modules(PRELOADED_MODULES)
+        preloaded = time.perf_counter()
+
+    client = main.app.test_client()
+    client.get('/api/health').close()
+    health = time.perf_counter()
+    with open(pdf_path, 'rb') as f:
+        response = client.post('/api/pdf/info', data={'file': (io.BytesIO(f.read()), 'text.pdf')})
+    status = response.status_code
+    response.close()
+    pdf = time.perf_counter()
+    return {
+        "import_main": round(imported - started, 4),
+        "preload": round(preloaded - imported, 4),
+        "first_health": round(health - preloaded, 4),
+        "first_pdf_info": round(pdf - health, 4),
+        "pdf_info_status": status,
+    }
+
+
+def in_process(pdf_path, preload):
+    result = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.startup', '--child', pdf_path] + (['--preload'] if preload else []),
+        cwd=BACKEND_DIR, capture_output=True, text=True, env={**os.environ, 'RESULT_CACHE_ENABLED': '0'}
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def gunicorn_first_response(pdf_path, port, timeout=60):
+    """Seconds from spawning gunicorn to its first /api/health and /api/pdf/info answers"""
+    from benchmarks.load import _multipart, _request
+
+    env = {**os.environ, 'RESULT_CACHE_ENABLED': '0'}
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}', 'main:app'],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        deadline = started + timeout
+        while _request(port, 'GET', '/api/health', timeout=2)[0] != 200:
+            if process.poll() is not None or time.perf_counter() > deadline:
+                raise RuntimeError("gunicorn did not become ready")
+            time.sleep(0.01)
+        health = time.perf_counter()
+        with open(pdf_path, 'rb') as f:
+            status, _ = _request(port, 'POST', '/api/pdf/info', *_multipart({}, {'file': ('text.pdf', f.read())}))
+        pdf = time.perf_counter()
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+    return {
+        "first_health": round(health - started, 4),
+        "first_pdf_info": round(pdf - started, 4),
+        "pdf_info_status": status,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time per module and time to first request")
+    parser.add_argument('--corpus', help="Corpus directory (built if missing)")
+    parser.add_argument('--port', type=int, default=5056)
+    parser.add_argument('--no-gunicorn', action='store_true', help="Skip the gunicorn measurement")
+    parser.add_argument('--output', help="Write results JSON here")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--preload', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(_first_requests(args.child, args.preload)), flush=True)
+        return
+
+    from benchmarks.corpus import DEFAULT_CORPUS_DIR, DEFAULT_LARGE_PAGES, ensure_corpus
+    pdf_path = ensure_corpus(args.corpus or DEFAULT_CORPUS_DIR, DEFAULT_LARGE_PAGES)['text']
+    results = {"imports": import_times()}
+    print("Import time (cumulative):", flush=True)
+    for name, seconds in results["imports"].items():
+        if seconds >= 0.005:
+            print(f"  {name}: {seconds * 1000:.0f} ms", flush=True)
+
+    for label, preload in (('cold', False), ('preloaded', True)):
+        result = in_process(pdf_path, preload)
+        results[f"in_process_{label}"] = result
+        print(f"In-process, {label}: import main {result['import_main']:.3f}s, preload {result['preload']:.3f}s, "
+              f"first health {result['first_health']:.3f}s, first info {result['first_pdf_info']:.3f}s", flush=True)
+
+    if not args.no_gunicorn:
+        result = gunicorn_first_response(pdf_path, args.port)
+        results["gunicorn"] = result
+        print(f"gunicorn: first health after {result['first_health']:.3f}s, "
+              f"first info after {result['first_pdf_info']:.3f}s", flush=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}", flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+import os
+import shutil
+import time
+import zlib
+
+import offload
+from engines import open_pdf
+from lazy_imports import optional_module
+from pdf_ops import compress_pdf_file as save_lossless, is_colourful, midtone_fraction
+
+fitz, HAS_PYMUPDF = optional_module('fitz')  # PyMuPDF
+
+numpy, HAS_NUMPY = optional_module('numpy')
+
+# Groups the images are split into, run in the shared offload pool
+COMPRESS_WORKERS = int(os.getenv('COMPRESS_WORKERS', offload.OFFLOAD_WORKERS))
+# Below this many images to recompress the fork and IPC overhead outweighs parallel work
+COMPRESS_PARALLEL_MIN_IMAGES = int(os.getenv('COMPRESS_PARALLEL_MIN_IMAGES', 4))
+
+# name -> image settings; lossless only rewrites the file structure
+PROFILES = {
+    'lossless': None,
+    'screen': {"dpi": 72, "threshold_dpi": 108, "jpeg_quality": 50},
+    'ebook': {"dpi": 150, "threshold_dpi": 225, "jpeg_quality": 70},
+    'print': {"dpi": 300, "threshold_dpi": 450, "jpeg_quality": 85},
+}
+
+# Images with fewer mid-grey pixels than this are stored as 1-bit black and white
+BILEVEL_MAX_MIDTONES = 0.02
+# Keep the original stream unless the new one is at least this much smaller
+MIN_SAVING = 0.9
+
+def _placement_dpi(doc):
+    """xref -> lowest DPI the image is drawn at on any page, so its largest use keeps enough pixels.
+
+    Uses the page content only; get_image_info(xrefs=True) would hash every image.
+    """
+    dpi = {}
+    for page in doc:
+        for item in page.get_images(full=True):
+            xref, width, height = item[0], item[2], item[3]
+            try:
+                bbox = page.get_image_bbox(item)
+            except ValueError:
+                # Drawn inside a Form XObject; its size on the page is unknown
+                continue
+            if bbox.is_empty or bbox.is_infinite:
+                continue
+            shown_inches = max(bbox.width, bbox.height) / 72
+            image_dpi = max(width, height) / shown_inches
+            dpi[xref] = min(dpi.get(xref, image_dpi), image_dpi)
+    return dpi
+
+
+def _candidates(doc, settings):
+    """(xref, scale) for every image worth re-encoding under a profile"""
+    jobs = []
+    placement_dpi = _placement_dpi(doc)
+    seen = set()
+    for page in doc:
+        for xref, _, width, height, bpc, _, _, _, image_filter, _ in page.get_images(full=True):
+            if xref in seen or xref not in placement_dpi:
+                continue
+            seen.add(xref)
+            # Stencil masks and 1-bit images (CCITT, JBIG2) are already as small as they get
+            if bpc == 1 or doc.xref_get_key(xref, 'ImageMask')[1] == 'true':
+                continue
+            dpi = placement_dpi[xref]
+            scale = settings['dpi'] / dpi if dpi > settings['threshold_dpi'] else 1.0
+            if scale == 1.0 and image_filter == 'DCTDecode':
+                # Re-encoding a JPEG at full size only adds artefacts
+                continue
+            jobs.append((xref, scale))
+    return jobs
+
+
+def _pack_bilevel(gray_pix):
+    """1-bit rows, 0 = black, deflated; None without numpy"""
+    if not HAS_NUMPY:
+        return None
+    samples = numpy.frombuffer(gray_pix.samples, dtype=numpy.uint8).reshape(gray_pix.height, gray_pix.width)
+    return zlib.compress(numpy.packbits(samples >= 128, axis=1).tobytes(), 9)
+
+
+def _recompress(doc, xref, scale, settings):
+    """(stream, dictionary keys, mode) for a smaller copy of one image, or None to keep it"""
+    original_size = len(doc.xref_stream_raw(xref))
+    pix = fitz.Pixmap(doc, xref)
+    if pix.alpha:
+        pix = fitz.Pixmap(pix, 0)
+    if not pix.colorspace or pix.colorspace.n not in (1, 3, 4):
+        return None
+    if pix.colorspace.n == 4:
+        pix = fitz.Pixmap(fitz.csRGB, pix)
+    if scale < 1.0:
+        pix = fitz.Pixmap(pix, max(1, int(pix.width * scale)), max(1, int(pix.height * scale)))
+
+    colour = pix.n >= 3 and is_colourful(pix)
+    if pix.n >= 3 and not colour:
+        pix = fitz.Pixmap(fitz.csGRAY, pix)
+
+    keys = {"Width": str(pix.width), "Height": str(pix.height), "BitsPerComponent": "8"}
+    packed = None if colour else (_pack_bilevel(pix) if midtone_fraction(pix) <= BILEVEL_MAX_MIDTONES else None)
+    if packed is not None:
+        stream, mode = packed, 'bilevel'
+        keys.update({"Filter": "/FlateDecode", "ColorSpace": "/DeviceGray", "BitsPerComponent": "1"})
+    else:
+        stream, mode = pix.tobytes('jpg', jpg_quality=settings['jpeg_quality']), 'color' if colour else 'gray'
+        keys.update({"Filter": "/DCTDecode", "ColorSpace": "/DeviceRGB" if colour else "/DeviceGray"})
+
+    if len(stream) >= original_size * MIN_SAVING:
+        return None
+    return stream, keys, mode
+
+
+def _recompress_images(pdf_path, jobs, settings):
+    """Pool worker: open the source once and re-encode each (xref, scale); returns (xref, result, error)"""
+    results = []
+    with fitz.open(pdf_path) as doc:
+        for xref, scale in jobs:
+            try:
+                results.append((xref, _recompress(doc, xref, scale, settings), None))
+            except Exception as e:
+                # A broken image stays as it was
+                results.append((xref, None, str(e)))
+    return results
+
+
+def _replace_stream(doc, xref, stream, keys):
+    doc.update_stream(xref, stream, compress=False)
+    for key, value in keys.items():
+        doc.xref_set_key(xref, key, value)
+    # Decoding was applied when the pixels were read; a colour-key Mask no longer matches them
+    for key in ('DecodeParms', 'Decode'):
+        doc.xref_set_key(xref, key, 'null')
+    if doc.xref_get_key(xref, 'Mask')[0] == 'array':
+        doc.xref_set_key(xref, 'Mask', 'null')
+
+
+def compress_pdf(pdf_path, output_path, profile='lossless', parallel=True):
+    """Compress a PDF with a profile and return a report of sizes and stage timings.
+
+    Images drawn above the profile's threshold DPI are downsampled to its
+    target DPI and re-encoded as JPEG, greyscale JPEG or 1-bit Flate, in
+    parallel. Fonts are then subset and the file is saved with unused
+    objects dropped and streams deflated. If the result is no smaller than
+    the input, the input is written unchanged. Callers that are already
+    pool workers pass parallel=False to recompress in their own process.
+    """
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown compression profile: {profile}. Available profiles: {', '.join(PROFILES)}")
+    settings = PROFILES[profile]
+    original_size = os.path.getsize(pdf_path)
+    stages = {}
+    images = {"candidates": 0, "recompressed": 0, "downsampled": 0, "failed": 0, "modes": {}}
+
+    if settings is None:
+        # Refuse unreadable and password-protected files with EngineError up front
+        open_pdf(pdf_path).close()
+        started = time.perf_counter()
+        save_lossless(pdf_path, output_path)
+        stages["save"] = time.perf_counter() - started
+    else:
+        with open_pdf(pdf_path) as doc:
+            started = time.perf_counter()
+            jobs = _candidates(doc, settings)
+            images["candidates"] = len(jobs)
+            stages["analyse"] = time.perf_counter() - started
+
+            started = time.perf_counter()
+            if not parallel or len(jobs) < COMPRESS_PARALLEL_MIN_IMAGES or COMPRESS_WORKERS <= 1:
+                results = _recompress_images(pdf_path, jobs, settings)
+            else:
+                # Interleave so one worker doesn't get all the big images from one part of the file
+                groups = [jobs[i::COMPRESS_WORKERS] for i in range(COMPRESS_WORKERS) if jobs[i::COMPRESS_WORKERS]]
+                futures = [offload.submit(_recompress_images, pdf_path, group, settings) for group in groups]
+                results = [result for future in futures for result in future.result()]
+            scales = dict(jobs)
+            for xref, result, error in results:
+                if error:
+                    images["failed"] += 1
+                if not result:
+                    continue
+                stream, keys, mode = result
+                _replace_stream(doc, xref, stream, keys)
+                images["recompressed"] += 1
+                images["downsampled"] += scales[xref] < 1.0
+                images["modes"][mode] = images["modes"].get(mode, 0) + 1
+            stages["images"] = time.perf_counter() - started
+
+            started = time.perf_counter()
+            try:
+                doc.subset_fonts()
+            except Exception as e:
+                # subset_fonts needs fontTools and gives up on some embedded fonts
+                print(f"Font subsetting skipped: {e}", flush=True)
+            stages["fonts"] = time.perf_counter() - started
+
+            started = time.perf_counter()
+            doc.save(
+                output_path, garbage=4, deflate=True, deflate_images=True, deflate_fonts=True,
+                clean=True, use_objstms=1
+            )
+            stages["save"] = time.perf_counter() - started
+
+    final_size = os.path.getsize(output_path)
+    kept_original = final_size >= original_size
+    if kept_original:
+        shutil.copyfile(pdf_path, output_path)
+        final_size = original_size
+
+    return {
+        "profile": profile,
+        "original_bytes": original_size,
+        "final_bytes": final_size,
+        "saved_bytes": original_size - final_size,
+        "kept_original": kept_original,
+        "images": images,
+        "stages": {name: round(seconds, 4) for name, seconds in stages.items()},
+    }
@@ -0,0 +1,386 @@
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import as_completed
+
+import offload
+from engines import open_pdf
+from lazy_imports import optional_module
+from pdf_ops import select_pages
+
+# Brings in numpy and OpenCV; only PDF to Word needs it
+pdf2docx, HAS_PDF2DOCX = optional_module('pdf2docx')
+
+fitz, HAS_PYMUPDF = optional_module('fitz')  # PyMuPDF
+
+
+TABLE_CHUNK_PAGES = int(os.getenv('TABLE_CHUNK_PAGES', 8))
+# Chunks run in the shared offload pool; TABLE_WORKERS=1 extracts in the calling process
+TABLE_WORKERS = int(os.getenv('TABLE_WORKERS', offload.OFFLOAD_WORKERS))
+# PDF to Word parses pages in chunks of this size in the shared offload pool;
+# WORD_WORKERS=1 parses them in one task and 0 converts in the calling process
+WORD_CHUNK_PAGES = int(os.getenv('WORD_CHUNK_PAGES', 8))
+WORD_WORKERS = int(os.getenv('WORD_WORKERS', offload.OFFLOAD_WORKERS))
+
+# Streamed CSV/JSONL output is sent in pieces of roughly this size
+STREAM_FLUSH_BYTES = 64 * 1024
+
+class MissingDependencyError(RuntimeError):
+    """Raised when the libraries needed for a conversion are not installed"""
+
+
+def _noop_progress(done, total):
+    pass
+
+
+def count_pages(pdf_path):
+    """Page count used for job progress reporting"""
+    if HAS_PYMUPDF:
+        with open_pdf(pdf_path) as doc:
+            return len(doc)
+    import PyPDF2
+    with open(pdf_path, 'rb') as f:
+        return len(PyPDF2.PdfReader(f).pages)
+
+
+def _extract_page_tables(pdf_path, page_numbers):
+    """Pool worker: plain table rows and text for a chunk of pages.
+    
+    Only built-in types are returned so results pickle cheaply back to the
+    parent, which assembles the workbook.
+    """
+    results = []
+    with fitz.open(pdf_path) as doc:
+        for page_num in page_numbers:
+            page = doc[page_num]
+            tables = []
+            # Extract tables with proper structure
+            try:
+                for table in page.find_tables().tables:
+                    tables.append([
+                        # Clean up cell value
+                        [str(cell_value).strip() if cell_value else "" for cell_value in row_data]
+                        for row_data in table.extract()
+                    ])
+            except Exception as e:
+                print(f"Table extraction error on page {page_num + 1}: {str(e)}")
+            results.append((page_num, tables, page.get_text()))
+    return results
+
+
+def iter_page_tables(pdf_path, page_numbers, progress=None, parallel=True):
+    """Yield (page_num, tables, text) in page order as chunks finish.
+    
+    Chunks run in parallel in the shared offload pool; each is yielded as
+    soon as it and every chunk before it are done, so callers can stream
+    output. With parallel=False they run one after another in this process.
+    """
+    progress = progress or _noop_progress
+    total = len(page_numbers)
+    chunks = [page_numbers[i:i + TABLE_CHUNK_PAGES] for i in range(0, total, TABLE_CHUNK_PAGES)]
+
+    if not parallel or len(chunks) <= 1 or TABLE_WORKERS <= 1:
+        pending = (_extract_page_tables(pdf_path, chunk) for chunk in chunks)
+    else:
+        futures = [offload.submit(_extract_page_tables, pdf_path, chunk) for chunk in chunks]
+        pending = (future.result() for future in futures)
+
+    done = 0
+    for chunk_results in pending:
+        done += len(chunk_results)
+        progress(done, total)
+        yield from chunk_results
+
+
+def text_rows(text):
+    """Split page text into rows of columns on tabs or runs of 2+ spaces"""
+    rows = []
+    for line in text.split('\n'):
+        if line.strip():
+            # Split by tabs or multiple spaces to identify columns
+            if '\t' in line:
+                columns = line.split('\t')
+            else:
+                # Split by 2+ spaces
+                columns = [col.strip() for col in line.split('  ') if col.strip()]
+
+            # If no clear columns, use single column
+            if not columns or len(columns) == 1:
+                columns = [line.strip()]
+
+            rows.append(columns[:15])  # Max 15 columns
+    return rows
+
+
+def iter_extracted_rows(pdf_path, pages='', progress=None, parallel=True):
+    """Yield ('table', page_num, table_idx, row_idx, cells) for every table row.
+    
+    When the selected pages contain no tables at all, falls back to
+    ('text', page_num, None, row_idx, columns) rows split from the page text.
+    """
+    with open_pdf(pdf_path) as doc:
+        page_numbers = select_pages(pages, len(doc))
+
+    tables_found = False
+    page_texts = []
+    for page_num, tables, text in iter_page_tables(pdf_path, page_numbers, progress, parallel):
+        for table_idx, extracted_rows in enumerate(tables):
+            tables_found = True
+            for row_idx, row_data in enumerate(extracted_rows):
+                yield 'table', page_num, table_idx, row_idx, row_data
+        if not tables_found:
+            page_texts.append((page_num, text))
+
+    # If no tables found, extract text as structured data
+    if not tables_found:
+        for page_num, text in page_texts:
+            for row_idx, columns in enumerate(text_rows(text)):
+                yield 'text', page_num, None, row_idx, columns
+
+
+def _register_styles(wb):
+    """Shared named styles so cells reference one style record each"""
+    from openpyxl.styles import Alignment, Font, PatternFill, Border, Side, NamedStyle
+
+    thin_border = Border(
+        left=Side(style='thin'),
+        right=Side(style='thin'),
+        top=Side(style='thin'),
+        bottom=Side(style='thin')
+    )
+
+    table_cell = NamedStyle(name='table_cell')
+    table_cell.alignment = Alignment(wrap_text=True, vertical='top', horizontal='left')
+    table_cell.border = thin_border
+
+    # Format header row (usually first row)
+    table_header = NamedStyle(name='table_header')
+    table_header.alignment = Alignment(wrap_text=True, vertical='top', horizontal='left')
+    table_header.border = thin_border
+    table_header.font = Font(bold=True, color="FFFFFF")
+    table_header.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+
+    page_header = NamedStyle(name='page_header')
+    page_header.font = Font(bold=True, size=11)
+    page_header.fill = PatternFill(start_color="E8E8E8", end_color="E8E8E8", fill_type="solid")
+
+    text_cell = NamedStyle(name='text_cell')
+    text_cell.alignment = Alignment(wrap_text=True, vertical='top')
+    text_cell.border = thin_border
+
+    for style in (table_cell, table_header, page_header, text_cell):
+        wb.add_named_style(style)
+
+
+def convert_pdf_to_excel(pdf_path, output_path, progress=None, pages='', parallel=True):
+    """Extract tables from a PDF into an .xlsx workbook at output_path.
+    
+    Uses a write-only workbook: rows are streamed to the sheet as pages
+    finish and every cell points at one of a few shared named styles.
+    Callers that are already pool workers pass parallel=False.
+    """
+    if not HAS_PYMUPDF:
+        raise MissingDependencyError("PDF conversion requires PyMuPDF library")
+
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+
+    wb = Workbook(write_only=True)
+    _register_styles(wb)
+    ws = wb.create_sheet("Extracted Data")
+
+    # Column widths must be set before the first row in write-only mode
+    for col_idx in range(1, 16):
+        col_letter = chr(64 + col_idx)
+        ws.column_dimensions[col_letter].width = 30
+
+    def styled(value, style):
+        cell = WriteOnlyCell(ws, value=value)
+        cell.style = style
+        return cell
+
+    rows_written = 0
+    current_page = None
+    for kind, page_num, table_idx, row_idx, cells in iter_extracted_rows(pdf_path, pages, progress, parallel):
+        if kind == 'table':
+            if row_idx == 0:
+                if rows_written:
+                    ws.append([])  # Add space between tables
+                    rows_written += 1
+            style = 'table_header' if row_idx == 0 else 'table_cell'
+            ws.append([styled(value, style) for value in cells])
+        else:
+            if page_num != current_page:
+                # Add page header
+                if rows_written:
+                    ws.append([])
+                    rows_written += 1
+                ws.append([styled(f"Page {page_num + 1}", 'page_header')])
+                rows_written += 1
+                current_page = page_num
+            ws.append([styled(value, 'text_cell') for value in cells])
+        rows_written += 1
+
+    wb.save(output_path)
+
+
+def stream_extracted_rows(pdf_path, output_format, pages='', parallel=True):
+    """Yield CSV or JSON Lines text for extracted rows as pages finish"""
+    if not HAS_PYMUPDF:
+        raise MissingDependencyError("PDF conversion requires PyMuPDF library")
+
+    if output_format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(['page', 'table', 'row', 'cells'])
+        for kind, page_num, table_idx, row_idx, cells in iter_extracted_rows(pdf_path, pages, parallel=parallel):
+            writer.writerow([page_num + 1, '' if table_idx is None else table_idx + 1, row_idx + 1, *cells])
+            if buffer.tell() >= STREAM_FLUSH_BYTES:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    elif output_format == 'jsonl':
+        lines = []
+        size = 0
+        for kind, page_num, table_idx, row_idx, cells in iter_extracted_rows(pdf_path, pages, parallel=parallel):
+            line = json.dumps({
+                "source": kind,
+                "page": page_num + 1,
+                "table": None if table_idx is None else table_idx + 1,
+                "row": row_idx + 1,
+                "cells": cells,
+            }) + '\n'
+            lines.append(line)
+            size += len(line)
+            if size >= STREAM_FLUSH_BYTES:
+                yield ''.join(lines)
+                lines = []
+                size = 0
+        yield ''.join(lines)
+    else:
+        raise ValueError(f"Unsupported output format: {output_format}")
+
+
+def _parse_word_pages(pdf_path, page_numbers, layout_path):
+    """Pool worker: parse a chunk of pages with pdf2docx and store their layout as JSON"""
+    cv = pdf2docx.Converter(pdf_path)
+    try:
+        settings = cv.default_settings
+        cv.load_pages(pages=page_numbers).parse_document(**settings).parse_pages(**settings)
+        cv.serialize(layout_path)
+    finally:
+        cv.close()
+    return len(page_numbers)
+
+
+def _make_word_docx(pdf_path, page_numbers, layout_paths, output_path):
+    """Pool worker: write one .docx from the stored layouts of every chunk, in page order"""
+    cv = pdf2docx.Converter(pdf_path)
+    try:
+        settings = cv.default_settings
+        cv.load_pages(pages=page_numbers)
+        for layout_path in layout_paths:
+            cv.deserialize(layout_path)
+        cv.make_docx(output_path, **settings)
+    finally:
+        cv.close()
+
+
+def _convert_word_pages(pdf_path, page_numbers, output_path):
+    """Parse and write the pages in one go, for documents too short to split"""
+    cv = pdf2docx.Converter(pdf_path)
+    try:
+        cv.convert(output_path, pages=page_numbers)
+    finally:
+        cv.close()
+
+
+def _write_text_docx(pdf_path, page_numbers, output_path):
+    """PyMuPDF text + python-docx fallback: a heading and one paragraph per page"""
+    try:
+        from docx import Document
+        from docx.shared import Pt, RGBColor
+    except ImportError:
+        raise MissingDependencyError("PDF to Word requires python-docx library")
+
+    docx = Document()
+    with fitz.open(pdf_path) as doc:
+        for page_num in page_numbers:
+            # Add page number heading
+            heading = docx.add_heading(f'Page {page_num + 1}', level=2)
+            heading.runs[0].font.size = Pt(12)
+            heading.runs[0].font.color.rgb = RGBColor(0, 0, 128)
+
+            # Lines become breaks inside a single paragraph; one paragraph per
+            # line made python-docx rebuild the body for every line
+            lines = [line for line in doc[page_num].get_text().split('\n') if line.strip()]
+            if lines:
+                docx.add_paragraph('\n'.join(lines))
+    docx.save(output_path)
+
+
+def _run_word_task(parallel, fn, *args):
+    if not parallel or WORD_WORKERS <= 0:
+        return fn(*args)
+    return offload.submit(fn, *args).result()
+
+
+def word_engine():
+    """'pdf2docx' when it is installed and imports, else 'pymupdf' for the text fallback"""
+    return 'pdf2docx' if HAS_PDF2DOCX and pdf2docx.available() else 'pymupdf'
+
+
+def convert_pdf_to_word(pdf_path, output_path, progress=None, pages='', start=None, end=None, parallel=True):
+    """Convert a PDF, or the selected pages of it, into a .docx document at output_path.
+
+    pages is a spec like "1-5,8"; without one, 1-indexed start and end
+    bound the pages. With pdf2docx, documents longer than one chunk are
+    parsed in WORD_CHUNK_PAGES chunks across the shared offload pool, each
+    worker storing its chunk's layout as JSON, and one worker then writes
+    the .docx from all of them. The calling thread only waits. Callers that
+    are already one of many pool workers pass parallel=False to convert
+    in their own process.
+    """
+    progress = progress or _noop_progress
+
+    if not HAS_PDF2DOCX and not HAS_PYMUPDF:
+        raise MissingDependencyError("PDF conversion requires either pdf2docx or PyMuPDF library")
+
+    page_numbers = select_pages(pages, count_pages(pdf_path), start, end)
+    total_pages = len(page_numbers)
+    progress(0, total_pages)
+
+    # Fallback to PyMuPDF text extraction + python-docx, also when pdf2docx is installed but broken
+    if word_engine() != 'pdf2docx':
+        if not HAS_PYMUPDF:
+            raise MissingDependencyError("pdf2docx failed to import and PyMuPDF is not installed")
+        _run_word_task(parallel, _write_text_docx, pdf_path, page_numbers, output_path)
+        progress(total_pages, total_pages)
+        return
+
+    chunks = [page_numbers[i:i + WORD_CHUNK_PAGES] for i in range(0, total_pages, WORD_CHUNK_PAGES)]
+    if not parallel or len(chunks) <= 1 or WORD_WORKERS <= 1:
+        _run_word_task(parallel, _convert_word_pages, pdf_path, page_numbers, output_path)
+        progress(total_pages, total_pages)
+        return
+
+    # Layouts go in a private directory: pdf2docx's own multi_processing writes
+    # fixed names into the working directory and cannot take a page list
+    layout_dir = tempfile.mkdtemp(prefix='word-')
+    try:
+        layout_paths = [os.path.join(layout_dir, f'{idx:04d}.json') for idx in range(len(chunks))]
+        futures = [
+            offload.submit(_parse_word_pages, pdf_path, chunk, layout_path)
+            for chunk, layout_path in zip(chunks, layout_paths)
+        ]
+        done = 0
+        for future in as_completed(futures):
+            done += future.result()
+            progress(done, total_pages)
+        offload.submit(_make_word_docx, pdf_path, page_numbers, layout_paths, output_path).result()
+    finally:
+        shutil.rmtree(layout_dir, ignore_errors=True)
@@ -0,0 +1,361 @@
+import io
+import os
+
+from lazy_imports import LazyModule, optional_module
+from pdf_ops import PasswordRequiredError, parse_rotation_spec, save_edited, select_pages
+
+PyPDF2 = LazyModule('PyPDF2')
+
+fitz, HAS_PYMUPDF = optional_module('fitz')  # PyMuPDF
+
+# Operations every engine implements
+OPERATIONS = ('merge', 'split', 'unlock', 'rotate', 'extract_text', 'info')
+
+
+class EngineError(ValueError):
+    """Raised when a requested engine is unknown or not installed, or can't read the input"""
+
+
+PASSWORD_REQUIRED = "PDF is password protected. Please unlock it first."
+# Library errors name the spooled upload's path, so they are logged, not returned
+NOT_A_PDF = "File is not a readable PDF."
+
+
+def open_pdf(pdf_path):
+    """Open a PDF with PyMuPDF, refusing with EngineError one it can't read or that needs a password"""
+    try:
+        doc = fitz.open(pdf_path)
+    except Exception as e:
+        print(f"Could not open {pdf_path}: {e}", flush=True)
+        raise EngineError(NOT_A_PDF)
+    if doc.needs_pass or not doc.is_pdf:
+        message = PASSWORD_REQUIRED if doc.needs_pass else NOT_A_PDF
+        doc.close()
+        raise EngineError(message)
+    return doc
+
+
+def _open_reader(pdf_path):
+    """PyPDF2 reader for a PDF, refusing with EngineError one it can't read or that needs a password"""
+    try:
+        pdf_reader = PyPDF2.PdfReader(pdf_path)
+    except (PyPDF2.errors.DependencyError, PyPDF2.errors.FileNotDecryptedError, PyPDF2.errors.WrongPasswordError):
+        # Encrypted, and the empty password PdfReader tries didn't open it
+        raise EngineError(PASSWORD_REQUIRED)
+    except Exception as e:
+        print(f"Could not open {pdf_path}: {e}", flush=True)
+        raise EngineError(NOT_A_PDF)
+    if pdf_reader.is_encrypted:
+        # Files with only an owner password open with an empty user password
+        try:
+            decrypted = pdf_reader.decrypt('')
+        except Exception:
+            decrypted = False
+        if not decrypted:
+            raise EngineError(PASSWORD_REQUIRED)
+    return pdf_reader
+
+
+class PyPDF2Engine:
+    """Pure-Python engine; always available but slow on large documents"""
+
+    name = 'pypdf2'
+
+    def merge(self, paths, output_path):
+        merger = PyPDF2.PdfMerger()
+        for path in paths:
+            merger.append(_open_reader(path))
+        merger.write(output_path)
+        merger.close()
+
+    def open(self, pdf_path):
+        return _open_reader(pdf_path)
+
+    def close(self, handle):
+        pass
+
+    def page_count(self, handle):
+        return len(handle.pages)
+
+    def split_part(self, handle, start, end):
+        """Pages start..end-1 of an open document as PDF bytes"""
+        pdf_writer = PyPDF2.PdfWriter()
+        for page_num in range(start, end):
+            pdf_writer.add_page(handle.pages[page_num])
+        output = io.BytesIO()
+        pdf_writer.write(output)
+        return output.getvalue()
+
+    def unlock(self, pdf_path, output, password=''):
+        pdf_reader = PyPDF2.PdfReader(pdf_path)
+
+        # Check if encrypted
+        if pdf_reader.is_encrypted:
+            if password:
+                pdf_reader.decrypt(password)
+            else:
+                raise PasswordRequiredError("PDF is password protected. Please provide password.")
+
+        # Create unlocked PDF
+        pdf_writer = PyPDF2.PdfWriter()
+        for page in pdf_reader.pages:
+            pdf_writer.add_page(page)
+
+        pdf_writer.write(output)
+
+    def rotate(self, pdf_path, output_path, rotation, pages=''):
+        """Rotate the pages named in a spec like "1-3:90,7:180", or every page by rotation"""
+        pdf_reader = _open_reader(pdf_path)
+        pdf_writer = PyPDF2.PdfWriter()
+
+        angles = parse_rotation_spec(pages, len(pdf_reader.pages), rotation)
+        for page_num, page in enumerate(pdf_reader.pages):
+            if page_num in angles:
+                page.rotate(angles[page_num])
+            pdf_writer.add_page(page)
+
+        # Always a full rewrite of the document
+        pdf_writer.write(output_path)
+
+    def extract_page_texts(self, pdf_path, pages=''):
+        """(0-indexed page number, text) for each selected page"""
+        pdf_reader = _open_reader(pdf_path)
+        page_numbers = select_pages(pages, len(pdf_reader.pages))
+        return [(page_num, pdf_reader.pages[page_num].extract_text()) for page_num in page_numbers]
+
+    def extract_text(self, pdf_path, pages=''):
+        page_texts = self.extract_page_texts(pdf_path, pages)
+        return ''.join(text + "\n\n" for _, text in page_texts), len(page_texts)
+
+    def info(self, pdf_path):
+        pdf_reader = PyPDF2.PdfReader(pdf_path)
+
+        info = {
+            "pages": len(pdf_reader.pages),
+            "encrypted": pdf_reader.is_encrypted,
+            "version": _pypdf2_version(pdf_reader),
+            "metadata": {}
+        }
+
+        if pdf_reader.metadata:
+            info["metadata"] = {
+                "title": pdf_reader.metadata.get('/Title', 'N/A'),
+                "author": pdf_reader.metadata.get('/Author', 'N/A'),
+                "subject": pdf_reader.metadata.get('/Subject', 'N/A'),
+                "creator": pdf_reader.metadata.get('/Creator', 'N/A'),
+            }
+
+        if not pdf_reader.is_encrypted:
+            image_xrefs = set()
+            info["page_details"] = [
+                _pypdf2_page_details(page_num, page, image_xrefs)
+                for page_num, page in enumerate(pdf_reader.pages)
+            ]
+            info["images"] = len(image_xrefs)
+
+        return info
+
+
+class PyMuPDFEngine:
+    """MuPDF-backed engine; much faster, used by default when installed"""
+
+    name = 'pymupdf'
+
+    def merge(self, paths, output_path):
+        """Merge PDFs on disk into output_path, holding one input in memory at a time.
+
+        After the first input the output is reopened from disk and each further
+        input is appended as an incremental update, so MuPDF only keeps the
+        current input and the output's xref table resident.
+        """
+        for idx, path in enumerate(paths):
+            with open_pdf(path) as doc:
+                if idx == 0:
+                    merged_doc = fitz.open()
+                    merged_doc.insert_pdf(doc)
+                    merged_doc.save(output_path)
+                else:
+                    merged_doc = fitz.open(output_path)
+                    merged_doc.insert_pdf(doc)
+                    merged_doc.saveIncr()
+                merged_doc.close()
+
+    def open(self, pdf_path):
+        return open_pdf(pdf_path)
+
+    def close(self, handle):
+        handle.close()
+
+    def page_count(self, handle):
+        return len(handle)
+
+    def split_part(self, handle, start, end):
+        """Pages start..end-1 of an open document as PDF bytes"""
+        part = fitz.open()
+        part.insert_pdf(handle, from_page=start, to_page=end - 1)
+        data = part.tobytes()
+        part.close()
+        return data
+
+    def unlock(self, pdf_path, output, password=''):
+        with fitz.open(pdf_path) as doc:
+            if doc.needs_pass:
+                if not password:
+                    raise PasswordRequiredError("PDF is password protected. Please provide password.")
+                if not doc.authenticate(password):
+                    raise PasswordRequiredError("Incorrect password for this PDF.")
+            doc.save(output, encryption=fitz.PDF_ENCRYPT_NONE)
+
+    def rotate(self, pdf_path, output_path, rotation, pages=''):
+        """Rotate the pages named in a spec like "1-3:90,7:180", or every page by rotation.
+
+        Only the /Rotate of the touched page dictionaries changes, appended
+        to a copy of the file as an incremental update.
+        """
+        def edit(doc):
+            for page_num, angle in parse_rotation_spec(pages, len(doc), rotation).items():
+                page = doc[page_num]
+                page.set_rotation((page.rotation + angle) % 360)
+
+        save_edited(pdf_path, output_path, edit)
+
+    def extract_page_texts(self, pdf_path, pages=''):
+        """(0-indexed page number, text) for each selected page"""
+        with open_pdf(pdf_path) as doc:
+            page_numbers = select_pages(pages, len(doc))
+            return [(page_num, doc[page_num].get_text()) for page_num in page_numbers]
+
+    def extract_text(self, pdf_path, pages=''):
+        page_texts = self.extract_page_texts(pdf_path, pages)
+        return ''.join(text + "\n\n" for _, text in page_texts), len(page_texts)
+
+    def info(self, pdf_path):
+        with fitz.open(pdf_path) as doc:
+            metadata = doc.metadata or {}
+            info = {
+                "pages": len(doc),
+                "encrypted": bool(doc.needs_pass or metadata.get('encryption')),
+                "version": _pymupdf_version(doc, metadata),
+                "metadata": {}
+            }
+
+            # Only report metadata when the document has a readable Info dictionary
+            if not doc.needs_pass and doc.xref_get_key(-1, "Info")[0] != 'null':
+                info["metadata"] = {
+                    "title": metadata.get('title') or 'N/A',
+                    "author": metadata.get('author') or 'N/A',
+                    "subject": metadata.get('subject') or 'N/A',
+                    "creator": metadata.get('creator') or 'N/A',
+                }
+
+            if not doc.needs_pass:
+                # Page objects and their resources only; no content stream is parsed
+                image_xrefs = set()
+                info["page_details"] = []
+                for page in doc:
+                    images = page.get_images()
+                    image_xrefs.update(image[0] for image in images)
+                    info["page_details"].append({
+                        "page": page.number + 1,
+                        "width": round(page.rect.width, 2),
+                        "height": round(page.rect.height, 2),
+                        "rotation": page.rotation,
+                        "has_text_layer": bool(page.get_fonts()),
+                        "images": len(images),
+                    })
+                info["images"] = len(image_xrefs)
+
+        return info
+
+
+def _pymupdf_version(doc, metadata):
+    """PDF version, preferring the catalog's /Version over the file header"""
+    if doc.is_pdf and not doc.needs_pass:
+        kind, value = doc.xref_get_key(doc.pdf_catalog(), 'Version')
+        if kind == 'name':
+            return value.lstrip('/')
+    return (metadata.get('format') or '').replace('PDF ', '') or None
+
+
+def _pypdf2_version(pdf_reader):
+    try:
+        catalog_version = pdf_reader.trailer['/Root'].get('/Version')
+    except Exception:
+        catalog_version = None
+    if catalog_version:
+        return str(catalog_version).lstrip('/')
+    return pdf_reader.pdf_header.replace('%PDF-', '')
+
+
+def _pypdf2_page_details(page_num, page, image_xrefs):
+    resources = page.get('/Resources')
+    resources = resources.get_object() if resources is not None else {}
+    fonts = resources.get('/Font')
+    images = 0
+    xobjects = resources.get('/XObject')
+    for ref in (xobjects.get_object() if xobjects is not None else {}).values():
+        if ref.get_object().get('/Subtype') == '/Image':
+            images += 1
+            image_xrefs.add(getattr(ref, 'idnum', id(ref)))
+    width, height = page.cropbox.width, page.cropbox.height
+    rotation = page.get('/Rotate', 0) % 360
+    if rotation in (90, 270):
+        width, height = height, width
+    return {
+        "page": page_num + 1,
+        "width": round(float(width), 2),
+        "height": round(float(height), 2),
+        "rotation": rotation,
+        "has_text_layer": bool(fonts and fonts.get_object()),
+        "images": images,
+    }
+
+
+# In order of preference; the first available engine is the default
+ENGINES = {}
+if HAS_PYMUPDF:
+    ENGINES['pymupdf'] = PyMuPDFEngine()
+ENGINES['pypdf2'] = PyPDF2Engine()
+
+
+def get_engine(operation, requested=None):
+    """Pick the engine for an operation.
+
+    A per-request choice wins, then PDF_ENGINE_<OPERATION>, then PDF_ENGINE,
+    then the fastest installed engine.
+    """
+    if operation not in OPERATIONS:
+        raise ValueError(f"Unknown operation: {operation}")
+    choice = (
+        requested
+        or os.getenv(f'PDF_ENGINE_{operation.upper()}')
+        or os.getenv('PDF_ENGINE')
+    )
+    if not choice:
+        return next(iter(ENGINES.values()))
+    choice = choice.lower()
+    if choice not in ENGINES:
+        raise EngineError(f"PDF engine '{choice}' is not available. Available engines: {', '.join(ENGINES)}")
+    return ENGINES[choice]
+
+
+def get_engine_by_name(name):
+    return ENGINES[name]
+
+
+def engine_report():
+    """Engine serving each operation under the current configuration"""
+    report = {}
+    for operation in OPERATIONS:
+        try:
+            report[operation] = get_engine(operation).name
+        except EngineError as e:
+            report[operation] = f"error: {e}"
+    return report
+
+
+def log_engine_selection():
+    """Startup self-check: print which engine handles each operation"""
+    print(f"PDF engines available: {', '.join(ENGINES)}", flush=True)
+    for operation, engine in engine_report().items():
+        print(f"  {operation}: {engine}", flush=True)
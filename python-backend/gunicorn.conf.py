@@ -0,0 +1,48 @@
+# Picked up automatically by `gunicorn main:app` when run from this directory
+import os
+import shutil
+import tempfile
+
+# Workers write Prometheus samples here so /api/metrics can sum them; this
+# must be set before the app (and prometheus_client) is imported in a worker
+metrics_dir = os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'pdf-metrics')
+)
+# Created here rather than in on_starting: with preload_app the master imports
+# the app, and metrics.py opens its sample files, before any server hook runs.
+# Samples from a previous run would otherwise be added to this one's.
+shutil.rmtree(metrics_dir, ignore_errors=True)
+os.makedirs(metrics_dir, exist_ok=True)
+
+# A few processes with a thread per request in flight. Endpoints that spread
+# CPU work over processes submit it to the shared offload pool, and batches and
+# jobs to their own pools, so their request threads mostly wait; the
+# per-endpoint limits in offload.py bound how many heavy requests run at once.
+# Keep threads above the sum of those concurrency and queue limits so light
+# endpoints stay responsive while conversions are running.
+workers = int(os.getenv('GUNICORN_WORKERS', 2))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 32))
+# Import the app once in the master so workers fork with it already loaded;
+# process pools and background threads are only started on first use in a worker
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') not in ('0', 'false', 'False', '')
+
+# The app imports these on first use (see lazy_imports.py). The master imports
+# them before forking so workers and their process pools share the pages
+# copy-on-write and no request pays for the import.
+PRELOAD_MODULES = [name.strip() for name in os.getenv('PRELOAD_MODULES', 'fitz,PyPDF2').split(',') if name.strip()]
+
+
+def on_starting(server):
+    from lazy_imports import preload
+    timings = preload(PRELOAD_MODULES)
+    server.log.info("Preloaded %s", ', '.join(f"{name} ({seconds:.3f}s)" for name, seconds in timings.items()))
+
+
+def child_exit(server, worker):
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    # Drop the dead worker's live gauges (in-flight requests); counters are kept
+    multiprocess.mark_process_dead(worker.pid)
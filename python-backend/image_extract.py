@@ -0,0 +1,173 @@
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+
+import offload
+from lazy_imports import optional_module
+from zipstream import ZipSink, write_bytes_entry, write_file_entry
+
+fitz, HAS_PYMUPDF = optional_module('fitz')  # PyMuPDF
+
+# Shares a large extraction is cut into, run in the shared offload pool
+IMAGES_WORKERS = int(os.getenv('IMAGES_WORKERS', offload.OFFLOAD_WORKERS))
+# Below this many unique images the fork and IPC overhead outweighs parallel extraction
+IMAGES_PARALLEL_MIN_IMAGES = int(os.getenv('IMAGES_PARALLEL_MIN_IMAGES', 16))
+
+# original keeps JPEG/JPEG 2000 streams as they are and decodes the rest to PNG
+IMAGE_FORMATS = ('original', 'png', 'jpg')
+
+# Image stream filter -> format reported without decoding
+FILTER_FORMATS = {'DCTDecode': 'jpeg', 'JPXDecode': 'jpx', 'JBIG2Decode': 'jb2', 'CCITTFaxDecode': 'tiff'}
+
+def unique_images(doc, min_width=0, min_height=0):
+    """(images, skipped): one entry per image xref with every page it appears on.
+
+    Reads only the page resource lists, so nothing is decoded. Images are
+    in order of first appearance; skipped counts xrefs below the minimum size.
+    """
+    images = {}
+    skipped = set()
+    for page in doc:
+        for xref, smask, width, height, bpc, colorspace, _, name, image_filter, _ in page.get_images(full=True):
+            if xref in skipped:
+                continue
+            if width < min_width or height < min_height:
+                skipped.add(xref)
+                continue
+            if xref not in images:
+                images[xref] = {
+                    "xref": xref,
+                    "smask": smask,
+                    "width": width,
+                    "height": height,
+                    "bpc": bpc,
+                    "colorspace": colorspace,
+                    "format": FILTER_FORMATS.get(image_filter, 'png'),
+                    "pages": [],
+                }
+            if not images[xref]["pages"] or images[xref]["pages"][-1] != page.number + 1:
+                images[xref]["pages"].append(page.number + 1)
+    return list(images.values()), len(skipped)
+
+
+def entry_name(image, ext):
+    return f"images/page{image['pages'][0]:04d}_xref{image['xref']}.{ext}"
+
+
+def _image_bytes(doc, image, image_format):
+    """(extension, bytes) of one image xref in the requested format"""
+    if image_format == 'original' and not image['smask']:
+        extracted = doc.extract_image(image['xref'])
+        return extracted['ext'], extracted['image']
+
+    pix = fitz.Pixmap(doc, image['xref'])
+    if image['smask']:
+        try:
+            pix = fitz.Pixmap(pix, fitz.Pixmap(doc, image['smask']))
+        except (RuntimeError, ValueError):
+            # Mask that doesn't match the image; keep the image without transparency
+            pass
+    if pix.colorspace and pix.colorspace.n > 3:
+        pix = fitz.Pixmap(fitz.csRGB, pix)
+    ext = 'jpg' if image_format == 'jpg' else 'png'
+    if ext == 'jpg' and pix.alpha:
+        pix = fitz.Pixmap(pix, 0)
+    return ext, pix.tobytes(ext)
+
+
+def _extract(doc, image, image_format):
+    """(extension, bytes, error) for one image; a broken image doesn't end the archive"""
+    try:
+        ext, data = _image_bytes(doc, image, image_format)
+        return ext, data, None
+    except Exception as e:
+        return None, None, str(e)
+
+
+def _write_images(pdf_path, images, image_format, out_dir):
+    """Pool worker: open the source once and write each image to out_dir; returns (ext, error) per image"""
+    results = []
+    with fitz.open(pdf_path) as doc:
+        for image in images:
+            ext, data, error = _extract(doc, image, image_format)
+            if data is not None:
+                with open(os.path.join(out_dir, str(image['xref'])), 'wb') as f:
+                    f.write(data)
+            results.append((ext, error))
+    return results
+
+
+def _manifest_entry(image, name, ext, size, error):
+    entry = {
+        "xref": image['xref'],
+        "pages": image['pages'],
+        "width": image['width'],
+        "height": image['height'],
+        "colorspace": image['colorspace'],
+    }
+    if error:
+        entry["error"] = error
+    else:
+        entry.update({"name": name, "format": ext, "bytes": size})
+    return entry
+
+
+def stream_images_zip(pdf_path, images, skipped, image_format='original', parallel=True):
+    """Extract each unique image once and stream them as a ZIP, manifest.json last.
+
+    Few images are extracted straight into ZIP entries from one open
+    document. Many are split into one share per pool worker, each opening
+    the source once, and added in order as each share completes. With
+    parallel=False every image is extracted in this process. The source
+    file is removed when streaming ends.
+    """
+    sink = ZipSink()
+    out_dir = None
+    manifest = []
+    try:
+        with zipfile.ZipFile(sink, 'w') as zf:
+            if not parallel or len(images) < IMAGES_PARALLEL_MIN_IMAGES or IMAGES_WORKERS <= 1:
+                with fitz.open(pdf_path) as doc:
+                    for image in images:
+                        ext, data, error = _extract(doc, image, image_format)
+                        name = entry_name(image, ext) if data is not None else None
+                        if data is not None:
+                            yield from write_bytes_entry(zf, sink, name, data)
+                        manifest.append(_manifest_entry(image, name, ext, len(data or b''), error))
+            else:
+                out_dir = tempfile.mkdtemp(prefix='images-')
+                share = -(-len(images) // IMAGES_WORKERS)
+                groups = [images[i:i + share] for i in range(0, len(images), share)]
+                futures = [offload.submit(_write_images, pdf_path, group, image_format, out_dir) for group in groups]
+                for group, future in zip(groups, futures):
+                    for image, (ext, error) in zip(group, future.result()):
+                        name = None
+                        size = 0
+                        if not error:
+                            name = entry_name(image, ext)
+                            path = os.path.join(out_dir, str(image['xref']))
+                            size = os.path.getsize(path)
+                            yield from write_file_entry(zf, sink, name, path)
+                            os.unlink(path)
+                        manifest.append(_manifest_entry(image, name, ext, size, error))
+
+            summary = {
+                "images": manifest,
+                "total": len(manifest),
+                "occurrences": sum(len(image['pages']) for image in images),
+                "skipped_small": skipped,
+                "image_format": image_format,
+            }
+            yield from write_bytes_entry(
+                zf, sink, 'manifest.json', json.dumps(summary, indent=2).encode(), zipfile.ZIP_DEFLATED
+            )
+        yield sink.drain()
+    finally:
+        if out_dir:
+            shutil.rmtree(out_dir, ignore_errors=True)
+        try:
+            os.unlink(pdf_path)
+        except OSError:
+            pass
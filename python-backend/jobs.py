@@ -0,0 +1,252 @@
+import functools
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import converters
+import uploads
+
+JOBS_DIR = os.getenv('JOBS_DIR', os.path.join(tempfile.gettempdir(), 'pdf-jobs'))
+JOBS_DB = os.path.join(JOBS_DIR, 'jobs.sqlite3')
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+JOB_TTL_SECONDS = int(os.getenv('JOB_TTL_SECONDS', 24 * 60 * 60))
+
+# kind -> (conversion function, output suffix, mimetype, download name).
+# Conversions already run in a job worker, so they don't start a nested offload pool.
+JOB_KINDS = {
+    'pdf_to_word': (
+        functools.partial(converters.convert_pdf_to_word, parallel=False),
+        '.docx',
+        'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+        'converted.docx',
+    ),
+    'pdf_to_excel': (
+        functools.partial(converters.convert_pdf_to_excel, parallel=False),
+        '.xlsx',
+        'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        'converted.xlsx',
+    ),
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    input_path TEXT NOT NULL,
+    output_path TEXT NOT NULL,
+    owner_pid INTEGER,
+    pages_done INTEGER NOT NULL DEFAULT 0,
+    pages_total INTEGER,
+    error TEXT,
+    params TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _connect():
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    conn = sqlite3.connect(JOBS_DB, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(_SCHEMA)
+    columns = {row['name'] for row in conn.execute("PRAGMA table_info(jobs)")}
+    if 'params' not in columns:
+        # Databases created before jobs carried conversion parameters
+        conn.execute("ALTER TABLE jobs ADD COLUMN params TEXT")
+    return conn
+
+
+def _update(job_id, **fields):
+    fields['updated_at'] = time.time()
+    assignments = ', '.join(f"{name} = ?" for name in fields)
+    conn = _connect()
+    try:
+        conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+    finally:
+        conn.close()
+
+
+def _pid_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _run_job(job_id, kind, input_path, output_path, params=None):
+    """Executed in a pool process; reports progress back through SQLite"""
+    convert = JOB_KINDS[kind][0]
+    last_report = [0.0]
+
+    def progress(done, total):
+        now = time.monotonic()
+        # Throttle writes so long documents don't hammer the database
+        if done < total and now - last_report[0] < 0.5:
+            return
+        last_report[0] = now
+        _update(job_id, pages_done=done, pages_total=total)
+
+    try:
+        _update(job_id, status='running')
+        convert(input_path, output_path, progress=progress, **(params or {}))
+        _update(job_id, status='done')
+    except Exception as e:
+        traceback.print_exc()
+        _update(job_id, status='failed', error=str(e))
+    finally:
+        try:
+            os.unlink(input_path)
+        except OSError:
+            pass
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=JOB_WORKERS)
+            _resume_orphaned_jobs(_executor)
+        return _executor
+
+
+def _reset_executor():
+    # A forked child inherits the executor object but not its manager thread
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_executor)
+
+
+def _resume_orphaned_jobs(executor):
+    """Requeue jobs whose owning worker died before they finished"""
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            "SELECT id, kind, input_path, output_path, owner_pid, params FROM jobs "
+            "WHERE status IN ('queued', 'running')"
+        ).fetchall()
+        for row in rows:
+            if _pid_alive(row['owner_pid']) or not os.path.exists(row['input_path']):
+                continue
+            # Compare-and-swap the owner so only one worker picks the job up
+            claimed = conn.execute(
+                "UPDATE jobs SET owner_pid = ?, status = 'queued', updated_at = ? "
+                "WHERE id = ? AND owner_pid IS ?",
+                (os.getpid(), time.time(), row['id'], row['owner_pid'])
+            ).rowcount
+            if claimed:
+                print(f"Resuming job {row['id']} ({row['kind']})", flush=True)
+                executor.submit(
+                    _run_job, row['id'], row['kind'], row['input_path'], row['output_path'],
+                    json.loads(row['params'] or '{}')
+                )
+    finally:
+        conn.close()
+
+
+def purge_expired_jobs():
+    """Remove finished jobs and their outputs once they are past the TTL"""
+    cutoff = time.time() - JOB_TTL_SECONDS
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            "SELECT id, output_path FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+            (cutoff,)
+        ).fetchall()
+        for row in rows:
+            try:
+                os.unlink(row['output_path'])
+            except OSError:
+                pass
+            conn.execute("DELETE FROM jobs WHERE id = ?", (row['id'],))
+    finally:
+        conn.close()
+
+
+def submit_job(kind, file, params=None):
+    """Move an upload into the jobs directory and queue it for conversion.
+    
+    params are passed as keyword arguments to the conversion function.
+    """
+    if kind not in JOB_KINDS:
+        raise ValueError(f"Unknown job kind: {kind}")
+
+    purge_expired_jobs()
+
+    job_id = uuid.uuid4().hex
+    suffix = JOB_KINDS[kind][1]
+    input_path = os.path.join(JOBS_DIR, f"{job_id}.pdf")
+    output_path = os.path.join(JOBS_DIR, f"{job_id}{suffix}")
+
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    uploads.claim(file, input_path)
+
+    now = time.time()
+    conn = _connect()
+    try:
+        conn.execute(
+            "INSERT INTO jobs (id, kind, status, input_path, output_path, owner_pid, params, created_at, updated_at) "
+            "VALUES (?, ?, 'queued', ?, ?, ?, ?, ?, ?)",
+            (job_id, kind, input_path, output_path, os.getpid(), json.dumps(params or {}), now, now)
+        )
+    finally:
+        conn.close()
+
+    _get_executor().submit(_run_job, job_id, kind, input_path, output_path, params)
+    return job_id
+
+
+def get_job(job_id):
+    """Return the job row as a dict, or None if the id is unknown"""
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    finally:
+        conn.close()
+    if not row:
+        return None
+    if row['status'] in ('queued', 'running') and not _pid_alive(row['owner_pid']):
+        # The worker that owned this job restarted; pick it up here
+        _resume_orphaned_jobs(_get_executor())
+    return dict(row)
+
+
+def job_status(job):
+    """Public view of a job row for the status endpoint"""
+    return {
+        "id": job['id'],
+        "kind": job['kind'],
+        "status": job['status'],
+        "progress": {
+            "pages_done": job['pages_done'],
+            "pages_total": job['pages_total'],
+        },
+        "error": job['error'],
+        "created_at": job['created_at'],
+        "updated_at": job['updated_at'],
+    }
+
+
+def job_output(job):
+    """(path, mimetype, download_name) for a finished job"""
+    _, _, mimetype, download_name = JOB_KINDS[job['kind']]
+    return job['output_path'], mimetype, download_name
@@ -0,0 +1,91 @@
+import importlib
+import importlib.util
+import os
+import threading
+import time
+import weakref
+
+_instances = weakref.WeakSet()
+
+
+class LazyModule:
+    """Stands in for a module and imports it on first attribute access.
+
+    PyMuPDF, PyPDF2 and pdf2docx (with numpy and OpenCV) take most of the
+    app's import time; a request only pays for the ones it uses. Under
+    gunicorn the master imports the common ones before forking (see
+    preload), so workers start with them already loaded.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._error = None
+        # One lock per module, so a slow import doesn't hold up the others
+        self._lock = threading.RLock()
+        _instances.add(self)
+
+    def _load(self):
+        with self._lock:
+            if self._module is None:
+                if self._error is not None:
+                    raise ImportError(f"{self._name} failed to import: {self._error}")
+                try:
+                    self._module = importlib.import_module(self._name)
+                except ImportError as e:
+                    # Installed but broken, e.g. a bad OpenCV or numpy build; don't retry every call
+                    print(f"Optional module {self._name} is installed but failed to import: {e}", flush=True)
+                    self._error = e
+                    raise
+        return self._module
+
+    def available(self):
+        """Import the module now if needed and return whether that worked"""
+        try:
+            self._load()
+        except ImportError:
+            return False
+        return True
+
+    def __getattr__(self, attr):
+        module = self._module or self._load()
+        return getattr(module, attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def _reset_locks():
+    # A child forked while another thread was importing would inherit that lock held forever
+    for module in list(_instances):
+        module._lock = threading.RLock()
+
+
+os.register_at_fork(after_in_child=_reset_locks)
+
+
+def optional_module(name):
+    """(module, installed) for an optional dependency, without importing it.
+
+    Only checks that the package can be found; a broken install raises
+    ImportError at first use instead. Code with a fallback checks
+    module.available() before taking the module's path.
+    """
+    if importlib.util.find_spec(name) is None:
+        return None, False
+    return LazyModule(name), True
+
+
+def preload(names):
+    """Import modules now and return {name: seconds}; missing ones are skipped"""
+    timings = {}
+    for name in names:
+        started = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            print(f"Preload skipped {name}: {e}", flush=True)
+            continue
+        timings[name] = round(time.perf_counter() - started, 4)
+    return timings
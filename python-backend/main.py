@@ -1,31 +1,60 @@
-from flask import Flask, request, send_file, jsonify
+from flask import Flask, Response, request, send_file, jsonify
 from flask_cors import CORS
-import PyPDF2
 import io
+import json
 import os
+import shutil
 import sys
-from werkzeug.utils import secure_filename
 import tempfile
 import zipfile
-try:
-    from pdf2docx import Converter
-    HAS_PDF2DOCX = True
-except ImportError:
-    HAS_PDF2DOCX = False
-
-try:
-    import fitz  # PyMuPDF
-    HAS_PYMUPDF = True
-except ImportError:
-    HAS_PYMUPDF = False
-
-import google.generativeai as genai
+
+from lazy_imports import optional_module
+
+fitz, HAS_PYMUPDF = optional_module('fitz')  # PyMuPDF
+
 from dotenv import load_dotenv
 
+from converters import (
+    HAS_PDF2DOCX,
+    MissingDependencyError,
+    convert_pdf_to_excel,
+    convert_pdf_to_word,
+    count_pages,
+    stream_extracted_rows,
+    word_engine,
+)
+from engines import NOT_A_PDF, EngineError, engine_report, get_engine, log_engine_selection, open_pdf
+from pdf_ops import (
+    PageRangeError,
+    PasswordRequiredError,
+    parse_page_ranges,
+    parse_rotation,
+    save_edited,
+    select_pages,
+    watermark_pdf_file,
+)
+from result_cache import CACHE_DIR, cache as result_cache, cached_result
+import image_extract
+import jobs
+import batch
+import compress
+import metrics
+import ocr
+import offload
+import profiling
+import search_index
+import split
+import text_extract
+import uploads
+
 load_dotenv()
 
 app = Flask(__name__)
-CORS(app)  # Enable CORS for React frontend
+CORS(app, expose_headers=['X-Cache', 'X-Compression-Report', 'X-Profile-Id'])  # Enable CORS for React frontend
+
+log_engine_selection()
+metrics.init_app(app, {"result_cache": CACHE_DIR, "jobs": jobs.JOBS_DIR, "uploads": uploads.UPLOAD_DIR})
+profiling.init_app(app)
 
 @app.route('/')
 def index():
@@ -44,11 +73,37 @@ def allowed_ocr_file(filename):
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({"status": "ok", "message": "PDF API is running"})
+    return jsonify({"status": "ok", "message": "PDF API is running", "engines": engine_report()})
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """Result cache hit/miss counters and disk usage"""
+    return jsonify(result_cache.stats())
+
+@app.route('/api/offload/stats', methods=['GET'])
+def offload_stats():
+    """Running and waiting requests per limited endpoint in this server worker"""
+    return jsonify(offload.stats())
+
+def request_engine(operation):
+    """Engine for this request, honouring an optional `engine` form/query parameter"""
+    engine = get_engine(operation, request.form.get('engine') or request.args.get('engine'))
+    metrics.record_engine(engine.name)
+    return engine
+
+def remove_file(path):
+    if path and os.path.exists(path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
 
 @app.route('/api/pdf/merge', methods=['POST'])
+@cached_result('engine', filenames=True)  # Files without a .pdf name are skipped
+@offload.limited
 def merge_pdfs():
     """Merge multiple PDF files into one"""
+    spool_dir = None
     try:
         if 'files' not in request.files:
             return jsonify({"error": "No files provided"}), 400
@@ -58,158 +113,162 @@ def merge_pdfs():
         if len(files) < 2:
             return jsonify({"error": "At least 2 files required"}), 400
         
+        try:
+            engine = request_engine('merge')
+        except EngineError as e:
+            return jsonify({"error": str(e)}), 400
+        
         print(f"Merging {len(files)} files...", flush=True)
         
-        output = io.BytesIO()
-
-        if HAS_PYMUPDF:
-            print("Using PyMuPDF for merging", flush=True)
-            merged_doc = fitz.open()
-            for file in files:
-                if file and allowed_file(file.filename):
-                    print(f"Adding file: {file.filename}", flush=True)
-                    file.seek(0)
-                    file_bytes = file.read()
-                    try:
-                        with fitz.open(stream=file_bytes, filetype="pdf") as doc:
-                            merged_doc.insert_pdf(doc)
-                    except Exception as e:
-                        print(f"Error adding file {file.filename}: {e}", flush=True)
-                        return jsonify({"error": f"Failed to process {file.filename}: {str(e)}"}), 400
-            
-            merged_doc.save(output)
-            merged_doc.close()
-        else:
-            print("Using PyPDF2 for merging", flush=True)
-            # Create PDF merger
-            merger = PyPDF2.PdfMerger()
-            
-            # Add all PDFs
-            for file in files:
-                if file and allowed_file(file.filename):
-                    print(f"Adding file: {file.filename}", flush=True)
-                    # Reset file pointer to ensure we read from start
-                    file.seek(0)
-                    merger.append(io.BytesIO(file.read()))
-            
-            merger.write(output)
-            merger.close()
+        # Engines open the spooled uploads in place; only the output needs a directory
+        spool_dir = tempfile.mkdtemp(prefix='merge-')
+        paths = []
+        for file in files:
+            if file and allowed_file(file.filename):
+                print(f"Adding file: {file.filename}", flush=True)
+                paths.append((file.filename, uploads.path(file)))
         
-        output.seek(0)
+        output_path = os.path.join(spool_dir, 'merged.pdf')
+
+        print(f"Using {engine.name} for merging", flush=True)
+        total_pages = 0
+        for filename, path in paths:
+            try:
+                handle = engine.open(path)
+                total_pages += engine.page_count(handle)
+                engine.close(handle)
+            except EngineError as e:
+                return jsonify({"error": f"Failed to process {filename}: {e}"}), 400
+            except Exception as e:
+                # The library's message names the spooled upload's path
+                print(f"Error adding file {filename}: {e}", flush=True)
+                return jsonify({"error": f"Failed to process {filename}: {NOT_A_PDF}"}), 400
+        engine.merge([path for _, path in paths], output_path)
+        metrics.record_pages(total_pages)
         
         # Check output size
-        size = output.getbuffer().nbytes
+        size = os.path.getsize(output_path) if os.path.exists(output_path) else 0
         print(f"Merge complete. Output size: {size} bytes", flush=True)
         
         if size == 0:
             return jsonify({"error": "Merged PDF is empty"}), 500
         
-        return send_file(
-            output,
+        # Stream the merged file from disk and drop the spool once it is sent
+        response = send_file(
+            output_path,
             mimetype='application/pdf',
             as_attachment=True,
             download_name='merged.pdf'
         )
+        cleanup_dir = spool_dir
+        # Close callbacks only run on responses werkzeug wraps itself
+        response.direct_passthrough = False
+        response.call_on_close(lambda: shutil.rmtree(cleanup_dir, ignore_errors=True))
+        spool_dir = None
+        return response
     
     except Exception as e:
         print(f"Error in merge_pdfs: {str(e)}", flush=True)
+        metrics.record_error(e)
         import traceback
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
+    
+    finally:
+        if spool_dir:
+            shutil.rmtree(spool_dir, ignore_errors=True)
 
 @app.route('/api/pdf/split', methods=['POST'])
+@cached_result('pages', 'every', 'compression', 'engine')
+@offload.limited
 def split_pdf():
-    """Split PDF into separate files for each page range"""
+    """Split PDF into separate files for each page range, or every N pages"""
+    temp_path = None
     try:
         if 'file' not in request.files:
             return jsonify({"error": "No file provided"}), 400
         
         file = request.files['file']
         page_range = request.form.get('pages', '')  # e.g., "1-5,8,10-12"
+        every = request.form.get('every', '')  # e.g., "10"; "1" gives one file per page
+        compression = request.form.get('compression', 'stored')  # stored or deflate
         
         if not file or not allowed_file(file.filename):
             return jsonify({"error": "Invalid file"}), 400
         
-        if not page_range:
-            return jsonify({"error": "Please specify pages to split (e.g., '1-5,8,10-12' or just '1-5')"}), 400
+        if not page_range and not every:
+            return jsonify({"error": "Please specify pages to split (e.g., '1-5,8,10-12' or just '1-5') or every=N"}), 400
         
-        # Read PDF
-        pdf_reader = PyPDF2.PdfReader(io.BytesIO(file.read()))
-        total_pages = len(pdf_reader.pages)
+        if every:
+            try:
+                every = int(every)
+            except ValueError:
+                every = 0
+            if every < 1:
+                return jsonify({"error": "every must be a positive whole number of pages"}), 400
         
-        # Parse page range and create individual PDFs for each range
-        ranges = []
-        for part in page_range.split(','):
-            part = part.strip()
-            if '-' in part:
-                try:
-                    start, end = part.split('-')
-                    start_page = int(start.strip()) - 1  # Convert to 0-indexed
-                    end_page = int(end.strip())  # Inclusive
-                    if start_page < 0 or end_page > total_pages or start_page >= end_page:
-                        return jsonify({"error": f"Invalid page range: {part}. Valid pages: 1-{total_pages}"}), 400
-                    ranges.append((start_page, end_page))
-                except ValueError:
-                    return jsonify({"error": f"Invalid page range format: {part}"}), 400
-            else:
-                try:
-                    page_num = int(part) - 1  # Convert to 0-indexed
-                    if page_num < 0 or page_num >= total_pages:
-                        return jsonify({"error": f"Invalid page number: {part}. Valid pages: 1-{total_pages}"}), 400
-                    ranges.append((page_num, page_num + 1))
-                except ValueError:
-                    return jsonify({"error": f"Invalid page number format: {part}"}), 400
+        if compression not in ('stored', 'deflate'):
+            return jsonify({"error": "compression must be 'stored' or 'deflate'"}), 400
+        compress_type = zipfile.ZIP_DEFLATED if compression == 'deflate' else zipfile.ZIP_STORED
+        
+        try:
+            engine = request_engine('split')
+        except EngineError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        # Claimed so the streamed ZIP can still read the source after the request ends
+        temp_path = uploads.claim(file)
+        
+        try:
+            handle = engine.open(temp_path)
+        except EngineError as e:
+            return jsonify({"error": str(e)}), 400
+        total_pages = engine.page_count(handle)
+        
+        if every:
+            ranges = split.every_n_ranges(total_pages, every)
+        else:
+            # Parse page range and create individual PDFs for each range
+            try:
+                ranges = parse_page_ranges(page_range, total_pages)
+            except PageRangeError as e:
+                engine.close(handle)
+                return jsonify({"error": str(e)}), 400
+        
+        metrics.record_pages(sum(end - start for start, end in ranges))
         
         # If only one range, return a single PDF
         if len(ranges) == 1:
             start, end = ranges[0]
-            pdf_writer = PyPDF2.PdfWriter()
-            for page_num in range(start, end):
-                pdf_writer.add_page(pdf_reader.pages[page_num])
-            
-            output = io.BytesIO()
-            pdf_writer.write(output)
-            output.seek(0)
-            
+            output = io.BytesIO(engine.split_part(handle, start, end))
+            engine.close(handle)
             return send_file(
                 output,
                 mimetype='application/pdf',
                 as_attachment=True,
                 download_name='split.pdf'
             )
+        engine.close(handle)
         
-        # If multiple ranges, create ZIP with multiple PDFs
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for idx, (start, end) in enumerate(ranges, 1):
-                pdf_writer = PyPDF2.PdfWriter()
-                for page_num in range(start, end):
-                    pdf_writer.add_page(pdf_reader.pages[page_num])
-                
-                # Create filename for this split
-                if start == end - 1:
-                    filename = f'split_page_{start + 1}.pdf'
-                else:
-                    filename = f'split_pages_{start + 1}-{end}.pdf'
-                
-                # Write to ZIP
-                pdf_buffer = io.BytesIO()
-                pdf_writer.write(pdf_buffer)
-                pdf_buffer.seek(0)
-                zip_file.writestr(filename, pdf_buffer.getvalue())
-        
-        zip_buffer.seek(0)
-        return send_file(
-            zip_buffer,
+        # If multiple ranges, stream a ZIP with one PDF per range
+        response = Response(
+            split.stream_split_zip(temp_path, ranges, engine, compress_type, parallel=not profiling.is_profiling()),
             mimetype='application/zip',
-            as_attachment=True,
-            download_name='split_pdfs.zip'
+            headers={"Content-Disposition": "attachment; filename=split_pdfs.zip"}
         )
+        temp_path = None
+        return response
     
     except Exception as e:
+        metrics.record_error(e)
         return jsonify({"error": str(e)}), 500
+    
+    finally:
+        remove_file(temp_path)
 
 @app.route('/api/pdf/unlock', methods=['POST'])
+@cached_result('password', 'engine')
+@offload.limited
 def unlock_pdf():
     """Remove password protection from PDF"""
     try:
@@ -222,24 +281,12 @@ def unlock_pdf():
         if not file or not allowed_file(file.filename):
             return jsonify({"error": "Invalid file"}), 400
         
-        # Read PDF
-        pdf_reader = PyPDF2.PdfReader(io.BytesIO(file.read()))
-        
-        # Check if encrypted
-        if pdf_reader.is_encrypted:
-            if password:
-                pdf_reader.decrypt(password)
-            else:
-                return jsonify({"error": "PDF is password protected. Please provide password."}), 400
-        
         # Create unlocked PDF
-        pdf_writer = PyPDF2.PdfWriter()
-        for page in pdf_reader.pages:
-            pdf_writer.add_page(page)
-        
-        # Create output
         output = io.BytesIO()
-        pdf_writer.write(output)
+        try:
+            request_engine('unlock').unlock(uploads.path(file), output, password)
+        except (PasswordRequiredError, EngineError) as e:
+            return jsonify({"error": str(e)}), 400
         output.seek(0)
         
         return send_file(
@@ -250,306 +297,326 @@ def unlock_pdf():
         )
     
     except Exception as e:
+        metrics.record_error(e)
         return jsonify({"error": str(e)}), 500
 
+def wants_job_mode():
+    """Heavy conversions run as background jobs when the client asks for it"""
+    return request.form.get('mode') == 'job' or request.args.get('mode') == 'job'
+
+def submit_job_response(kind, file, params=None):
+    job_id = jobs.submit_job(kind, file, params)
+    print(f"Queued {kind} job {job_id}", flush=True)
+    return jsonify({
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/api/jobs/{job_id}",
+        "result_url": f"/api/jobs/{job_id}/result"
+    }), 202
+
+TABLE_STREAM_FORMATS = {
+    'csv': ('text/csv', 'converted.csv'),
+    'jsonl': ('application/x-ndjson', 'converted.jsonl'),
+}
+
+def stream_then_index(chunks, doc_hash, filename, page_count):
+    """Pass NDJSON text pages through and queue them for the search index once all are sent"""
+    pages = []
+    for chunk in chunks:
+        for line in chunk.splitlines():
+            page = json.loads(line)
+            pages.append((page['page'], page.get('text')))
+        yield chunk
+    search_index.index_document(doc_hash, filename, 'text', pages, page_count)
+
+def stream_then_remove(chunks, path):
+    """Yield from a generator and delete its input file once it is exhausted or closed"""
+    try:
+        yield from chunks
+    finally:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
 @app.route('/api/pdf/to-excel', methods=['POST'])
+@cached_result('mode', 'pages', 'format')
+@offload.limited
 def pdf_to_excel():
     """Convert PDF to Excel by extracting tables in proper format"""
-    temp_pdf = None
+    temp_path = None
     try:
         if 'file' not in request.files:
             return jsonify({"error": "No file provided"}), 400
         
         file = request.files['file']
+        page_range = request.form.get('pages', '')  # e.g., "1-5,8,10-12"; empty means all pages
+        output_format = request.form.get('format', 'xlsx').lower()  # xlsx, csv or jsonl
         
         if not file or not allowed_file(file.filename):
             return jsonify({"error": "Invalid file"}), 400
         
-        # Save temporarily
-        temp_pdf = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-        file.save(temp_pdf.name)
-        temp_pdf.close()
+        if output_format != 'xlsx' and output_format not in TABLE_STREAM_FORMATS:
+            return jsonify({"error": f"Invalid format. Supported formats: xlsx, {', '.join(TABLE_STREAM_FORMATS)}"}), 400
         
-        # Try using PyMuPDF if available
-        if HAS_PYMUPDF:
-            from openpyxl import Workbook
-            from openpyxl.styles import Alignment, Font, PatternFill, Border, Side
-            
-            # Open and read PDF
-            doc = fitz.open(temp_pdf.name)
-            
-            # Create workbook
-            wb = Workbook()
-            ws = wb.active
-            ws.title = "Extracted Data"
+        if not HAS_PYMUPDF:
+            return jsonify({"error": "PDF conversion requires PyMuPDF library"}), 501
+        
+        if wants_job_mode():
+            if output_format != 'xlsx':
+                return jsonify({"error": "Job mode only supports xlsx output"}), 400
+            return submit_job_response('pdf_to_excel', file, {"pages": page_range})
+        
+        metrics.record_engine('pymupdf')
+        
+        # CSV and JSON Lines stream rows to the client as pages finish
+        if output_format in TABLE_STREAM_FORMATS:
+            temp_path = uploads.claim(file)
+            try:
+                with open_pdf(temp_path) as doc:
+                    metrics.record_pages(len(select_pages(page_range, len(doc))))
+            except (EngineError, PageRangeError) as e:
+                return jsonify({"error": str(e)}), 400
             
-            current_row = 1
-            thin_border = Border(
-                left=Side(style='thin'),
-                right=Side(style='thin'),
-                top=Side(style='thin'),
-                bottom=Side(style='thin')
+            mimetype, download_name = TABLE_STREAM_FORMATS[output_format]
+            chunks = stream_extracted_rows(
+                temp_path, output_format, pages=page_range, parallel=not profiling.is_profiling()
             )
-            
-            # Extract tables from all pages
-            tables_found = False
-            for page_num in range(len(doc)):
-                page = doc[page_num]
-                
-                # Extract tables with proper structure
-                try:
-                    tables = page.find_tables()
-                    if tables.tables:
-                        tables_found = True
-                        for table_idx, table in enumerate(tables.tables):
-                            extracted_rows = table.extract()
-                            
-                            # Write header with page info
-                            if current_row > 1:
-                                current_row += 1  # Add space between tables
-                            
-                            # Write table rows with proper columns
-                            for row_idx, row_data in enumerate(extracted_rows):
-                                for col_idx, cell_value in enumerate(row_data):
-                                    cell = ws.cell(row=current_row, column=col_idx + 1)
-                                    # Clean up cell value
-                                    cell_text = str(cell_value).strip() if cell_value else ""
-                                    cell.value = cell_text
-                                    cell.alignment = Alignment(wrap_text=True, vertical='top', horizontal='left')
-                                    cell.border = thin_border
-                                    
-                                    # Format header row (usually first row)
-                                    if row_idx == 0:
-                                        cell.font = Font(bold=True, color="FFFFFF")
-                                        cell.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-                                
-                                current_row += 1
-                except Exception as e:
-                    print(f"Table extraction error on page {page_num + 1}: {str(e)}")
-            
-            # If no tables found, extract text as structured data
-            if not tables_found:
-                for page_num in range(len(doc)):
-                    page = doc[page_num]
-                    text = page.get_text()
-                    
-                    if text.strip():
-                        # Add page header
-                        if current_row > 1:
-                            current_row += 1
-                        
-                        cell = ws.cell(row=current_row, column=1)
-                        cell.value = f"Page {page_num + 1}"
-                        cell.font = Font(bold=True, size=11)
-                        cell.fill = PatternFill(start_color="E8E8E8", end_color="E8E8E8", fill_type="solid")
-                        current_row += 1
-                        
-                        # Parse lines into columns based on whitespace
-                        lines = text.split('\n')
-                        for line in lines:
-                            if line.strip():
-                                # Split by tabs or multiple spaces to identify columns
-                                if '\t' in line:
-                                    columns = line.split('\t')
-                                else:
-                                    # Split by 2+ spaces
-                                    columns = [col.strip() for col in line.split('  ') if col.strip()]
-                                
-                                # If no clear columns, use single column
-                                if not columns or len(columns) == 1:
-                                    columns = [line.strip()]
-                                
-                                # Write columns
-                                for col_idx, col_text in enumerate(columns[:15]):  # Max 15 columns
-                                    cell = ws.cell(row=current_row, column=col_idx + 1)
-                                    cell.value = col_text
-                                    cell.alignment = Alignment(wrap_text=True, vertical='top')
-                                    cell.border = thin_border
-                                
-                                current_row += 1
-            
-            # Auto-adjust column widths
-            for col_idx in range(1, 16):
-                col_letter = chr(64 + col_idx)
-                ws.column_dimensions[col_letter].width = 30
-            
-            # Close PDF document
-            doc.close()
-            
-            # Save to BytesIO
-            output = io.BytesIO()
-            wb.save(output)
-            output.seek(0)
-            
-            return send_file(
-                output,
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                as_attachment=True,
-                download_name='converted.xlsx'
+            response = Response(
+                stream_then_remove(chunks, temp_path),
+                mimetype=mimetype,
+                headers={"Content-Disposition": f"attachment; filename={download_name}"}
             )
-        else:
-            return jsonify({"error": "PDF conversion requires PyMuPDF library"}), 501
+            temp_path = None
+            return response
+        
+        output = io.BytesIO()
+        try:
+            convert_pdf_to_excel(
+                uploads.path(file), output, pages=page_range,
+                progress=lambda done, total: metrics.record_pages(done),
+                parallel=not profiling.is_profiling()
+            )
+        except (EngineError, PageRangeError) as e:
+            return jsonify({"error": str(e)}), 400
+        output.seek(0)
+        
+        return send_file(
+            output,
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            as_attachment=True,
+            download_name='converted.xlsx'
+        )
     
     except Exception as e:
         print(f"PDF to Excel error: {str(e)}")
+        metrics.record_error(e)
         return jsonify({"error": f"Failed to convert PDF to Excel: {str(e)}"}), 500
     
     finally:
-        # Clean up temp file
-        if temp_pdf and os.path.exists(temp_pdf.name):
-            try:
-                os.unlink(temp_pdf.name)
-            except:
-                pass
+        remove_file(temp_path)
 
 @app.route('/api/pdf/to-word', methods=['POST'])
+@cached_result('mode', 'pages', 'start', 'end')
+@offload.limited
 def pdf_to_word():
-    """Convert PDF to Word document"""
+    """Convert PDF, or selected pages of it, to Word document"""
+    temp_path = None
     try:
         if 'file' not in request.files:
             return jsonify({"error": "No file provided"}), 400
         
         file = request.files['file']
+        page_range = request.form.get('pages', '')  # e.g., "1-5,8,10-12"; empty means all pages
+        # 1-indexed and inclusive, used when pages is empty
+        start = request.form.get('start')
+        end = request.form.get('end')
         
         if not file or not allowed_file(file.filename):
             return jsonify({"error": "Invalid file"}), 400
         
-        # Save temporarily
-        temp_pdf = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-        file.save(temp_pdf.name)
-        temp_pdf.close()
+        if not HAS_PDF2DOCX and not HAS_PYMUPDF:
+            return jsonify({"error": "PDF conversion requires either pdf2docx or PyMuPDF library"}), 501
         
+        input_path = uploads.path(file)
         try:
-            # Try using pdf2docx if available
-            if HAS_PDF2DOCX:
-                temp_docx = tempfile.NamedTemporaryFile(delete=False, suffix='.docx')
-                temp_docx.close()
-                
-                # Convert PDF to DOCX
-                cv = Converter(temp_pdf.name)
-                cv.convert(temp_docx.name)
-                cv.close()
-                
-                # Read the converted file
-                with open(temp_docx.name, 'rb') as f:
-                    output = io.BytesIO(f.read())
-                
-                output.seek(0)
-                os.unlink(temp_docx.name)
-            
-            # Fallback to PyMuPDF text extraction + python-docx
-            elif HAS_PYMUPDF:
-                try:
-                    from docx import Document
-                    from docx.shared import Pt, RGBColor
-                    
-                    doc = fitz.open(temp_pdf.name)
-                    docx = Document()
-                    
-                    for page_num, page in enumerate(doc, 1):
-                        # Add page number heading
-                        heading = docx.add_heading(f'Page {page_num}', level=2)
-                        heading.runs[0].font.size = Pt(12)
-                        heading.runs[0].font.color.rgb = RGBColor(0, 0, 128)
-                        
-                        # Add text content
-                        text = page.get_text()
-                        for line in text.split('\n'):
-                            if line.strip():
-                                docx.add_paragraph(line)
-                    
-                    doc.close()
-                    
-                    output = io.BytesIO()
-                    docx.save(output)
-                    output.seek(0)
-                except ImportError:
-                    return jsonify({"error": "PDF to Word requires python-docx library"}), 501
-            else:
-                return jsonify({"error": "PDF conversion requires either pdf2docx or PyMuPDF library"}), 501
-        finally:
-            os.unlink(temp_pdf.name)
+            page_count = len(select_pages(page_range, count_pages(input_path), start, end))
+        except (EngineError, PageRangeError) as e:
+            return jsonify({"error": str(e)}), 400
         
-        return send_file(
-            output,
+        if wants_job_mode():
+            return submit_job_response('pdf_to_word', file, {"pages": page_range, "start": start, "end": end})
+        
+        try:
+            fd, temp_path = tempfile.mkstemp(suffix='.docx')
+            os.close(fd)
+            metrics.record_engine(word_engine())
+            # Pages are converted in the shared pool, in parallel chunks when there are enough;
+            # this server worker only waits and keeps answering light requests
+            convert_pdf_to_word(
+                input_path, temp_path, pages=page_range, start=start, end=end,
+                parallel=not profiling.is_profiling()
+            )
+            metrics.record_pages(page_count)
+        except MissingDependencyError as e:
+            return jsonify({"error": str(e)}), 501
+        
+        # Sent from the temp file, which is removed once the response is closed
+        response = send_file(
+            temp_path,
             mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document',
             as_attachment=True,
             download_name='converted.docx'
         )
+        cleanup_path = temp_path
+        # Close callbacks only run on responses werkzeug wraps itself
+        response.direct_passthrough = False
+        response.call_on_close(lambda: remove_file(cleanup_path))
+        temp_path = None
+        return response
     
     except Exception as e:
         print(f"PDF to Word error: {str(e)}")
+        metrics.record_error(e)
         return jsonify({"error": f"Failed to convert PDF to Word: {str(e)}"}), 500
+    
+    finally:
+        remove_file(temp_path)
 
 @app.route('/api/pdf/compress', methods=['POST'])
+@cached_result('profile')
+@offload.limited
 def compress_pdf():
-    """Compress PDF file"""
+    """Compress PDF file, downsampling images under the screen, ebook and print profiles"""
     if not HAS_PYMUPDF:
         return jsonify({"error": "Server missing required library (PyMuPDF). Please install it to use this feature."}), 501
+    spool_dir = None
     try:
         if 'file' not in request.files:
             return jsonify({"error": "No file provided"}), 400
         
         file = request.files['file']
+        profile = request.form.get('profile', 'lossless').lower()  # lossless, screen, ebook or print
         
         if not file or not allowed_file(file.filename):
             return jsonify({"error": "Invalid file"}), 400
         
-        # Save temporarily
-        temp_pdf = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-        file.save(temp_pdf.name)
-        temp_pdf.close()
+        if profile not in compress.PROFILES:
+            return jsonify({"error": f"Invalid profile. Supported profiles: {', '.join(compress.PROFILES)}"}), 400
         
-        # Open with PyMuPDF
-        doc = fitz.open(temp_pdf.name)
-        
-        # Compress
-        output = io.BytesIO()
-        doc.save(output, garbage=4, deflate=True, clean=True)
-        doc.close()
-        
-        output.seek(0)
-        os.unlink(temp_pdf.name)
+        metrics.record_engine('pymupdf')
+        spool_dir = tempfile.mkdtemp(prefix='compress-')
+        output_path = os.path.join(spool_dir, 'compressed.pdf')
         
-        return send_file(
-            output,
+        try:
+            report = compress.compress_pdf(uploads.path(file), output_path, profile, parallel=not profiling.is_profiling())
+        except EngineError as e:
+            return jsonify({"error": str(e)}), 400
+        print(f"Compressed with {profile}: {report['original_bytes']} -> {report['final_bytes']} bytes, "
+              f"stages {report['stages']}", flush=True)
+        
+        response = send_file(
+            output_path,
             mimetype='application/pdf',
             as_attachment=True,
             download_name='compressed.pdf'
         )
+        response.headers['X-Compression-Report'] = json.dumps(report, separators=(',', ':'))
+        cleanup_dir = spool_dir
+        # Close callbacks only run on responses werkzeug wraps itself
+        response.direct_passthrough = False
+        response.call_on_close(lambda: shutil.rmtree(cleanup_dir, ignore_errors=True))
+        spool_dir = None
+        return response
     
     except Exception as e:
+        metrics.record_error(e)
         return jsonify({"error": str(e)}), 500
+    
+    finally:
+        if spool_dir:
+            shutil.rmtree(spool_dir, ignore_errors=True)
 
 @app.route('/api/pdf/extract-text', methods=['POST'])
+@cached_result('engine', 'pages', 'format', 'mode')
+@offload.limited
 def extract_text():
-    """Extract text from PDF"""
+    """Extract text from PDF, as one JSON object or streamed NDJSON per page"""
+    temp_path = None
     try:
         if 'file' not in request.files:
             return jsonify({"error": "No file provided"}), 400
         
         file = request.files['file']
+        page_range = request.form.get('pages', '')  # e.g., "1-5,8,10-12"; empty means all pages
+        output_format = request.form.get('format', 'json').lower()  # json or ndjson
+        mode = request.form.get('mode', 'text').lower()  # text, words or blocks (ndjson only)
         
         if not file or not allowed_file(file.filename):
             return jsonify({"error": "Invalid file"}), 400
         
-        # Read PDF
-        pdf_reader = PyPDF2.PdfReader(io.BytesIO(file.read()))
+        if output_format not in ('json', 'ndjson'):
+            return jsonify({"error": "format must be 'json' or 'ndjson'"}), 400
+        
+        if mode not in text_extract.TEXT_MODES:
+            return jsonify({"error": f"Invalid mode. Supported modes: {', '.join(text_extract.TEXT_MODES)}"}), 400
         
-        # Extract text from all pages
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n\n"
+        if output_format == 'ndjson':
+            if not HAS_PYMUPDF:
+                return jsonify({"error": "Server missing required library (PyMuPDF). Please install it to use this feature."}), 501
+            metrics.record_engine('pymupdf')
+            
+            temp_path = uploads.claim(file)
+            try:
+                with open_pdf(temp_path) as doc:
+                    page_numbers = select_pages(page_range, len(doc))
+                    page_count = len(doc)
+            except (EngineError, PageRangeError) as e:
+                return jsonify({"error": str(e)}), 400
+            metrics.record_pages(len(page_numbers))
+            
+            # Pages are sent as they are extracted, in page order
+            chunks = text_extract.stream_page_text(
+                temp_path, page_numbers, mode, parallel=not profiling.is_profiling()
+            )
+            if search_index.SEARCH_INDEX_ENABLED and mode == 'text':
+                chunks = stream_then_index(chunks, search_index.content_hash(file), file.filename, page_count)
+            response = Response(
+                stream_then_remove(chunks, temp_path),
+                mimetype='application/x-ndjson'
+            )
+            temp_path = None
+            return response
+        
+        if mode != 'text':
+            return jsonify({"error": "mode=words and mode=blocks require format=ndjson"}), 400
+        
+        try:
+            page_texts = request_engine('extract_text').extract_page_texts(uploads.path(file), page_range)
+            metrics.record_pages(len(page_texts))
+        except (EngineError, PageRangeError) as e:
+            return jsonify({"error": str(e)}), 400
+        
+        if search_index.SEARCH_INDEX_ENABLED:
+            search_index.index_document(
+                search_index.content_hash(file), file.filename, 'text',
+                [(page_num + 1, text) for page_num, text in page_texts]
+            )
         
         return jsonify({
-            "text": text,
-            "pages": len(pdf_reader.pages)
+            "text": ''.join(text + "\n\n" for _, text in page_texts),
+            "pages": len(page_texts)
         })
     
     except Exception as e:
+        metrics.record_error(e)
         return jsonify({"error": str(e)}), 500
+    
+    finally:
+        remove_file(temp_path)
 
 @app.route('/api/pdf/info', methods=['POST'])
+@cached_result('engine')
 def pdf_info():
     """Get PDF information"""
     try:
@@ -561,34 +628,78 @@ def pdf_info():
         if not file or not allowed_file(file.filename):
             return jsonify({"error": "Invalid file"}), 400
         
-        # Read PDF
-        pdf_reader = PyPDF2.PdfReader(io.BytesIO(file.read()))
+        try:
+            info = request_engine('info').info(uploads.path(file))
+            metrics.record_pages(info["pages"])
+            return jsonify(info)
+        except EngineError as e:
+            return jsonify({"error": str(e)}), 400
+    
+    except Exception as e:
+        metrics.record_error(e)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/pdf/info/batch', methods=['POST'])
+@cached_result('engine', filenames=True)
+def pdf_info_batch():
+    """PDF information for many files as one JSON array, in upload order"""
+    try:
+        files = request.files.getlist('files')
         
-        info = {
-            "pages": len(pdf_reader.pages),
-            "encrypted": pdf_reader.is_encrypted,
-            "metadata": {}
-        }
+        if not files:
+            return jsonify({"error": "No files provided"}), 400
         
-        if pdf_reader.metadata:
-            info["metadata"] = {
-                "title": pdf_reader.metadata.get('/Title', 'N/A'),
-                "author": pdf_reader.metadata.get('/Author', 'N/A'),
-                "subject": pdf_reader.metadata.get('/Subject', 'N/A'),
-                "creator": pdf_reader.metadata.get('/Creator', 'N/A'),
-            }
+        if len(files) > batch.BATCH_MAX_FILES:
+            return jsonify({"error": f"Too many files. Maximum is {batch.BATCH_MAX_FILES}."}), 400
         
-        return jsonify(info)
+        try:
+            engine = request_engine('info')
+        except EngineError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        results = []
+        total_pages = 0
+        for file in files:
+            if not file or not allowed_file(file.filename):
+                results.append({"filename": file.filename if file else None, "error": "Invalid file"})
+                continue
+            try:
+                info = engine.info(uploads.path(file))
+                total_pages += info["pages"]
+                results.append({"filename": file.filename, **info})
+            except Exception as e:
+                # One unreadable file is reported in place without failing the rest
+                results.append({"filename": file.filename, "error": str(e)})
+        
+        metrics.record_pages(total_pages)
+        return jsonify(results)
     
     except Exception as e:
+        metrics.record_error(e)
         return jsonify({"error": str(e)}), 500
 
+def parse_watermark_options(form):
+    """Validated watermark opacity, angle and font size from request form fields"""
+    try:
+        opacity = float(form.get('opacity') or 1.0)
+        angle = float(form.get('angle') or 45)
+        font_size = float(form.get('font_size') or 48)
+    except ValueError:
+        raise ValueError("opacity, angle and font_size must be numbers")
+    if not 0 < opacity <= 1:
+        raise ValueError("opacity must be between 0 and 1")
+    if not 4 <= font_size <= 400:
+        raise ValueError("font_size must be between 4 and 400")
+    return {"opacity": opacity, "angle": angle, "font_size": font_size}
+
 @app.route('/api/pdf/add-watermark', methods=['POST'])
+@cached_result('text', 'opacity', 'angle', 'font_size')
+@offload.limited
 def add_watermark():
-    """Add text watermark to PDF with 45 degree rotation"""
+    """Add tiled text watermark to PDF, rotated 45 degrees by default"""
     if not HAS_PYMUPDF:
         return jsonify({"error": "Server missing required library (PyMuPDF). Please install it to use this feature."}), 501
-    temp_pdf = None
+    temp_path = None
     try:
         if 'file' not in request.files:
             return jsonify({"error": "No file provided"}), 400
@@ -599,172 +710,348 @@ def add_watermark():
         if not file or not allowed_file(file.filename):
             return jsonify({"error": "Invalid file"}), 400
         
-        # Save temporarily
-        temp_pdf = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-        file.save(temp_pdf.name)
-        temp_pdf.close()
-        
-        # Open with PyMuPDF
-        doc = fitz.open(temp_pdf.name)
-        
-        # Add watermark to each page
-        for page in doc:
-            # Get page dimensions
-            rect = page.rect
-            center_x = rect.width / 2
-            center_y = rect.height / 2
-            
-            # Create watermark text rotated 45 degrees
-            # Draw text in upper-left to lower-right diagonal pattern
-            import math
-            
-            # Calculate multiple diagonal lines to cover the page
-            angle = math.radians(45)
-            
-            # Text properties
-            font_size = 48
-            text_color = (0.7, 0.7, 0.7)  # Light gray
-            
-            # Draw multiple watermark texts diagonally across page
-            step = 200  # Distance between watermark repetitions
-            
-            # Start from upper left, go to lower right
-            for x_offset in range(-int(rect.width), int(rect.width) + 1, step):
-                for y_offset in range(-int(rect.height), int(rect.height) + 1, step):
-                    # Position on diagonal
-                    x = center_x + x_offset
-                    y = center_y + y_offset
-                    
-                    if 0 <= x <= rect.width and 0 <= y <= rect.height:
-                        # Use shape with text drawing
-                        shape = page.new_shape()
-                        shape.insert_text(
-                            fitz.Point(x - 80, y - 15),
-                            watermark_text,
-                            fontsize=font_size,
-                            color=text_color,
-                            fontname="helv"
-                        )
-                        shape.commit(overlay=False)
+        try:
+            options = parse_watermark_options(request.form)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
-        # Save to output
-        output = io.BytesIO()
-        doc.save(output)
-        doc.close()
+        try:
+            open_pdf(uploads.path(file)).close()
+        except EngineError as e:
+            return jsonify({"error": str(e)}), 400
         
-        output.seek(0)
+        # Add watermark to each page, in the shared pool
+        fd, temp_path = tempfile.mkstemp(suffix='.pdf')
+        os.close(fd)
+        offload.run(watermark_pdf_file, uploads.path(file), temp_path, watermark_text, **options)
         
-        return send_file(
-            output,
+        response = send_file(
+            temp_path,
             mimetype='application/pdf',
             as_attachment=True,
             download_name='watermarked.pdf'
         )
+        cleanup_path = temp_path
+        # Close callbacks only run on responses werkzeug wraps itself
+        response.direct_passthrough = False
+        response.call_on_close(lambda: remove_file(cleanup_path))
+        temp_path = None
+        return response
     
     except Exception as e:
         print(f"Watermark error: {str(e)}")
+        metrics.record_error(e)
         return jsonify({"error": f"Failed to add watermark: {str(e)}"}), 500
     
     finally:
-        # Clean up temp file
-        if temp_pdf and os.path.exists(temp_pdf.name):
-            try:
-                os.unlink(temp_pdf.name)
-            except:
-                pass
+        remove_file(temp_path)
 
 @app.route('/api/pdf/rotate', methods=['POST'])
+@cached_result('rotation', 'pages', 'engine')
+@offload.limited
 def rotate_pdf():
-    """Rotate PDF pages"""
+    """Rotate every page, or the pages named in a spec like "1-3:90,7:180" """
+    temp_path = None
     try:
         if 'file' not in request.files:
             return jsonify({"error": "No file provided"}), 400
         
         file = request.files['file']
-        rotation = int(request.form.get('rotation', 90))  # 90, 180, 270
+        pages = request.form.get('pages', '')  # e.g., "1-3:90,7:180"; parts without an angle use rotation
         
         if not file or not allowed_file(file.filename):
             return jsonify({"error": "Invalid file"}), 400
         
-        if rotation not in [90, 180, 270, -90]:
-            return jsonify({"error": "Rotation must be 90, 180, or 270 degrees"}), 400
+        try:
+            rotation = parse_rotation(request.form.get('rotation'))  # 90, 180, 270
+        except PageRangeError as e:
+            return jsonify({"error": str(e)}), 400
         
-        # Read PDF
-        pdf_reader = PyPDF2.PdfReader(io.BytesIO(file.read()))
-        pdf_writer = PyPDF2.PdfWriter()
+        fd, temp_path = tempfile.mkstemp(suffix='.pdf')
+        os.close(fd)
+        try:
+            request_engine('rotate').rotate(uploads.path(file), temp_path, rotation, pages)
+        except (PageRangeError, PasswordRequiredError, EngineError) as e:
+            return jsonify({"error": str(e)}), 400
         
-        # Rotate all pages
-        for page in pdf_reader.pages:
-            page.rotate(rotation)
-            pdf_writer.add_page(page)
+        response = send_file(
+            temp_path,
+            mimetype='application/pdf',
+            as_attachment=True,
+            download_name='rotated.pdf'
+        )
+        cleanup_path = temp_path
+        # Close callbacks only run on responses werkzeug wraps itself
+        response.direct_passthrough = False
+        response.call_on_close(lambda: remove_file(cleanup_path))
+        temp_path = None
+        return response
+    
+    except Exception as e:
+        metrics.record_error(e)
+        return jsonify({"error": str(e)}), 500
+    
+    finally:
+        remove_file(temp_path)
+
+METADATA_FIELDS = ('title', 'author', 'subject', 'keywords', 'creator', 'producer')
+
+@app.route('/api/pdf/metadata', methods=['POST'])
+@cached_result(*METADATA_FIELDS)
+def edit_metadata():
+    """Set document metadata fields; fields left out keep their current value"""
+    if not HAS_PYMUPDF:
+        return jsonify({"error": "Server missing required library (PyMuPDF). Please install it to use this feature."}), 501
+    temp_path = None
+    try:
+        if 'file' not in request.files:
+            return jsonify({"error": "No file provided"}), 400
         
-        # Create output
-        output = io.BytesIO()
-        pdf_writer.write(output)
-        output.seek(0)
+        file = request.files['file']
+        changes = {name: request.form[name] for name in METADATA_FIELDS if name in request.form}
         
-        return send_file(
-            output,
+        if not file or not allowed_file(file.filename):
+            return jsonify({"error": "Invalid file"}), 400
+        
+        if not changes:
+            return jsonify({"error": f"Provide at least one of: {', '.join(METADATA_FIELDS)}"}), 400
+        
+        def edit(doc):
+            doc.set_metadata({**doc.metadata, **changes})
+        
+        metrics.record_engine('pymupdf')
+        fd, temp_path = tempfile.mkstemp(suffix='.pdf')
+        os.close(fd)
+        try:
+            # Appends a new Info dictionary instead of rewriting the document
+            save_edited(uploads.path(file), temp_path, edit)
+        except PasswordRequiredError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        response = send_file(
+            temp_path,
             mimetype='application/pdf',
             as_attachment=True,
-            download_name='rotated.pdf'
+            download_name='edited.pdf'
         )
+        cleanup_path = temp_path
+        # Close callbacks only run on responses werkzeug wraps itself
+        response.direct_passthrough = False
+        response.call_on_close(lambda: remove_file(cleanup_path))
+        temp_path = None
+        return response
     
     except Exception as e:
+        metrics.record_error(e)
         return jsonify({"error": str(e)}), 500
+    
+    finally:
+        remove_file(temp_path)
 
 @app.route('/api/pdf/extract-images', methods=['POST'])
+@cached_result('format', 'image_format', 'min_width', 'min_height')
+@offload.limited
 def extract_images():
-    """Extract all images from PDF"""
+    """Extract each unique image once into a streamed ZIP, or list them as JSON"""
     if not HAS_PYMUPDF:
         return jsonify({"error": "Server missing required library (PyMuPDF). Please install it to use this feature."}), 501
+    temp_path = None
     try:
         if 'file' not in request.files:
             return jsonify({"error": "No file provided"}), 400
         
         file = request.files['file']
+        output_format = request.form.get('format', 'zip').lower()  # zip or json (metadata only)
+        image_format = request.form.get('image_format', 'original').lower()  # original, png or jpg
         
         if not file or not allowed_file(file.filename):
             return jsonify({"error": "Invalid file"}), 400
         
-        # Save temporarily
-        temp_pdf = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-        file.save(temp_pdf.name)
-        temp_pdf.close()
+        if output_format not in ('zip', 'json'):
+            return jsonify({"error": "format must be 'zip' or 'json'"}), 400
         
-        # Open with PyMuPDF
-        doc = fitz.open(temp_pdf.name)
+        if image_format not in image_extract.IMAGE_FORMATS:
+            return jsonify({"error": f"Invalid image_format. Supported formats: {', '.join(image_extract.IMAGE_FORMATS)}"}), 400
         
-        images = []
-        for page_num in range(len(doc)):
-            page = doc[page_num]
-            image_list = page.get_images()
-            
-            for img_index, img in enumerate(image_list):
-                xref = img[0]
-                base_image = doc.extract_image(xref)
-                images.append({
-                    "page": page_num + 1,
-                    "index": img_index + 1,
-                    "width": base_image["width"],
-                    "height": base_image["height"],
-                    "format": base_image["ext"]
-                })
-        
-        doc.close()
-        os.unlink(temp_pdf.name)
+        try:
+            min_width = int(request.form.get('min_width') or 0)
+            min_height = int(request.form.get('min_height') or 0)
+        except ValueError:
+            return jsonify({"error": "min_width and min_height must be whole numbers of pixels"}), 400
         
-        return jsonify({
-            "images": images,
-            "total": len(images)
-        })
+        metrics.record_engine('pymupdf')
+        temp_path = uploads.claim(file)
+        try:
+            doc = open_pdf(temp_path)
+        except EngineError as e:
+            return jsonify({"error": str(e)}), 400
+        with doc:
+            images, skipped = image_extract.unique_images(doc, min_width, min_height)
+            metrics.record_pages(len(doc))
+        
+        if output_format == 'json':
+            return jsonify({
+                "images": [
+                    {key: image[key] for key in ('xref', 'pages', 'width', 'height', 'colorspace', 'format')}
+                    for image in images
+                ],
+                "total": len(images),
+                "skipped_small": skipped
+            })
+        
+        response = Response(
+            image_extract.stream_images_zip(
+                temp_path, images, skipped, image_format, parallel=not profiling.is_profiling()
+            ),
+            mimetype='application/zip',
+            headers={"Content-Disposition": "attachment; filename=images.zip"}
+        )
+        temp_path = None
+        return response
+    
+    except Exception as e:
+        metrics.record_error(e)
+        return jsonify({"error": str(e)}), 500
+    
+    finally:
+        remove_file(temp_path)
+
+@app.route('/api/pdf/batch', methods=['POST'])
+@cached_result(
+    'operation', 'text', 'rotation', 'password', 'pages', 'opacity', 'angle', 'font_size', 'engine', 'profile',
+    filenames=True
+)
+@offload.limited
+def batch_process():
+    """Run one operation over many PDFs in parallel and stream back a ZIP"""
+    spool_dir = None
+    try:
+        if 'files' not in request.files:
+            return jsonify({"error": "No files provided"}), 400
+        
+        files = request.files.getlist('files')
+        operation = request.form.get('operation', '')
+        
+        if operation not in batch.BATCH_OPERATIONS:
+            return jsonify({"error": f"Invalid operation. Supported operations: {', '.join(batch.BATCH_OPERATIONS)}"}), 400
+        
+        if len(files) > batch.BATCH_MAX_FILES:
+            return jsonify({"error": f"Too many files. Maximum is {batch.BATCH_MAX_FILES}"}), 400
+        
+        if batch.BATCH_OPERATIONS[operation][2] and not HAS_PYMUPDF:
+            return jsonify({"error": "Server missing required library (PyMuPDF). Please install it to use this feature."}), 501
+        
+        params = {name: request.form.get(name, '') for name in ('text', 'rotation', 'password', 'pages', 'engine', 'profile')}
+        if params['engine']:
+            try:
+                get_engine('info', params['engine'])
+            except EngineError as e:
+                return jsonify({"error": str(e)}), 400
+        if operation == 'watermark':
+            try:
+                params.update(parse_watermark_options(request.form))
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+        if operation == 'rotate':
+            try:
+                params['rotation'] = parse_rotation(params['rotation'])
+            except PageRangeError as e:
+                return jsonify({"error": str(e)}), 400
+        
+        print(f"Batch {operation} on {len(files)} files...", flush=True)
+        
+        # Uploads move into the batch directory so pool workers can open them by path
+        spool_dir = tempfile.mkdtemp(prefix='batch-')
+        items = []
+        for idx, file in enumerate(files, 1):
+            if file and allowed_file(file.filename):
+                path = uploads.claim(file, os.path.join(spool_dir, f'input_{idx:05d}.pdf'))
+                items.append((file.filename, path))
+            else:
+                items.append((file.filename if file else '', None))
+        
+        response = Response(
+            batch.stream_batch(operation, items, params, spool_dir),
+            mimetype='application/zip',
+            headers={"Content-Disposition": "attachment; filename=batch_results.zip"}
+        )
+        spool_dir = None
+        return response
     
     except Exception as e:
+        print(f"Batch error: {str(e)}", flush=True)
+        metrics.record_error(e)
         return jsonify({"error": str(e)}), 500
+    
+    finally:
+        if spool_dir:
+            shutil.rmtree(spool_dir, ignore_errors=True)
+
+@app.route('/api/search', methods=['GET'])
+def search_documents():
+    """Ranked full-text search over pages indexed by extract-text and OCR"""
+    if not search_index.SEARCH_INDEX_ENABLED:
+        return jsonify({"error": "Search index is disabled. Set SEARCH_INDEX_ENABLED=1 to enable it."}), 501
+    
+    query = request.args.get('q', '')
+    syntax = request.args.get('syntax', 'plain')  # plain or fts (raw FTS5 query syntax)
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+        offset = max(int(request.args.get('offset', 0)), 0)
+    except ValueError:
+        return jsonify({"error": "limit and offset must be whole numbers"}), 400
+    
+    if syntax not in ('plain', 'fts'):
+        return jsonify({"error": "syntax must be 'plain' or 'fts'"}), 400
+    
+    try:
+        results = search_index.search(query, limit, offset, request.args.get('hash'), syntax)
+    except search_index.SearchQueryError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return jsonify({"query": query, "results": results})
+
+@app.route('/api/search/stats', methods=['GET'])
+def search_stats():
+    """Documents and pages in the search index"""
+    return jsonify(search_index.stats())
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Report status and page progress of a background conversion job"""
+    job = jobs.get_job(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(jobs.job_status(job))
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    """Download the output of a finished background job"""
+    job = jobs.get_job(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    
+    if job['status'] == 'failed':
+        return jsonify({"error": f"Job failed: {job['error']}"}), 500
+    
+    if job['status'] != 'done':
+        return jsonify({"error": "Job is not finished yet", "status": job['status']}), 409
+    
+    output_path, mimetype, download_name = jobs.job_output(job)
+    if not os.path.exists(output_path):
+        return jsonify({"error": "Job output has expired"}), 410
+    
+    return send_file(
+        output_path,
+        mimetype=mimetype,
+        as_attachment=True,
+        download_name=download_name
+    )
 
 @app.route('/api/ocr/gemini', methods=['POST'])
+@offload.limited
 def ocr_gemini():
-    """Extract text using Gemini Vision API"""
+    """Extract text using Gemini Vision API, skipping PDF pages that already have a text layer"""
     try:
         if 'file' not in request.files:
             return jsonify({"error": "No file provided"}), 400
@@ -772,8 +1059,9 @@ def ocr_gemini():
         file = request.files['file']
         # Try to get key from request first, then env
         api_key = request.form.get('api_key') or os.getenv('GEMINI_API_KEY')
+        force_ocr = request.form.get('force_ocr', '').lower() in ('1', 'true', 'yes')
         
-        if not api_key:
+        if not api_key and ocr.needs_api_key():
             return jsonify({"error": "Gemini API Key is required. Please add GEMINI_API_KEY to .env or provide it in the request."}), 400
             
         if not file or file.filename == '':
@@ -782,63 +1070,77 @@ def ocr_gemini():
         if not allowed_ocr_file(file.filename):
             return jsonify({"error": f"Invalid file format. Supported formats: {', '.join(ALLOWED_OCR_EXTENSIONS)}"}), 400
             
-        # Configure Gemini
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-1.5-flash')
+        doc_hash = search_index.content_hash(file) if search_index.SEARCH_INDEX_ENABLED else None
         
-        # Save temporarily
-        temp_path = os.path.join(tempfile.gettempdir(), secure_filename(file.filename))
-        file.save(temp_path)
+        model = ocr.get_ocr_model(api_key)
+        
+        temp_path = uploads.path(file)
         
         try:
-            # Verify file was saved correctly
-            if not os.path.exists(temp_path):
-                return jsonify({"error": "Failed to save uploaded file"}), 400
-            
             # Check file size
             file_size = os.path.getsize(temp_path)
             if file_size == 0:
                 return jsonify({"error": "Uploaded file is empty"}), 400
             
-            # Upload to Gemini
-            uploaded_file = genai.upload_file(temp_path)
-            
-            # Generate content with mime type awareness
-            prompt = "Extract all text from this document. Preserve the original formatting as much as possible. If there are tables, represent them with markdown tables. Do not include any introductory or concluding remarks, just the extracted text."
+            if allowed_file(file.filename) and HAS_PYMUPDF:
+                # Native text where the page has it; only image-only pages go to the model
+                try:
+                    pages, preprocess = ocr.ocr_pdf(
+                        temp_path, model, force_ocr, parallel=not profiling.is_profiling()
+                    )
+                except PasswordRequiredError as e:
+                    return jsonify({"error": str(e)}), 400
+                text = ocr.merge_pages(pages)
+                metrics.record_pages(len(pages))
+            else:
+                pages = None
+                text, preprocess = ocr.ocr_whole_file(temp_path, model)
             
-            response = model.generate_content([
-                prompt,
-                uploaded_file
-            ])
+            failed = [page for page in pages or [] if page.get('error')]
+            if failed and not text.strip():
+                return jsonify({"error": f"OCR processing failed: {failed[0]['error']}"}), 502
             
-            if not response.text:
+            if not text or not text.strip():
                 return jsonify({"error": "No text could be extracted from the document. The document may be empty or unreadable."}), 400
             
-            # Cleanup remote file
-            try:
-                uploaded_file.delete()
-            except Exception as cleanup_error:
-                print(f"Warning: Failed to cleanup remote file: {cleanup_error}")
-                pass
-                
-            return jsonify({
-                "text": response.text,
-            })
+            if doc_hash:
+                if pages is None:
+                    search_index.index_document(
+                        doc_hash, file.filename, 'ocr', [(search_index.WHOLE_DOCUMENT, text)]
+                    )
+                else:
+                    for source in ('text', 'ocr'):
+                        search_index.index_document(
+                            doc_hash, file.filename, source,
+                            [(page['page'], page['text']) for page in pages if page['source'] == source],
+                            len(pages)
+                        )
+            
+            metrics.record_ocr_preprocess(preprocess)
+            print(f"OCR preprocessing: {preprocess.input_bytes} -> {preprocess.output_bytes} bytes "
+                  f"in {preprocess.seconds:.2f}s ({dict(preprocess.modes)})", flush=True)
+            
+            result = {"text": text, "preprocess": preprocess.as_dict()}
+            if pages is not None:
+                result["pages"] = pages
+                result["ocr_pages"] = sum(1 for page in pages if page['source'] == 'ocr')
+                result["cached_pages"] = sum(1 for page in pages if page.get('cached'))
+                result["failed_pages"] = len(failed)
+            return jsonify(result)
             
         except Exception as e:
             error_message = str(e)
             print(f"OCR Error: {error_message}")
+            metrics.record_error(e)
             return jsonify({"error": f"OCR processing failed: {error_message}"}), 500
-        finally:
-            if os.path.exists(temp_path):
-                try:
-                    os.unlink(temp_path)
-                except Exception as cleanup_error:
-                    print(f"Warning: Failed to cleanup temp file: {cleanup_error}")
                 
     except Exception as e:
+        metrics.record_error(e)
         return jsonify({"error": str(e)}), 500
 
+# After every route so each endpoint gets its upload limit
+uploads.init_app(app)
+
 if __name__ == '__main__':
     print("🚀 PDF API Server starting...")
     print("📍 Running on http://localhost:5000")
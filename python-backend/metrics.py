@@ -0,0 +1,195 @@
+import os
+import shutil
+import tempfile
+import time
+
+from flask import Response, g, jsonify, request
+
+try:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST,
+        REGISTRY,
+        CollectorRegistry,
+        Counter,
+        Gauge,
+        Histogram,
+        generate_latest,
+    )
+    from prometheus_client.core import GaugeMetricFamily
+    from prometheus_client import multiprocess
+    HAS_PROMETHEUS = True
+except ImportError:
+    HAS_PROMETHEUS = False
+
+# Set by gunicorn.conf.py; each worker then writes its samples to mmap files
+# here and a scrape served by any worker sums them across all workers
+MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+
+# Conversions run from milliseconds (info) to minutes (large to-word)
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+if HAS_PROMETHEUS:
+    REQUEST_LATENCY = Histogram(
+        'pdf_request_duration_seconds', 'Request latency including streamed bodies',
+        ['route', 'method'], buckets=LATENCY_BUCKETS
+    )
+    REQUESTS = Counter('pdf_requests_total', 'Requests by response status', ['route', 'method', 'status'])
+    BYTES_IN = Counter('pdf_request_bytes_total', 'Request body bytes received', ['route'])
+    BYTES_OUT = Counter('pdf_response_bytes_total', 'Response body bytes sent', ['route'])
+    PAGES = Counter('pdf_pages_processed_total', 'PDF pages processed', ['route', 'engine'])
+    ENGINE_REQUESTS = Counter('pdf_engine_requests_total', 'Requests served by each PDF engine', ['route', 'engine'])
+    ERRORS = Counter('pdf_errors_total', 'Error responses by exception type or HTTP status', ['route', 'type'])
+    OCR_IMAGE_BYTES = Counter('pdf_ocr_image_bytes_total', 'OCR input bytes before and after preprocessing', ['stage'])
+    OCR_PREPROCESS_SECONDS = Counter('pdf_ocr_preprocess_seconds_total', 'Time spent rendering and compacting OCR images')
+    OCR_IMAGES = Counter('pdf_ocr_images_total', 'Images sent to OCR by preprocessing outcome', ['mode'])
+    IN_FLIGHT = Gauge('pdf_requests_in_flight', 'Requests currently being handled', multiprocess_mode='livesum')
+
+
+def record_engine(name):
+    """Note which PDF engine handled the current request"""
+    g.metrics_engine = name
+
+
+def record_pages(count):
+    """Note how many pages the current request processed; the last call wins"""
+    g.metrics_pages = count
+
+
+def record_error(error):
+    """Label the current request's error response with the exception type"""
+    g.metrics_error = type(error).__name__
+
+
+def record_ocr_preprocess(stats):
+    """Count the bytes OCR preprocessing saved and the time it took"""
+    if not HAS_PROMETHEUS:
+        return
+    OCR_IMAGE_BYTES.labels('original').inc(stats.input_bytes)
+    OCR_IMAGE_BYTES.labels('sent').inc(stats.output_bytes)
+    OCR_PREPROCESS_SECONDS.inc(stats.seconds)
+    for mode, count in stats.modes.items():
+        OCR_IMAGES.labels(mode).inc(count)
+
+
+def _route():
+    # The URL rule, not the path, so job ids and bad URLs can't explode the label set
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+def _count_bytes(chunks, counter):
+    for chunk in chunks:
+        counter.inc(len(chunk))
+        yield chunk
+
+
+def _before_request():
+    g.metrics_start = time.perf_counter()
+    IN_FLIGHT.inc()
+
+
+def _after_request(response):
+    route = _route()
+    method = request.method
+    status = response.status_code
+    start = g.metrics_start
+    engine = g.get('metrics_engine')
+    pages = g.get('metrics_pages')
+    error = g.get('metrics_error')
+
+    if request.content_length:
+        BYTES_IN.labels(route).inc(request.content_length)
+    # werkzeug skips close callbacks on passthrough (send_file) responses
+    response.direct_passthrough = False
+    if response.is_streamed:
+        # Generators do their work while being sent; count bytes as they go out
+        response.response = _count_bytes(response.response, BYTES_OUT.labels(route))
+    elif response.content_length:
+        BYTES_OUT.labels(route).inc(response.content_length)
+
+    def finish():
+        # Runs when the server closes the response, after any streamed body
+        REQUEST_LATENCY.labels(route, method).observe(time.perf_counter() - start)
+        REQUESTS.labels(route, method, str(status)).inc()
+        if engine:
+            ENGINE_REQUESTS.labels(route, engine).inc()
+        if pages:
+            PAGES.labels(route, engine or 'unknown').inc(pages)
+        if error or status >= 400:
+            ERRORS.labels(route, error or f'http_{status}').inc()
+        IN_FLIGHT.dec()
+
+    response.call_on_close(finish)
+    g.metrics_done = True
+    return response
+
+
+def _teardown_request(exc):
+    # after_request is skipped when a view raises; account for the request here
+    if 'metrics_start' not in g or g.get('metrics_done'):
+        return
+    route = _route()
+    REQUEST_LATENCY.labels(route, request.method).observe(time.perf_counter() - g.metrics_start)
+    REQUESTS.labels(route, request.method, '500').inc()
+    ERRORS.labels(route, type(exc).__name__ if exc else 'http_500').inc()
+    IN_FLIGHT.dec()
+
+
+def _dir_bytes(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class _TempDiskCollector:
+    """Disk usage of the server's spool directories, measured at scrape time"""
+
+    def __init__(self, directories):
+        self.directories = directories
+
+    def collect(self):
+        used = GaugeMetricFamily('pdf_temp_dir_bytes', 'Bytes stored in a spool directory', labels=['dir'])
+        for name, path in self.directories.items():
+            used.add_metric([name], _dir_bytes(path))
+        yield used
+
+        usage = shutil.disk_usage(tempfile.gettempdir())
+        yield GaugeMetricFamily('pdf_temp_disk_free_bytes', 'Free space on the temp filesystem', value=usage.free)
+        yield GaugeMetricFamily('pdf_temp_disk_total_bytes', 'Size of the temp filesystem', value=usage.total)
+
+
+def init_app(app, temp_dirs):
+    """Install the request hooks and the /api/metrics endpoint.
+
+    temp_dirs maps a label to a spool directory whose size is reported.
+    Without prometheus_client the hooks are skipped and /api/metrics
+    answers 501.
+    """
+    if not HAS_PROMETHEUS:
+        @app.route('/api/metrics', methods=['GET'])
+        def metrics_unavailable():
+            return jsonify({"error": "Server missing required library (prometheus_client). Please install it to use this feature."}), 501
+        return
+
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+
+    disk_collector = _TempDiskCollector(temp_dirs)
+    if not MULTIPROC_DIR:
+        REGISTRY.register(disk_collector)
+
+    @app.route('/api/metrics', methods=['GET'])
+    def metrics():
+        """Prometheus text exposition of request, page, engine and disk metrics"""
+        if MULTIPROC_DIR:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+            registry.register(disk_collector)
+        else:
+            registry = REGISTRY
+        return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
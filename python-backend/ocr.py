@@ -0,0 +1,325 @@
+import base64
+import collections
+import hashlib
+import http.client
+import json
+import mimetypes
+import os
+import queue
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, urlsplit
+
+import ocr_preprocess
+from lazy_imports import optional_module
+from pdf_ops import PasswordRequiredError
+from result_cache import ResultCache
+
+fitz, HAS_PYMUPDF = optional_module('fitz')  # PyMuPDF
+
+# gemini, or stub to run without network access or an API key
+OCR_BACKEND = os.getenv('OCR_BACKEND', 'gemini').lower()
+OCR_MODEL_NAME = os.getenv('OCR_MODEL', 'gemini-1.5-flash')
+# Point at a fake model server to test the Gemini path offline
+OCR_API_BASE = os.getenv('OCR_API_BASE', 'https://generativelanguage.googleapis.com')
+OCR_TIMEOUT_SECONDS = float(os.getenv('OCR_TIMEOUT_SECONDS', 120))
+# A page whose text layer has at least this many non-space characters is not sent to the model
+OCR_MIN_TEXT_CHARS = int(os.getenv('OCR_MIN_TEXT_CHARS', 32))
+OCR_STUB_TEXT = os.getenv('OCR_STUB_TEXT', 'stub OCR text')
+
+# Model calls in flight per server worker, across all requests
+OCR_CONCURRENCY = int(os.getenv('OCR_CONCURRENCY', 8))
+# Token bucket per API key
+OCR_RATE_PER_SECOND = float(os.getenv('OCR_RATE_PER_SECOND', 4))
+OCR_BURST = int(os.getenv('OCR_BURST', 8))
+OCR_MAX_RETRIES = int(os.getenv('OCR_MAX_RETRIES', 5))
+OCR_BACKOFF_SECONDS = float(os.getenv('OCR_BACKOFF_SECONDS', 1.0))
+OCR_BACKOFF_MAX_SECONDS = 30.0
+
+OCR_CACHE_ENABLED = os.getenv('OCR_CACHE_ENABLED', '1') not in ('0', 'false', 'False', '')
+OCR_CACHE_DIR = os.getenv('OCR_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'pdf-ocr-cache'))
+OCR_CACHE_MAX_BYTES = int(os.getenv('OCR_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+PROMPT = "Extract all text from this document. Preserve the original formatting as much as possible. If there are tables, represent them with markdown tables. Do not include any introductory or concluding remarks, just the extracted text."
+
+# Worth retrying: rate limited or the service is briefly unavailable
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class OcrModelError(RuntimeError):
+    """Raised when the model rejects a request or keeps failing after retries"""
+
+
+class TokenBucket:
+    """Blocking rate limiter: `rate` tokens per second, up to `burst` saved up"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class GeminiOcrModel:
+    """Gemini generateContent over REST, with keep-alive connections.
+
+    One instance per API key is shared by every request, so its rate limit
+    and connections are shared too.
+    """
+
+    def __init__(self, api_key):
+        self.api_key = api_key
+        self.cache_namespace = f'gemini:{OCR_MODEL_NAME}'
+        self.limiter = TokenBucket(OCR_RATE_PER_SECOND, OCR_BURST)
+        base = urlsplit(OCR_API_BASE)
+        self._https = base.scheme == 'https'
+        self._host = base.netloc
+        self._path = f"{base.path.rstrip('/')}/v1beta/models/{quote(OCR_MODEL_NAME)}:generateContent"
+        self._idle = queue.LifoQueue()
+
+    def _connection(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            connection_class = http.client.HTTPSConnection if self._https else http.client.HTTPConnection
+            return connection_class(self._host, timeout=OCR_TIMEOUT_SECONDS)
+
+    def _post(self, body):
+        """(status, headers, payload) of one generateContent call"""
+        conn = self._connection()
+        try:
+            conn.request('POST', self._path, body=body, headers={
+                'Content-Type': 'application/json',
+                'x-goog-api-key': self.api_key,
+            })
+            response = conn.getresponse()
+            payload = response.read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            raise
+        self._idle.put(conn)
+        return response.status, response.headers, payload
+
+    def ocr_image(self, data, mime_type):
+        body = json.dumps({
+            "contents": [{"parts": [
+                {"text": PROMPT},
+                {"inline_data": {"mime_type": mime_type, "data": base64.b64encode(data).decode('ascii')}},
+            ]}]
+        })
+        for attempt in range(OCR_MAX_RETRIES + 1):
+            self.limiter.acquire()
+            try:
+                status, headers, payload = self._post(body)
+            except (OSError, http.client.HTTPException) as e:
+                status, headers, payload = None, {}, str(e).encode()
+            if status == 200:
+                return _response_text(payload)
+            if status is not None and status not in RETRY_STATUSES:
+                raise OcrModelError(f"Model request failed ({status}): {_error_message(payload)}")
+            if attempt == OCR_MAX_RETRIES:
+                break
+            time.sleep(_backoff(attempt, headers.get('Retry-After')))
+        raise OcrModelError(f"Model request failed after {OCR_MAX_RETRIES + 1} attempts ({status}): {_error_message(payload)}")
+
+
+def _backoff(attempt, retry_after=None):
+    """Seconds to wait before retry `attempt`; the server's Retry-After wins"""
+    if retry_after:
+        try:
+            return min(float(retry_after), OCR_BACKOFF_MAX_SECONDS)
+        except ValueError:
+            pass
+    delay = min(OCR_BACKOFF_SECONDS * 2 ** attempt, OCR_BACKOFF_MAX_SECONDS)
+    # Full jitter so concurrent pages don't retry in lockstep
+    return random.uniform(delay / 2, delay)
+
+
+def _response_text(payload):
+    result = json.loads(payload)
+    candidates = result.get('candidates') or []
+    if not candidates:
+        reason = (result.get('promptFeedback') or {}).get('blockReason')
+        if reason:
+            raise OcrModelError(f"Model blocked the request: {reason}")
+        return ''
+    parts = (candidates[0].get('content') or {}).get('parts') or []
+    return ''.join(part.get('text', '') for part in parts)
+
+
+def _error_message(payload):
+    try:
+        return json.loads(payload)['error']['message']
+    except (ValueError, KeyError, TypeError):
+        return payload[:200].decode('utf-8', 'replace')
+
+
+class StubOcrModel:
+    """Offline stand-in that returns OCR_STUB_TEXT and counts the images it was sent"""
+
+    cache_namespace = 'stub'
+
+    def __init__(self, api_key=None):
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def ocr_image(self, data, mime_type):
+        with self._lock:
+            self.calls += 1
+        return OCR_STUB_TEXT
+
+
+OCR_MODELS = {
+    'gemini': GeminiOcrModel,
+    'stub': StubOcrModel,
+}
+
+_models = {}
+_models_lock = threading.Lock()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+cache = ResultCache(OCR_CACHE_DIR, OCR_CACHE_MAX_BYTES)
+
+
+def needs_api_key():
+    return OCR_BACKEND == 'gemini'
+
+
+def get_ocr_model(api_key=None):
+    """Shared model client for this backend and API key"""
+    if OCR_BACKEND not in OCR_MODELS:
+        raise ValueError(f"Unknown OCR backend: {OCR_BACKEND}. Available backends: {', '.join(OCR_MODELS)}")
+    key = (OCR_BACKEND, api_key)
+    with _models_lock:
+        if key not in _models:
+            _models[key] = OCR_MODELS[OCR_BACKEND](api_key)
+        return _models[key]
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=OCR_CONCURRENCY, thread_name_prefix='ocr')
+        return _pool
+
+
+def cached_ocr(model, data, mime_type):
+    """(text, cache hit) for one image, served from the OCR cache when this exact image was seen"""
+    if not OCR_CACHE_ENABLED:
+        return model.ocr_image(data, mime_type), False
+    digest = hashlib.sha256()
+    digest.update(f'{model.cache_namespace}\0{mime_type}\0{PROMPT}\0'.encode())
+    digest.update(data)
+    key = digest.hexdigest()
+
+    entry = cache.get(key)
+    if entry:
+        with open(entry[0], encoding='utf-8') as f:
+            return f.read(), True
+
+    text = model.ocr_image(data, mime_type) or ''
+    writer = cache.open_writer()
+    try:
+        writer.write(text.encode('utf-8'))
+        writer.close()
+        cache.commit(key, writer.name, {"mimetype": 'text/plain', "download_name": None})
+    except OSError as e:
+        print(f"OCR cache write failed: {e}", flush=True)
+        writer.close()
+        if os.path.exists(writer.name):
+            os.unlink(writer.name)
+    return text, False
+
+
+def usable_text(page):
+    """The page's text layer, or None when it is too sparse to skip OCR"""
+    text = page.get_text()
+    if len(''.join(text.split())) < OCR_MIN_TEXT_CHARS:
+        return None
+    return text
+
+
+def _collect(result, future):
+    try:
+        result["text"], result["cached"] = future.result()
+    except Exception as e:
+        # One failed page should not throw away the rest of the document
+        result["text"], result["cached"] = '', False
+        result["error"] = str(e)
+
+
+def ocr_pdf(pdf_path, model, force_ocr=False, parallel=True):
+    """(per-page text of a PDF in page order, preprocessing stats).
+
+    Pages with a usable text layer are returned as-is with source "text".
+    The rest are rendered and compacted in the shared offload pool, then sent
+    to the model concurrently, with source "ocr". Rendering stays a few pages
+    ahead of the oldest call still in flight so images don't pile up in memory.
+    With parallel=False pages are rendered in this process.
+    """
+    pages = []
+    with fitz.open(pdf_path) as doc:
+        if doc.needs_pass:
+            raise PasswordRequiredError("PDF is password protected. Please unlock it first.")
+        for page in doc:
+            text = None if force_ocr else usable_text(page)
+            if text is not None:
+                pages.append({"page": page.number + 1, "source": "text", "text": text})
+            else:
+                pages.append({"page": page.number + 1, "source": "ocr"})
+
+    stats = ocr_preprocess.PreprocessStats(os.path.getsize(pdf_path))
+    ocr_numbers = [page["page"] - 1 for page in pages if page["source"] == "ocr"]
+    prepared = ocr_preprocess.prepare_pages(pdf_path, ocr_numbers, OCR_CONCURRENCY, parallel)
+    in_flight = collections.deque()
+    pool = _get_pool()
+    try:
+        for page_num, data, mime_type, mode, seconds in prepared:
+            stats.add(data, mode, seconds)
+            if len(in_flight) >= OCR_CONCURRENCY:
+                _collect(*in_flight.popleft())
+            in_flight.append((pages[page_num], pool.submit(cached_ocr, model, data, mime_type)))
+        while in_flight:
+            _collect(*in_flight.popleft())
+    finally:
+        prepared.close()
+        for _, future in in_flight:
+            future.cancel()
+    return pages, stats
+
+
+def ocr_whole_file(path, model):
+    """(text, preprocessing stats) of an image, or of a PDF sent to the model as one file"""
+    mime_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    with open(path, 'rb') as f:
+        data = f.read()
+    stats = ocr_preprocess.PreprocessStats(len(data))
+    if mime_type.startswith('image/'):
+        data, mime_type, mode, seconds = ocr_preprocess.prepare_image(data, mime_type)
+    else:
+        mode, seconds = 'original', 0.0
+    stats.add(data, mode, seconds)
+    return cached_ocr(model, data, mime_type)[0], stats
+
+
+def merge_pages(pages):
+    return '\n\n'.join(page['text'].strip() for page in pages if page['text'].strip())
@@ -0,0 +1,139 @@
+import collections
+import os
+import time
+
+import offload
+from lazy_imports import optional_module
+from pdf_ops import is_colourful, midtone_fraction, threshold_pixmap
+
+fitz, HAS_PYMUPDF = optional_module('fitz')  # PyMuPDF
+
+# Set to 0 to send full-colour PNG renders and untouched image uploads
+OCR_PREPROCESS = os.getenv('OCR_PREPROCESS', '1') not in ('0', 'false', 'False', '')
+OCR_TARGET_DPI = int(os.getenv('OCR_TARGET_DPI', os.getenv('OCR_RENDER_DPI', 200)))
+OCR_JPEG_QUALITY = int(os.getenv('OCR_JPEG_QUALITY', 80))
+# Pages with fewer mid-grey pixels than this fraction are sent as black and white
+OCR_BILEVEL_MAX_MIDTONES = float(os.getenv('OCR_BILEVEL_MAX_MIDTONES', 0.05))
+# Set to 1 to render in the calling thread instead of the shared offload pool
+OCR_PREPROCESS_WORKERS = int(os.getenv('OCR_PREPROCESS_WORKERS', offload.OFFLOAD_WORKERS))
+
+# Uploaded images carry no page size; assume the long side of an A4 page
+ASSUMED_PAGE_INCHES = 11.7
+
+def _compact(pix):
+    """(bytes, mimetype, mode) of the smallest encoding that keeps what OCR needs.
+
+    Colour stays colour as JPEG. Otherwise the page is reduced to greyscale,
+    and to pure black and white when there are few mid-tones; bilevel pages
+    are PNG, greyscale pages whichever of PNG and JPEG is smaller.
+    """
+    if pix.alpha:
+        pix = fitz.Pixmap(pix, 0)
+    if pix.n >= 3:
+        if pix.colorspace.n != 3:
+            pix = fitz.Pixmap(fitz.csRGB, pix)
+        if is_colourful(pix):
+            return pix.tobytes('jpg', jpg_quality=OCR_JPEG_QUALITY), 'image/jpeg', 'color'
+        pix = fitz.Pixmap(fitz.csGRAY, pix)
+
+    if midtone_fraction(pix) <= OCR_BILEVEL_MAX_MIDTONES:
+        return threshold_pixmap(pix).tobytes('png'), 'image/png', 'bilevel'
+
+    png = pix.tobytes('png')
+    jpeg = pix.tobytes('jpg', jpg_quality=OCR_JPEG_QUALITY)
+    if len(jpeg) < len(png):
+        return jpeg, 'image/jpeg', 'gray'
+    return png, 'image/png', 'gray'
+
+
+def prepare_page(pdf_path, page_num):
+    """Pool worker: render one page at OCR_TARGET_DPI and compact it"""
+    started = time.perf_counter()
+    with fitz.open(pdf_path) as doc:
+        pix = doc[page_num].get_pixmap(dpi=OCR_TARGET_DPI, alpha=False)
+    if OCR_PREPROCESS:
+        data, mime_type, mode = _compact(pix)
+    else:
+        data, mime_type, mode = pix.tobytes('png'), 'image/png', 'original'
+    return data, mime_type, mode, time.perf_counter() - started
+
+
+def prepare_image(data, mime_type):
+    """Downscale and compact an uploaded image; the original is kept if that doesn't help"""
+    started = time.perf_counter()
+    if not OCR_PREPROCESS or not HAS_PYMUPDF:
+        return data, mime_type, 'original', time.perf_counter() - started
+    try:
+        pix = fitz.Pixmap(data)
+    except Exception:
+        # Formats MuPDF can't decode go to the model as they are
+        return data, mime_type, 'original', time.perf_counter() - started
+
+    # Use the image's own DPI when it has one, else assume it spans a page
+    max_side = OCR_TARGET_DPI * ASSUMED_PAGE_INCHES
+    scale = min(1.0, max_side / max(pix.width, pix.height))
+    if pix.xres > 72:
+        scale = min(scale, OCR_TARGET_DPI / pix.xres)
+    if scale < 1.0:
+        pix = fitz.Pixmap(pix, max(1, int(pix.width * scale)), max(1, int(pix.height * scale)))
+
+    compact, compact_mime, mode = _compact(pix)
+    if len(compact) >= len(data):
+        return data, mime_type, 'original', time.perf_counter() - started
+    return compact, compact_mime, mode, time.perf_counter() - started
+
+
+def prepare_pages(pdf_path, page_numbers, window, parallel=True):
+    """Yield (page_num, data, mimetype, mode, seconds) in page order.
+
+    Pages are rendered in the shared offload pool, at most `window` pages
+    ahead of the consumer. With parallel=False they are rendered in this
+    process.
+    """
+    if not parallel or len(page_numbers) <= 1 or OCR_PREPROCESS_WORKERS <= 1:
+        for page_num in page_numbers:
+            yield (page_num, *prepare_page(pdf_path, page_num))
+        return
+
+    pending = collections.deque()
+    remaining = iter(page_numbers)
+    try:
+        for page_num in remaining:
+            pending.append((page_num, offload.submit(prepare_page, pdf_path, page_num)))
+            if len(pending) >= window:
+                break
+        while pending:
+            page_num, future = pending.popleft()
+            result = future.result()
+            next_page = next(remaining, None)
+            if next_page is not None:
+                pending.append((next_page, offload.submit(prepare_page, pdf_path, next_page)))
+            yield (page_num, *result)
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+
+class PreprocessStats:
+    """Bytes and time spent preparing one request's images"""
+
+    def __init__(self, input_bytes):
+        # What the model would have been sent without preprocessing: the upload itself
+        self.input_bytes = input_bytes
+        self.output_bytes = 0
+        self.seconds = 0.0
+        self.modes = collections.Counter()
+
+    def add(self, data, mode, seconds):
+        self.output_bytes += len(data)
+        self.seconds += seconds
+        self.modes[mode] += 1
+
+    def as_dict(self):
+        return {
+            "input_bytes": self.input_bytes,
+            "output_bytes": self.output_bytes,
+            "saved_bytes": self.input_bytes - self.output_bytes,
+            "seconds": round(self.seconds, 4),
+            "modes": dict(self.modes),
+        }
@@ -0,0 +1,206 @@
+import functools
+import math
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import jsonify, make_response, request
+
+import profiling
+
+# Set to 0 to run heavy endpoints unlimited and in the request thread, e.g. for a baseline load test
+OFFLOAD_ENABLED = os.getenv('OFFLOAD_ENABLED', '1') not in ('0', 'false', 'False', '')
+OFFLOAD_WORKERS = int(os.getenv('OFFLOAD_WORKERS', os.cpu_count() or 2))
+# A queued request waiting longer than this for a slot gives up with 429
+OFFLOAD_QUEUE_TIMEOUT_SECONDS = float(os.getenv('OFFLOAD_QUEUE_TIMEOUT_SECONDS', 30))
+
+# endpoint -> (requests running at once, requests allowed to wait for a slot), per server worker.
+# OFFLOAD_CONCURRENCY_<ENDPOINT> and OFFLOAD_QUEUE_<ENDPOINT> override one endpoint.
+ENDPOINT_LIMITS = {
+    'pdf_to_word': (2, 4),
+    'pdf_to_excel': (2, 4),
+    'compress_pdf': (2, 4),
+    'batch_process': (1, 2),
+    'ocr_gemini': (2, 4),
+    'merge_pdfs': (4, 8),
+    'split_pdf': (4, 8),
+    'add_watermark': (4, 8),
+    'extract_images': (4, 8),
+    'extract_text': (4, 8),
+    'unlock_pdf': (4, 8),
+    'rotate_pdf': (4, 8),
+}
+
+# Weight of the latest request in the running average of slot hold time
+HOLD_TIME_SMOOTHING = 0.2
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=OFFLOAD_WORKERS)
+        return _pool
+
+
+def _replace_pool(broken):
+    global _pool
+    with _pool_lock:
+        # A concurrent caller may already have replaced it
+        if _pool is broken:
+            _pool.shutdown(wait=False)
+            _pool = None
+
+
+def _reset_pool():
+    # A forked child inherits the pool object but not its manager thread;
+    # submitting to it would wait forever, so the child starts its own on first use
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_pool)
+
+
+def submit(fn, *args, **kwargs):
+    """Queue fn on the shared process pool and return its future.
+
+    Every module that fans work out across processes submits here, so a
+    server worker runs at most OFFLOAD_WORKERS of them whichever endpoints
+    are busy. A pool broken by a crashed worker is replaced on the next
+    submit.
+    """
+    pool = _get_pool()
+    try:
+        return pool.submit(fn, *args, **kwargs)
+    except RuntimeError:
+        # BrokenProcessPool, or shut down by a concurrent replacement; retry once
+        _replace_pool(pool)
+        return _get_pool().submit(fn, *args, **kwargs)
+
+
+def run(fn, *args, **kwargs):
+    """Call fn in the shared process pool and wait for its result.
+
+    The request thread sleeps instead of holding the GIL, so light requests
+    on the same server worker keep being answered. fn and its arguments
+    must pickle. Profiled requests run fn in-process so the profile sees it.
+    """
+    if not OFFLOAD_ENABLED or profiling.is_profiling():
+        return fn(*args, **kwargs)
+    return submit(fn, *args, **kwargs).result()
+
+
+class EndpointLimiter:
+    """Running slots plus a bounded wait list for one endpoint"""
+
+    def __init__(self, concurrency, queue):
+        self.concurrency = max(1, concurrency)
+        self.queue = max(0, queue)
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        self._lock = threading.Lock()
+        self._admitted = 0
+        self._hold_seconds = None
+
+    def admit(self):
+        """Take a place running or waiting; False when both are full"""
+        with self._lock:
+            if self._admitted >= self.concurrency + self.queue:
+                return False
+            self._admitted += 1
+            return True
+
+    def acquire(self, timeout):
+        if self._slots.acquire(timeout=timeout):
+            return True
+        self._leave()
+        return False
+
+    def release(self, held_seconds):
+        with self._lock:
+            if self._hold_seconds is None:
+                self._hold_seconds = held_seconds
+            else:
+                self._hold_seconds += HOLD_TIME_SMOOTHING * (held_seconds - self._hold_seconds)
+        self._slots.release()
+        self._leave()
+
+    def _leave(self):
+        with self._lock:
+            self._admitted -= 1
+
+    def retry_after(self):
+        """Whole seconds until a slot is likely free, from the average hold time and the wait list"""
+        with self._lock:
+            if self._hold_seconds is None:
+                return 1
+            waiting = max(0, self._admitted - self.concurrency)
+            return max(1, math.ceil(self._hold_seconds * (waiting + 1) / self.concurrency))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "concurrency": self.concurrency,
+                "queue": self.queue,
+                "running": min(self._admitted, self.concurrency),
+                "waiting": max(0, self._admitted - self.concurrency),
+                "average_seconds": round(self._hold_seconds, 3) if self._hold_seconds is not None else None,
+            }
+
+
+def _limiter_for(endpoint, concurrency, queue):
+    name = endpoint.upper()
+    return EndpointLimiter(
+        int(os.getenv(f'OFFLOAD_CONCURRENCY_{name}', concurrency)),
+        int(os.getenv(f'OFFLOAD_QUEUE_{name}', queue)),
+    )
+
+
+limiters = {endpoint: _limiter_for(endpoint, *limits) for endpoint, limits in ENDPOINT_LIMITS.items()}
+
+
+def _busy(limiter):
+    response = jsonify({"error": "Server is busy with this operation. Please retry shortly."})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(limiter.retry_after())
+    return response
+
+
+def limited(view):
+    """Hold one of the endpoint's slots while the view runs and its response is sent.
+
+    When every slot and wait-list place is taken the request is answered
+    429 with Retry-After at once instead of piling up.
+    Place it under cached_result so cache hits don't take a slot.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        limiter = limiters.get(request.endpoint)
+        if not OFFLOAD_ENABLED or limiter is None:
+            return view(*args, **kwargs)
+        if not limiter.admit():
+            return _busy(limiter)
+        if not limiter.acquire(OFFLOAD_QUEUE_TIMEOUT_SECONDS):
+            return _busy(limiter)
+
+        started = time.monotonic()
+        try:
+            response = make_response(view(*args, **kwargs))
+        except BaseException:
+            limiter.release(time.monotonic() - started)
+            raise
+        # Streamed bodies do their work while being sent, so the slot is freed on close;
+        # close callbacks only run on responses werkzeug wraps itself
+        response.direct_passthrough = False
+        response.call_on_close(lambda: limiter.release(time.monotonic() - started))
+        return response
+    return wrapper
+
+
+def stats():
+    return {endpoint: limiter.stats() for endpoint, limiter in limiters.items()}
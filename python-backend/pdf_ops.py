@@ -0,0 +1,235 @@
+import math
+import os
+import shutil
+
+from lazy_imports import optional_module
+
+fitz, HAS_PYMUPDF = optional_module('fitz')  # PyMuPDF
+
+
+# A pixel counts as coloured when its channels differ by more than this
+COLOUR_SPREAD = 32
+COLOUR_MIN_FRACTION = 0.01
+THUMBNAIL_WIDTH = 128
+
+_MIDTONES = bytes(1 if 64 <= v < 192 else 0 for v in range(256))
+_THRESHOLD = bytes(255 if v >= 128 else 0 for v in range(256))
+
+
+class PasswordRequiredError(ValueError):
+    """Raised when an encrypted PDF is opened without a password"""
+
+
+class PageRangeError(ValueError):
+    """Raised when a page range spec is malformed or out of bounds"""
+
+
+ROTATIONS = (90, 180, 270, -90)
+
+
+def parse_page_ranges(page_range, total_pages):
+    """Parse a spec like "1-5,8,10-12" into 0-indexed (start, end) ranges, end exclusive"""
+    ranges = []
+    for part in page_range.split(','):
+        part = part.strip()
+        if '-' in part:
+            try:
+                start, end = part.split('-')
+                start_page = int(start.strip()) - 1  # Convert to 0-indexed
+                end_page = int(end.strip())  # Inclusive
+            except ValueError:
+                raise PageRangeError(f"Invalid page range format: {part}")
+            if start_page < 0 or end_page > total_pages or start_page >= end_page:
+                raise PageRangeError(f"Invalid page range: {part}. Valid pages: 1-{total_pages}")
+            ranges.append((start_page, end_page))
+        else:
+            try:
+                page_num = int(part) - 1  # Convert to 0-indexed
+            except ValueError:
+                raise PageRangeError(f"Invalid page number format: {part}")
+            if page_num < 0 or page_num >= total_pages:
+                raise PageRangeError(f"Invalid page number: {part}. Valid pages: 1-{total_pages}")
+            ranges.append((page_num, page_num + 1))
+    return ranges
+
+
+def select_pages(page_range, total_pages, start=None, end=None):
+    """Sorted 0-indexed page numbers for a spec, or every page when it is empty.
+
+    Without a spec, 1-indexed inclusive start and end bound the pages
+    instead; either may be left out.
+    """
+    if not page_range or not page_range.strip():
+        if start in (None, '') and end in (None, ''):
+            return list(range(total_pages))
+        try:
+            first = int(start) if start not in (None, '') else 1
+            last = int(end) if end not in (None, '') else total_pages
+        except (TypeError, ValueError):
+            raise PageRangeError(f"Invalid start or end page: {start}, {end}")
+        if first < 1 or last > total_pages or first > last:
+            raise PageRangeError(f"Invalid page span: {first}-{last}. Valid pages: 1-{total_pages}")
+        return list(range(first - 1, last))
+    pages = set()
+    for start, end in parse_page_ranges(page_range, total_pages):
+        pages.update(range(start, end))
+    return sorted(pages)
+
+
+def parse_rotation(value, default=90):
+    """Degrees from a form value like "270", or default when it is empty"""
+    if value in (None, ''):
+        return default
+    try:
+        angle = int(str(value).strip())
+    except ValueError:
+        raise PageRangeError(f"Invalid rotation: {value}. Rotation must be 90, 180, or 270 degrees")
+    if angle not in ROTATIONS:
+        raise PageRangeError(f"Invalid rotation: {value}. Rotation must be 90, 180, or 270 degrees")
+    return angle
+
+
+def parse_rotation_spec(spec, total_pages, rotation=90):
+    """{0-indexed page: degrees} for a spec like "1-3:90,7:180".
+
+    A part without ":degrees" takes rotation; an empty spec rotates every
+    page by it. Pages not named are left as they are and a later part wins
+    over an earlier one.
+    """
+    if not spec or not spec.strip():
+        return {page_num: rotation for page_num in range(total_pages)}
+    angles = {}
+    for part in spec.split(','):
+        page_range, _, degrees = part.partition(':')
+        angle = parse_rotation(degrees.strip(), rotation)
+        for start, end in parse_page_ranges(page_range, total_pages):
+            angles.update((page_num, angle) for page_num in range(start, end))
+    return angles
+
+
+def save_edited(pdf_path, output_path, edit):
+    """Copy pdf_path to output_path and apply edit(doc) to the copy as an incremental update.
+
+    Only the objects edit changes are appended, so page rotations and
+    metadata cost time in proportion to what they touch, not to the size of
+    the document. Files MuPDF had to repair can't be updated in place and
+    get a plain save without garbage collection instead. Returns whether
+    the update was incremental.
+    """
+    shutil.copyfile(pdf_path, output_path)
+    with fitz.open(output_path) as doc:
+        if doc.needs_pass:
+            raise PasswordRequiredError("PDF is password protected. Please unlock it first.")
+        edit(doc)
+        if doc.can_save_incrementally():
+            doc.saveIncr()
+            return True
+        partial_path = output_path + '.part'
+        doc.save(partial_path)
+    os.replace(partial_path, output_path)
+    return False
+
+
+def is_colourful(pix):
+    """Whether enough of a downscaled copy of an RGB pixmap is visibly coloured"""
+    scale = min(1.0, THUMBNAIL_WIDTH / pix.width)
+    thumb = fitz.Pixmap(pix, max(1, int(pix.width * scale)), max(1, int(pix.height * scale)))
+    samples = thumb.samples
+    coloured = 0
+    for i in range(0, len(samples), 3):
+        r, g, b = samples[i], samples[i + 1], samples[i + 2]
+        if max(r, g, b) - min(r, g, b) > COLOUR_SPREAD:
+            coloured += 1
+    return coloured > COLOUR_MIN_FRACTION * thumb.width * thumb.height
+
+
+def midtone_fraction(gray_pix):
+    """Fraction of a greyscale pixmap's pixels that are neither near black nor near white"""
+    samples = gray_pix.samples
+    return samples.translate(_MIDTONES).count(1) / max(1, len(samples))
+
+
+def threshold_pixmap(gray_pix):
+    """Greyscale pixmap with every pixel forced to black or white"""
+    return fitz.Pixmap(fitz.csGRAY, gray_pix.width, gray_pix.height, gray_pix.samples.translate(_THRESHOLD), False)
+
+
+def compress_pdf_file(pdf_path, output):
+    """Rewrite a PDF with garbage collection and stream deflation"""
+    doc = fitz.open(pdf_path)
+    doc.save(output, garbage=4, deflate=True, clean=True)
+    doc.close()
+
+
+def _watermark_stamp(stamp_doc, width, height, watermark_text, opacity, angle, font_size):
+    """Add a page to stamp_doc tiled with rotated watermark text; returns its page number"""
+    stamp = stamp_doc.new_page(width=width, height=height)
+
+    text_width = fitz.get_text_length(watermark_text, fontname="helv", fontsize=font_size)
+    text_color = (0.7, 0.7, 0.7)  # Light gray
+
+    # Distance between watermark repetitions, scaled to the text so tiles never overlap
+    step_x = max(text_width, font_size) + font_size * 2
+    step_y = font_size * 4
+
+    # Cover the page diagonal so rotated rows still reach every corner
+    reach = math.hypot(width, height)
+    center = fitz.Point(width / 2, height / 2)
+    matrix = fitz.Matrix(angle)  # Positive angles read bottom-left to top-right
+
+    shape = stamp.new_shape()
+    rows = int(reach // step_y) + 1
+    cols = int(reach // step_x) + 1
+    for row in range(-rows, rows + 1):
+        # Offset alternate rows so the pattern reads as a diagonal lattice
+        shift = step_x / 2 if row % 2 else 0
+        for col in range(-cols, cols + 1):
+            pivot = center + fitz.Point(col * step_x + shift, row * step_y) * matrix
+            if not (-step_x <= pivot.x <= width + step_x and -step_y <= pivot.y <= height + step_y):
+                continue
+            shape.insert_text(
+                pivot - fitz.Point(text_width / 2, -font_size / 3),
+                watermark_text,
+                fontsize=font_size,
+                color=text_color,
+                fontname="helv",
+                morph=(pivot, matrix),
+                fill_opacity=opacity
+            )
+    shape.commit()
+    return stamp.number
+
+
+def watermark_pdf_file(pdf_path, output, watermark_text='CONFIDENTIAL', opacity=1.0, angle=45, font_size=48):
+    """Tile a rotated text watermark across every page.
+    
+    The tiled pattern is drawn once per distinct page size into a separate
+    stamp document, then placed on each page with show_pdf_page, which
+    embeds it as a Form XObject and reuses that XObject for every page of
+    the same size.
+    """
+    doc = fitz.open(pdf_path)
+
+    # Draw one stamp page per distinct page size
+    stamp_doc = fitz.open()
+    stamps = {}
+    for page in doc:
+        rect = page.rect
+        size = (round(rect.width, 2), round(rect.height, 2))
+        if size not in stamps:
+            stamps[size] = _watermark_stamp(
+                stamp_doc, rect.width, rect.height, watermark_text, opacity, angle, font_size
+            )
+    # Reopen from bytes: grafting needs a finished source document
+    stamp_doc = fitz.open("pdf", stamp_doc.tobytes())
+
+    # Add watermark to each page
+    for page in doc:
+        rect = page.rect
+        size = (round(rect.width, 2), round(rect.height, 2))
+        # Stamp under the page content, like the original per-tile drawing
+        page.show_pdf_page(rect * page.derotation_matrix, stamp_doc, stamps[size], overlay=False, rotate=page.rotation)
+
+    doc.save(output, garbage=1)
+    doc.close()
+    stamp_doc.close()
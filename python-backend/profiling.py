@@ -0,0 +1,238 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+
+from flask import g, has_app_context, jsonify, request, send_file
+
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'pdf-profiles'))
+# Requests carrying X-Profile must also send this in X-Admin-Token; unset disables the header
+PROFILE_ADMIN_TOKEN = os.getenv('PROFILE_ADMIN_TOKEN', '')
+# Fraction of requests profiled without being asked, e.g. 0.01
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+# What sampled requests record: 'cpu' (cProfile) or 'all' (cProfile and tracemalloc)
+PROFILE_SAMPLE_MODE = os.getenv('PROFILE_SAMPLE_MODE', 'cpu')
+PROFILE_MAX_COUNT = int(os.getenv('PROFILE_MAX_COUNT', 50))
+
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+
+PROFILE_MODES = ('cpu', 'all')
+
+# cProfile and tracemalloc are process-wide, so one request per process at a time
+_active = threading.Lock()
+
+_SKIP_PREFIXES = ('/api/admin/', '/api/metrics', '/api/health')
+
+
+def _requested_mode():
+    """Profile mode for this request, or None when it should not be profiled"""
+    if request.path.startswith(_SKIP_PREFIXES):
+        return None
+    header = request.headers.get('X-Profile')
+    if header and PROFILE_ADMIN_TOKEN and request.headers.get('X-Admin-Token') == PROFILE_ADMIN_TOKEN:
+        mode = header.lower()
+        return mode if mode in PROFILE_MODES else 'all'
+    if PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+        return PROFILE_SAMPLE_MODE
+    return None
+
+
+def is_profiling():
+    """Whether the current request is being profiled.
+
+    cProfile and tracemalloc only see this process, so views keep work they
+    would hand to a process pool in-process while this is true.
+    """
+    return has_app_context() and g.get('profile') is not None
+
+
+def _before_request():
+    mode = _requested_mode()
+    if not mode or not _active.acquire(blocking=False):
+        return
+    # Leave tracemalloc alone if something else (PYTHONTRACEMALLOC) started it
+    owns_tracemalloc = mode == 'all' and not tracemalloc.is_tracing()
+    if owns_tracemalloc:
+        tracemalloc.start(10)
+    profiler = cProfile.Profile()
+    g.profile = {
+        "mode": mode,
+        "profiler": profiler,
+        "owns_tracemalloc": owns_tracemalloc,
+        "start": time.perf_counter(),
+    }
+    profiler.enable()
+
+
+def _after_request(response):
+    state = g.pop('profile', None)
+    if state is None:
+        return response
+    profile_id = uuid.uuid4().hex
+    route = request.url_rule.rule if request.url_rule else request.path
+    method = request.method
+    status = response.status_code
+    response.headers['X-Profile-Id'] = profile_id
+    # Stop once the body has been sent, so streamed work is included;
+    # werkzeug skips close callbacks on passthrough (send_file) responses
+    response.direct_passthrough = False
+    response.call_on_close(lambda: _finish(state, profile_id, route, method, status))
+    return response
+
+
+def _teardown_request(exc):
+    # Only reached with a live profile when the view raised
+    state = g.pop('profile', None)
+    if state is not None:
+        route = request.url_rule.rule if request.url_rule else request.path
+        _finish(state, uuid.uuid4().hex, route, request.method, 500)
+
+
+def _finish(state, profile_id, route, method, status):
+    profiler = state["profiler"]
+    profiler.disable()
+    seconds = time.perf_counter() - state["start"]
+    allocations = None
+    peak = None
+    try:
+        if state["mode"] == 'all':
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            if state["owns_tracemalloc"]:
+                tracemalloc.stop()
+            allocations = [
+                {
+                    "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                    "size_kb": round(stat.size / 1024, 1),
+                    "count": stat.count,
+                }
+                for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]
+            ]
+        _save(profiler, profile_id, {
+            "id": profile_id,
+            "route": route,
+            "method": method,
+            "status": status,
+            "mode": state["mode"],
+            "seconds": round(seconds, 4),
+            "created": time.time(),
+            "pid": os.getpid(),
+            "peak_traced_mb": round(peak / (1024 * 1024), 1) if peak is not None else None,
+            "top_allocations": allocations,
+        })
+        print(f"Saved profile {profile_id} for {method} {route} ({seconds:.2f}s)", flush=True)
+    except Exception as e:
+        print(f"Failed to save profile {profile_id}: {e}", flush=True)
+    finally:
+        _active.release()
+
+
+def _save(profiler, profile_id, meta):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profiler.dump_stats(os.path.join(PROFILE_DIR, f'{profile_id}.prof'))
+
+    report = io.StringIO()
+    pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+    meta["top_functions"] = report.getvalue()
+
+    with open(os.path.join(PROFILE_DIR, f'{profile_id}.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+    _prune()
+
+
+def _prune():
+    """Keep only the newest PROFILE_MAX_COUNT profiles"""
+    entries = sorted(
+        (entry for entry in os.scandir(PROFILE_DIR) if entry.name.endswith('.json')),
+        key=lambda entry: entry.stat().st_mtime,
+        reverse=True
+    )
+    for entry in entries[PROFILE_MAX_COUNT:]:
+        for suffix in ('.json', '.prof'):
+            try:
+                os.unlink(os.path.join(PROFILE_DIR, entry.name[:-5] + suffix))
+            except OSError:
+                pass
+
+
+def _load_meta(profile_id):
+    # Ids are uuid4 hex; anything else can't name a profile file
+    if len(profile_id) != 32 or not all(c in '0123456789abcdef' for c in profile_id):
+        return None
+    try:
+        with open(os.path.join(PROFILE_DIR, f'{profile_id}.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _admin_denied():
+    if not PROFILE_ADMIN_TOKEN:
+        return jsonify({"error": "Profiling admin is disabled. Set PROFILE_ADMIN_TOKEN to enable it."}), 404
+    if request.headers.get('X-Admin-Token') != PROFILE_ADMIN_TOKEN:
+        return jsonify({"error": "Invalid admin token"}), 403
+    return None
+
+
+def init_app(app):
+    """Install the profiling hooks and the /api/admin/profiles endpoints.
+
+    The hooks are only installed when profiling can trigger, i.e. an admin
+    token or a sample rate is configured; otherwise requests pay nothing.
+    """
+    if PROFILE_ADMIN_TOKEN or PROFILE_SAMPLE_RATE:
+        app.before_request(_before_request)
+        app.after_request(_after_request)
+        app.teardown_request(_teardown_request)
+
+    @app.route('/api/admin/profiles', methods=['GET'])
+    def list_profiles():
+        """Saved profiles, newest first"""
+        denied = _admin_denied()
+        if denied:
+            return denied
+        profiles = []
+        if os.path.isdir(PROFILE_DIR):
+            for name in os.listdir(PROFILE_DIR):
+                if name.endswith('.json'):
+                    meta = _load_meta(name[:-5])
+                    if meta:
+                        meta.pop('top_functions', None)
+                        meta.pop('top_allocations', None)
+                        profiles.append(meta)
+        profiles.sort(key=lambda meta: meta['created'], reverse=True)
+        return jsonify({"profiles": profiles})
+
+    @app.route('/api/admin/profiles/<profile_id>', methods=['GET'])
+    def get_profile(profile_id):
+        """Summary of one profile: top functions by cumulative time and top allocation sites"""
+        denied = _admin_denied()
+        if denied:
+            return denied
+        meta = _load_meta(profile_id)
+        if not meta:
+            return jsonify({"error": "Profile not found"}), 404
+        return jsonify(meta)
+
+    @app.route('/api/admin/profiles/<profile_id>/download', methods=['GET'])
+    def download_profile(profile_id):
+        """Raw cProfile stats, loadable with pstats or snakeviz"""
+        denied = _admin_denied()
+        if denied:
+            return denied
+        if not _load_meta(profile_id):
+            return jsonify({"error": "Profile not found"}), 404
+        return send_file(
+            os.path.join(PROFILE_DIR, f'{profile_id}.prof'),
+            mimetype='application/octet-stream',
+            as_attachment=True,
+            download_name=f'{profile_id}.prof'
+        )
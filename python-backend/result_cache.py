@@ -0,0 +1,211 @@
+import functools
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+from flask import request, send_file, make_response
+
+CACHE_DIR = os.getenv('RESULT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'pdf-result-cache'))
+CACHE_MAX_BYTES = int(os.getenv('RESULT_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+CACHE_ENABLED = os.getenv('RESULT_CACHE_ENABLED', '1') not in ('0', 'false', 'False', '')
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class ResultCache:
+    """Disk-backed LRU cache of endpoint outputs keyed by upload content"""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, key)
+        return base + '.bin', base + '.json'
+
+    def make_key(self, endpoint, files, params, include_filenames=False):
+        """Hash uploaded bytes, endpoint name and request parameters into a key.
+
+        Upload filenames only count when include_filenames is set, so the same
+        bytes uploaded under another name are still a hit.
+        """
+        digest = hashlib.sha256()
+        digest.update(endpoint.encode())
+        for file in files:
+            digest.update(b'\0file\0')
+            if include_filenames:
+                digest.update((file.filename or '').encode())
+            file.stream.seek(0)
+            while True:
+                chunk = file.stream.read(HASH_CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+            file.stream.seek(0)
+        for name in sorted(params):
+            digest.update(f'\0{name}={params[name]}'.encode())
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Return (data_path, meta) for a cached entry, or None"""
+        data_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            # Touch the entry so eviction treats it as recently used
+            os.utime(data_path, None)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data_path, meta
+
+    def open_writer(self):
+        """Return a temp file to write a new entry into before commit()"""
+        return tempfile.NamedTemporaryFile(dir=self.directory, suffix='.tmp', delete=False)
+
+    def commit(self, key, temp_path, meta):
+        data_path, meta_path = self._paths(key)
+        os.replace(temp_path, data_path)
+        meta_tmp = meta_path + '.tmp'
+        with open(meta_tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(meta_tmp, meta_path)
+        self.evict()
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.bin'):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name[:-4]))
+        return entries
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits its size cap"""
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return
+        for _, size, key in sorted(entries):
+            for path in self._paths(key):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def stats(self):
+        entries = self._entries()
+        return {
+            "enabled": CACHE_ENABLED,
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+        }
+
+
+cache = ResultCache(CACHE_DIR, CACHE_MAX_BYTES)
+
+
+def _tee_to_cache(body, key, meta):
+    """Yield response chunks while copying them into a new cache entry"""
+    writer = cache.open_writer()
+    completed = False
+    try:
+        for chunk in body:
+            if isinstance(chunk, str):
+                # Streamed text bodies; werkzeug encodes these the same way
+                chunk = chunk.encode('utf-8')
+            writer.write(chunk)
+            yield chunk
+        completed = True
+    finally:
+        writer.close()
+        if hasattr(body, 'close'):
+            body.close()
+        if completed:
+            try:
+                cache.commit(key, writer.name, meta)
+            except OSError as e:
+                print(f"Result cache write failed: {e}", flush=True)
+                completed = False
+        if not completed and os.path.exists(writer.name):
+            os.unlink(writer.name)
+
+
+def cached_result(*param_names, filenames=False):
+    """Serve repeat requests for an endpoint from the result cache.
+
+    The key covers the uploaded bytes, the endpoint and the listed
+    parameters, both as form fields and as query arguments since views read
+    some (mode, engine) from either. Pass filenames=True for endpoints whose
+    output depends on upload names. Only successful responses are stored.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            files = [f for name in request.files for f in request.files.getlist(name)]
+            if not CACHE_ENABLED or not files:
+                return view(*args, **kwargs)
+
+            params = {name: request.form.get(name, '') for name in param_names}
+            params.update((f'?{name}', request.args.get(name, '')) for name in param_names)
+            key = cache.make_key(request.endpoint, files, params, include_filenames=filenames)
+            entry = cache.get(key)
+            if entry:
+                data_path, meta = entry
+                response = send_file(
+                    data_path,
+                    mimetype=meta['mimetype'],
+                    as_attachment=meta['download_name'] is not None,
+                    download_name=meta['download_name'],
+                    conditional=False
+                )
+                if meta['download_name'] is None:
+                    response.headers.pop('Content-Disposition', None)
+                response.headers.update(meta.get('headers', {}))
+                response.headers['X-Cache'] = 'HIT'
+                return response
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                meta = {
+                    "mimetype": response.mimetype,
+                    "download_name": _download_name(response),
+                    # Reports endpoints attach alongside the file, e.g. X-Compression-Report
+                    "headers": {
+                        name: value for name, value in response.headers.items()
+                        if name.startswith('X-') and name != 'X-Cache'
+                    },
+                }
+                response.response = _tee_to_cache(response.response, key, meta)
+                response.direct_passthrough = False
+            response.headers['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
+
+
+def _download_name(response):
+    disposition = response.headers.get('Content-Disposition', '')
+    if 'filename=' not in disposition:
+        return None
+    return disposition.split('filename=', 1)[1].split(';', 1)[0].strip().strip('"')
+
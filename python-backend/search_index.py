@@ -0,0 +1,290 @@
+import atexit
+import hashlib
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+import time
+
+SEARCH_INDEX_DIR = os.getenv('SEARCH_INDEX_DIR', os.path.join(tempfile.gettempdir(), 'pdf-search-index'))
+SEARCH_INDEX_DB = os.path.join(SEARCH_INDEX_DIR, 'search.sqlite3')
+# Off by default: the index keeps the text of every document it sees
+SEARCH_INDEX_ENABLED = os.getenv('SEARCH_INDEX_ENABLED', '0') not in ('0', 'false', 'False', '')
+SEARCH_INDEX_BATCH_DOCS = int(os.getenv('SEARCH_INDEX_BATCH_DOCS', 32))
+SEARCH_INDEX_FLUSH_SECONDS = float(os.getenv('SEARCH_INDEX_FLUSH_SECONDS', 1.0))
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Text that did not come from a single page, e.g. whole-file OCR
+WHOLE_DOCUMENT = 0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    hash TEXT PRIMARY KEY,
+    filename TEXT,
+    page_count INTEGER,
+    indexed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    id INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    source TEXT NOT NULL,
+    text TEXT NOT NULL,
+    UNIQUE (hash, page, source)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts USING fts5(
+    text, content='pages', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS pages_ai AFTER INSERT ON pages BEGIN
+    INSERT INTO pages_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS pages_ad AFTER DELETE ON pages BEGIN
+    INSERT INTO pages_fts (pages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+CREATE TRIGGER IF NOT EXISTS pages_au AFTER UPDATE ON pages BEGIN
+    INSERT INTO pages_fts (pages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    INSERT INTO pages_fts (rowid, text) VALUES (new.id, new.text);
+END;
+"""
+
+
+class SearchQueryError(ValueError):
+    """Raised when a search query is empty or not valid FTS5 syntax"""
+
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+_local = threading.local()
+
+
+def _reset_after_fork():
+    # The lock may have been held by a thread that doesn't exist in the child
+    global _schema_lock
+    _schema_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _open():
+    conn = sqlite3.connect(SEARCH_INDEX_DB, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _ensure_schema():
+    """Create the tables once per process; WAL mode is stored in the file itself"""
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if _schema_ready:
+            return
+        os.makedirs(SEARCH_INDEX_DIR, exist_ok=True)
+        conn = _open()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+        finally:
+            conn.close()
+        _schema_ready = True
+
+
+def _connect():
+    """This thread's connection to the index, kept open for its later calls"""
+    _ensure_schema()
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.pid != os.getpid():
+        # A connection inherited through fork must not be used in the child
+        conn = _open()
+        _local.conn = conn
+        _local.pid = os.getpid()
+    return conn
+
+
+def content_hash(file):
+    """SHA-256 of an upload's bytes, leaving the stream rewound"""
+    digest = hashlib.sha256()
+    file.stream.seek(0)
+    while True:
+        chunk = file.stream.read(HASH_CHUNK_SIZE)
+        if not chunk:
+            break
+        digest.update(chunk)
+    file.stream.seek(0)
+    return digest.hexdigest()
+
+
+class IndexWriter:
+    """Background thread that writes queued documents in batched transactions.
+
+    Requests only pay for a queue put; the thread takes up to
+    SEARCH_INDEX_BATCH_DOCS documents, or whatever arrived within
+    SEARCH_INDEX_FLUSH_SECONDS of the first, and commits them together.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Threads don't survive a fork, so each server worker starts its own
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = None
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='search-index-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, document):
+        self._ensure_thread()
+        self._queue.put(document)
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + SEARCH_INDEX_FLUSH_SECONDS
+        while len(batch) < SEARCH_INDEX_BATCH_DOCS:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                _write_batch(batch)
+            except sqlite3.Error as e:
+                print(f"Search index write failed: {e}", flush=True)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def flush(self):
+        """Block until every queued document has been written"""
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            self._queue.join()
+
+
+def _write_batch(batch):
+    conn = _connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for doc_hash, filename, page_count, source, pages in batch:
+            conn.execute(
+                "INSERT INTO documents (hash, filename, page_count, indexed_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (hash) DO UPDATE SET filename = excluded.filename, "
+                "page_count = COALESCE(excluded.page_count, documents.page_count), "
+                "indexed_at = excluded.indexed_at",
+                (doc_hash, filename, page_count, time.time())
+            )
+            conn.executemany(
+                "INSERT INTO pages (hash, page, source, text) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (hash, page, source) DO UPDATE SET text = excluded.text "
+                "WHERE text != excluded.text",
+                [(doc_hash, page, source, text) for page, text in pages]
+            )
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+
+_writer = IndexWriter()
+atexit.register(_writer.flush)
+
+
+def _fts5_available():
+    try:
+        _ensure_schema()
+        return True
+    except sqlite3.Error as e:
+        print(f"Search index disabled: {e}", flush=True)
+        return False
+
+
+if SEARCH_INDEX_ENABLED:
+    SEARCH_INDEX_ENABLED = _fts5_available()
+
+
+def index_document(doc_hash, filename, source, pages, page_count=None):
+    """Queue per-page text of a document for indexing.
+
+    pages is an iterable of (1-based page number, text); use WHOLE_DOCUMENT
+    as the page number for text that spans the file. Does nothing when the
+    index is disabled.
+    """
+    if not SEARCH_INDEX_ENABLED:
+        return
+    pages = [(page, text) for page, text in pages if text and text.strip()]
+    if pages:
+        _writer.submit((doc_hash, filename, page_count, source, pages))
+
+
+def flush():
+    _writer.flush()
+
+
+def _match_expression(query, syntax):
+    if syntax == 'fts':
+        return query
+    # Plain queries: every term must appear, punctuation is not FTS5 syntax
+    terms = query.split()
+    return ' '.join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def search(query, limit=20, offset=0, doc_hash=None, syntax='plain'):
+    """Ranked page matches for a query, best first, with highlighted snippets"""
+    if not query or not query.strip():
+        raise SearchQueryError("Search query is empty")
+    sql = (
+        "SELECT pages.hash, pages.page, pages.source, documents.filename, documents.page_count, "
+        "bm25(pages_fts) AS rank, "
+        "snippet(pages_fts, 0, '[', ']', '…', 16) AS snippet "
+        "FROM pages_fts "
+        "JOIN pages ON pages.id = pages_fts.rowid "
+        "JOIN documents ON documents.hash = pages.hash "
+        "WHERE pages_fts MATCH ?"
+    )
+    params = [_match_expression(query, syntax)]
+    if doc_hash:
+        sql += " AND pages.hash = ?"
+        params.append(doc_hash)
+    sql += " ORDER BY rank LIMIT ? OFFSET ?"
+    params += [limit, offset]
+
+    try:
+        rows = _connect().execute(sql, params).fetchall()
+    except sqlite3.OperationalError as e:
+        raise SearchQueryError(f"Invalid search query: {e}")
+    return [
+        {
+            "hash": row['hash'],
+            "filename": row['filename'],
+            "page": row['page'] or None,
+            "page_count": row['page_count'],
+            "source": row['source'],
+            "score": round(-row['rank'], 4),
+            "snippet": row['snippet'],
+        }
+        for row in rows
+    ]
+
+
+def stats():
+    if not SEARCH_INDEX_ENABLED:
+        return {"enabled": False}
+    conn = _connect()
+    documents = conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+    pages = conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+    return {"enabled": True, "documents": documents, "pages": pages, "pending": _writer._queue.qsize()}
@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+import zipfile
+
+import offload
+from engines import get_engine_by_name
+from zipstream import ZipSink, write_bytes_entry, write_file_entry
+
+# Shares a large split is cut into, run in the shared offload pool
+SPLIT_WORKERS = int(os.getenv('SPLIT_WORKERS', offload.OFFLOAD_WORKERS))
+# Below this many parts the fork and IPC overhead outweighs parallel writing
+SPLIT_PARALLEL_MIN_PARTS = int(os.getenv('SPLIT_PARALLEL_MIN_PARTS', 32))
+
+def every_n_ranges(total_pages, every):
+    """0-indexed (start, end) ranges of `every` pages; every=1 is one file per page"""
+    return [(start, min(start + every, total_pages)) for start in range(0, total_pages, every)]
+
+
+def part_name(start, end):
+    # Create filename for this split
+    if start == end - 1:
+        return f'split_page_{start + 1}.pdf'
+    return f'split_pages_{start + 1}-{end}.pdf'
+
+
+def _write_parts(engine_name, pdf_path, parts, out_dir):
+    """Pool worker: open the source once and write each (index, start, end) part to out_dir"""
+    engine = get_engine_by_name(engine_name)
+    src = engine.open(pdf_path)
+    try:
+        for idx, start, end in parts:
+            with open(os.path.join(out_dir, f'{idx:06d}.pdf'), 'wb') as f:
+                f.write(engine.split_part(src, start, end))
+    finally:
+        engine.close(src)
+    return len(parts)
+
+
+def stream_split_zip(pdf_path, ranges, engine, compress_type=zipfile.ZIP_STORED, parallel=True):
+    """Split a PDF into the given ranges and stream the parts as a ZIP.
+
+    Few parts are cut from a single parse of the source straight into ZIP
+    entries. Many parts are written in parallel, each pool worker parsing
+    the source once for its share, and added to the ZIP in range order as
+    each share completes. With parallel=False every part is cut in this
+    process. The source file is removed when streaming ends.
+    """
+    sink = ZipSink()
+    out_dir = None
+    try:
+        with zipfile.ZipFile(sink, 'w') as zf:
+            if not parallel or len(ranges) < SPLIT_PARALLEL_MIN_PARTS or SPLIT_WORKERS <= 1:
+                src = engine.open(pdf_path)
+                try:
+                    for start, end in ranges:
+                        data = engine.split_part(src, start, end)
+                        yield from write_bytes_entry(zf, sink, part_name(start, end), data, compress_type)
+                finally:
+                    engine.close(src)
+            else:
+                out_dir = tempfile.mkdtemp(prefix='split-')
+                parts = [(idx, start, end) for idx, (start, end) in enumerate(ranges)]
+                share = -(-len(parts) // SPLIT_WORKERS)
+                groups = [parts[i:i + share] for i in range(0, len(parts), share)]
+                futures = [offload.submit(_write_parts, engine.name, pdf_path, group, out_dir) for group in groups]
+                for group, future in zip(groups, futures):
+                    future.result()
+                    for idx, start, end in group:
+                        path = os.path.join(out_dir, f'{idx:06d}.pdf')
+                        yield from write_file_entry(zf, sink, part_name(start, end), path, compress_type)
+                        os.unlink(path)
+        yield sink.drain()
+    finally:
+        if out_dir:
+            shutil.rmtree(out_dir, ignore_errors=True)
+        try:
+            os.unlink(pdf_path)
+        except OSError:
+            pass
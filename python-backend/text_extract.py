@@ -0,0 +1,84 @@
+import json
+import os
+
+import offload
+from lazy_imports import optional_module
+
+fitz, HAS_PYMUPDF = optional_module('fitz')  # PyMuPDF
+
+TEXT_CHUNK_PAGES = int(os.getenv('TEXT_CHUNK_PAGES', 8))
+# Set to 1 to extract in the request thread instead of the shared offload pool
+TEXT_WORKERS = int(os.getenv('TEXT_WORKERS', offload.OFFLOAD_WORKERS))
+
+# What each NDJSON page object carries
+TEXT_MODES = ('text', 'words', 'blocks')
+
+def _round_box(values):
+    return [round(v, 2) for v in values]
+
+
+def _page_object(page, mode):
+    """JSON-ready text of one page in the requested mode"""
+    result = {"page": page.number + 1}
+    if mode == 'text':
+        result["text"] = page.get_text()
+    elif mode == 'words':
+        # [x0, y0, x1, y1, word, block_no, line_no, word_no]
+        result["width"], result["height"] = round(page.rect.width, 2), round(page.rect.height, 2)
+        result["words"] = [
+            _round_box(word[:4]) + [word[4], word[5], word[6], word[7]]
+            for word in page.get_text('words')
+        ]
+    else:
+        result["width"], result["height"] = round(page.rect.width, 2), round(page.rect.height, 2)
+        result["blocks"] = [
+            {
+                "bbox": _round_box(block[:4]),
+                "type": 'image' if block[6] else 'text',
+                "text": block[4] if not block[6] else '',
+            }
+            for block in page.get_text('blocks')
+        ]
+    return result
+
+
+def _extract_pages(pdf_path, page_numbers, mode):
+    """Pool worker: one NDJSON line per page, serialised here to keep IPC to one string per page"""
+    lines = []
+    with fitz.open(pdf_path) as doc:
+        for page_num in page_numbers:
+            try:
+                result = _page_object(doc[page_num], mode)
+            except Exception as e:
+                # One unreadable page should not end the stream
+                result = {"page": page_num + 1, "error": str(e)}
+            lines.append(json.dumps(result, ensure_ascii=False) + '\n')
+    return lines
+
+
+def stream_page_text(pdf_path, page_numbers, mode='text', parallel=True):
+    """Yield NDJSON text, one object per page in page order.
+
+    Pages are split into chunks of TEXT_CHUNK_PAGES that run in parallel
+    in the shared offload pool; each chunk is sent as soon as it and every chunk
+    before it have finished.
+    """
+    if mode not in TEXT_MODES:
+        raise ValueError(f"Unsupported text mode: {mode}")
+    chunks = [page_numbers[i:i + TEXT_CHUNK_PAGES] for i in range(0, len(page_numbers), TEXT_CHUNK_PAGES)]
+    parallel = parallel and len(chunks) > 1 and TEXT_WORKERS > 1
+
+    if not parallel:
+        pending = (_extract_pages(pdf_path, chunk, mode) for chunk in chunks)
+    else:
+        futures = [offload.submit(_extract_pages, pdf_path, chunk, mode) for chunk in chunks]
+        pending = (future.result() for future in futures)
+
+    try:
+        for lines in pending:
+            yield ''.join(lines)
+    finally:
+        if parallel:
+            # Client went away: don't keep extracting pages nobody will read
+            for future in futures:
+                future.cancel()
@@ -0,0 +1,158 @@
+import io
+import os
+import shutil
+import tempfile
+
+from flask import Request, jsonify, request
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.utils import secure_filename
+
+MB = 1024 * 1024
+
+UPLOAD_DIR = os.getenv('UPLOAD_DIR', os.path.join(tempfile.gettempdir(), 'pdf-uploads'))
+# Request bodies up to this size are parsed into memory; larger ones stream straight to UPLOAD_DIR
+UPLOAD_MEMORY_BYTES = int(os.getenv('UPLOAD_MEMORY_BYTES', 1 * MB))
+# Body limit for endpoints without their own; UPLOAD_MAX_BYTES_<ENDPOINT> overrides one endpoint
+UPLOAD_MAX_BYTES = int(os.getenv('UPLOAD_MAX_BYTES', 100 * MB))
+
+# endpoint -> default body limit where UPLOAD_MAX_BYTES doesn't fit
+ENDPOINT_LIMITS = {
+    'merge_pdfs': 500 * MB,
+    'batch_process': 500 * MB,
+    'pdf_info_batch': 500 * MB,
+    # Every image-only page goes to the model; keep single OCR requests bounded
+    'ocr_gemini': 50 * MB,
+}
+
+_limits = {}
+
+
+class UploadRequest(Request):
+    """Request that spools large file parts into UPLOAD_DIR under a real path.
+
+    Werkzeug's default keeps large parts in anonymous temp files, so every
+    handler had to copy them out again before an engine could open them.
+    Spooled files are removed when the request closes unless a handler
+    claims them.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if total_content_length is not None and total_content_length <= UPLOAD_MEMORY_BYTES:
+            return io.BytesIO()
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        spool = tempfile.NamedTemporaryFile(
+            dir=UPLOAD_DIR, prefix='upload-', suffix=_suffix(filename), delete=False
+        )
+        self.__dict__.setdefault('spooled_paths', set()).add(spool.name)
+        return spool
+
+    def close(self):
+        super().close()
+        for path in self.__dict__.pop('spooled_paths', ()):
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+
+def _suffix(filename):
+    # Keeps the extension so mimetypes can still tell images from PDFs
+    return os.path.splitext(secure_filename(filename or ''))[1].lower()
+
+
+def _spooled_path(file):
+    """Path of an upload already on disk in UPLOAD_DIR, or None if it was parsed into memory"""
+    path = getattr(file.stream, 'name', None)
+    if isinstance(path, str) and path in request.__dict__.get('spooled_paths', ()):
+        file.stream.flush()
+        return path
+    return None
+
+
+def path(file):
+    """Path of an upload on disk, removed when the request ends.
+
+    Large uploads are already there and are not copied; small ones are
+    written out once. Use claim() when the file must outlive the request,
+    e.g. for a streamed response.
+    """
+    spooled = _spooled_path(file)
+    if spooled:
+        return spooled
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    fd, spooled = tempfile.mkstemp(dir=UPLOAD_DIR, prefix='upload-', suffix=_suffix(file.filename))
+    os.close(fd)
+    request.__dict__.setdefault('spooled_paths', set()).add(spooled)
+    _write(file, spooled)
+    return spooled
+
+
+def claim(file, dest=None):
+    """Path of an upload on disk that the caller now owns and must remove.
+
+    A spooled upload is handed over as it is, or renamed to dest, without
+    copying its bytes.
+    """
+    spooled = _spooled_path(file)
+    if spooled:
+        request.__dict__['spooled_paths'].discard(spooled)
+        if dest is None:
+            return spooled
+        shutil.move(spooled, dest)
+        return dest
+    if dest is None:
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        fd, dest = tempfile.mkstemp(dir=UPLOAD_DIR, prefix='upload-', suffix=_suffix(file.filename))
+        os.close(fd)
+    _write(file, dest)
+    return dest
+
+
+def _write(file, dest):
+    file.stream.seek(0)
+    with open(dest, 'wb') as f:
+        shutil.copyfileobj(file.stream, f)
+    file.stream.seek(0)
+
+
+def limit_for(endpoint):
+    return _limits.get(endpoint, UPLOAD_MAX_BYTES)
+
+
+def _too_large(limit):
+    return jsonify({
+        "error": f"Upload too large. The limit for this endpoint is {round(limit / MB, 1):g} MB.",
+        "max_bytes": limit
+    }), 413
+
+
+def _before_request():
+    limit = limit_for(request.endpoint)
+    request.max_content_length = limit
+    if request.content_length is not None and request.content_length > limit:
+        # Refuse on the header alone, before any of the body is read
+        return _too_large(limit)
+    if request.mimetype == 'multipart/form-data':
+        try:
+            # Parse here so a chunked body over the limit is refused as JSON, not inside a view
+            request.files
+        except RequestEntityTooLarge:
+            return _too_large(limit)
+
+
+def init_app(app):
+    """Install the upload request class, per-endpoint body limits and the 413 handler.
+
+    Call after every route is registered so each endpoint gets its limit.
+    """
+    app.request_class = UploadRequest
+    for endpoint in app.view_functions:
+        env_name = f'UPLOAD_MAX_BYTES_{endpoint.upper()}'
+        _limits[endpoint] = int(os.getenv(env_name, ENDPOINT_LIMITS.get(endpoint, UPLOAD_MAX_BYTES)))
+    # Ceiling for anything that slips past the per-endpoint check
+    app.config['MAX_CONTENT_LENGTH'] = max([UPLOAD_MAX_BYTES, *_limits.values()])
+    app.before_request(_before_request)
+
+    @app.errorhandler(RequestEntityTooLarge)
+    def upload_too_large(e):
+        return _too_large(limit_for(request.endpoint))
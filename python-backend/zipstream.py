@@ -0,0 +1,60 @@
+import os
+import time
+import zipfile
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Formats that are already compressed gain nothing from deflate
+STORED_EXTENSIONS = {'.pdf', '.docx', '.xlsx', '.png', '.jpg', '.jpeg'}
+
+
+class ZipSink:
+    """Write-only file object that hands ZIP bytes to a generator as they are produced"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _zip_info(arcname, size, compress_type):
+    zinfo = zipfile.ZipInfo(arcname, date_time=time.localtime()[:6])
+    zinfo.file_size = size
+    if compress_type is None:
+        if os.path.splitext(arcname)[1].lower() in STORED_EXTENSIONS:
+            compress_type = zipfile.ZIP_STORED
+        else:
+            compress_type = zipfile.ZIP_DEFLATED
+    zinfo.compress_type = compress_type
+    return zinfo
+
+
+def write_file_entry(zf, sink, arcname, path, compress_type=None):
+    """Copy a file into the archive, yielding ZIP bytes chunk by chunk"""
+    zinfo = _zip_info(arcname, os.path.getsize(path), compress_type)
+    with open(path, 'rb') as src, zf.open(zinfo, 'w') as dest:
+        while True:
+            chunk = src.read(COPY_CHUNK_SIZE)
+            if not chunk:
+                break
+            dest.write(chunk)
+            yield sink.drain()
+
+
+def write_bytes_entry(zf, sink, arcname, data, compress_type=None):
+    """Add in-memory bytes to the archive, yielding the ZIP bytes produced"""
+    zinfo = _zip_info(arcname, len(data), compress_type)
+    with zf.open(zinfo, 'w') as dest:
+        for offset in range(0, len(data), COPY_CHUNK_SIZE):
+            dest.write(data[offset:offset + COPY_CHUNK_SIZE])
+            yield sink.drain()